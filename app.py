@@ -1,7 +1,5 @@
 import streamlit as st
 import pandas as pd
-import openpyxl
-from openai import OpenAI
 import requests
 import json
 import os
@@ -14,11 +12,30 @@ from streamlit_folium import folium_static
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from PIL import Image as PilImage
-import pdfplumber
 import random
 import plotly.express as px
-from scipy.interpolate import griddata
 import numpy as np
+from ingest import load_workbook, file_hash, CACHE_DIR
+from assay_stats import compute_assay_stats, detect_assay_columns
+from blm import BLM_QUERY_URL, QUERY_CACHE_DIR, ClaimHarvester, ClaimPages, QueryCache, build_where
+from claims_store import ClaimStore
+from bulletin import BULLETIN_DIR, BULLETIN_URL, PGM_MODELS, REE_MODELS, load_bulletin, is_cached as bulletin_cached
+from commodities import classify_sites, classify_uploaded, commodity_flags
+from proximity import DEFAULT_CLAIM_RADIUS_KM, build_claim_index, join_samples, summarize_proximity
+from mrds import MRDS_CSV_URL, MRDS_DIR, MRDSIndex, build_store, download_csv, store_info
+from geo import grid_bins, hex_bins, auto_bin_size, DEFAULT_MAX_FEATURES
+from export import EXPORT_FORMATS, COMPRESSIONS, export_bytes, export_to_path, file_name, mime_type
+from pdf_text import extract_pdf, read_cached_pdf
+from llm import (PROVIDER_LABELS, RESPONSE_CACHE_MAX_BYTES, ResponseCache, StreamStats, default_router, stream_all,
+                 stream_complete, summarize_chunks)
+from retrieval import (DEFAULT_TOP_K, bulletin_chunks, embeddings_available, fingerprint, load_or_build, mrds_chunks,
+                       pdf_chunks)
+from prompts import (build_data_prompt, chunk_summary_prompt, combine_summaries_prompt, estimate_tokens, workbook_chunks,
+                     DEFAULT_TOKEN_BUDGET)
+from estimation import (IDWEstimator, lonlat_to_km, km_to_lonlat, BlockGrid, drillhole_samples, run_block_model,
+                        VARIOGRAM_MODELS, experimental_variogram, fit_variogram, OrdinaryKriging)
+import hashlib
+import pyarrow.parquet as pq
 
 # ========================================
 # App Configuration
@@ -26,6 +43,39 @@ import numpy as np
 st.set_page_config(page_title="Mining Data Analysis Portal", layout="wide")
 st.title("Mining Data Analysis Portal - Enhanced with USGS, BLM, Compliance & ESG Tools")
 
+# ========================================
+# Data Export Controls
+# ========================================
+# Format/compression pickers and a download button whose file is generated
+# chunk by chunk only when clicked, never on ordinary reruns
+def export_controls(label, source, base_name, key, columns=None):
+    col_fmt, col_comp, col_dl = st.columns([1, 1, 2])
+    with col_fmt:
+        fmt = st.selectbox("Format", EXPORT_FORMATS, key=f"{key}_format")
+    with col_comp:
+        compression = st.selectbox("Compression", COMPRESSIONS[fmt], key=f"{key}_compression")
+    with col_dl:
+        st.download_button(
+            label=f"📥 {label} ({fmt})",
+            data=lambda: export_bytes(source, fmt, compression, base_name=base_name, columns=columns),
+            file_name=file_name(base_name, fmt, compression),
+            mime=mime_type(fmt, compression),
+            key=f"{key}_download"
+        )
+    return fmt, compression
+
+# ========================================
+# Commodity Flags
+# ========================================
+# PGM/REE/critical-mineral flags are kept per data source (MRDS query,
+# uploaded file) and combined into the pgm_present/ree_present flags read by
+# the analyst report and PDF
+def set_commodity_flags(source, flags, evidence=""):
+    st.session_state.setdefault('commodity_flags', {})[source] = flags
+    st.session_state.setdefault('commodity_evidence', {})[source] = evidence
+    for key in flags:
+        st.session_state[key] = any(f.get(key, False) for f in st.session_state['commodity_flags'].values())
+
 # ========================================
 # Mineral Areas Database
 # ========================================
@@ -161,6 +211,109 @@ st.header("Colorado Plateau Overview")
 st.write("**Description:** The Colorado Plateau is a physiographic province covering parts of Arizona, Utah, Colorado, and New Mexico. Known for iconic landmarks like the Grand Canyon, Zion, Arches, and Bryce Canyon National Parks.")
 st.write("**Geology:** Largely made up of high desert with scattered forests, characterized by flat-lying sedimentary rocks sculpted into mesas, buttes, canyons, and badlands. Stable crustal block, uplifted ~8,500 feet without significant deformation.")
 
+# MRDS indexes are shared by the area query and the sample proximity join
+@st.cache_resource(show_spinner="Indexing MRDS sites...")
+def get_mrds_index(built_at):
+    return MRDSIndex.load(MRDS_DIR)
+
+# The bulletin is downloaded and extracted once; afterwards only the
+# indexed PGM/REE model sections are read from the local cache
+@st.cache_resource(show_spinner="Extracting USGS Bulletin 1693 (first use only)...")
+def get_bulletin():
+    return load_bulletin(BULLETIN_URL, BULLETIN_DIR)
+
+# Retrieval index over the cached bulletin, the extracted report PDF and the
+# MRDS sites of the last area query; it is rebuilt (or reloaded from disk)
+# only when one of those sources changes
+@st.cache_resource(show_spinner="Indexing source documents...", max_entries=4)
+def get_retrieval_index(key, embed, _chunk_makers):
+    return load_or_build(key, lambda: [chunk for make in _chunk_makers for chunk in make()], embed=embed)
+
+def source_excerpts(query, sources=None, max_chars=6000):
+    # Top-k indexed passages for an AI prompt ("" when nothing is indexed)
+    makers, parts = [], []
+    if bulletin_cached():
+        bulletin = get_bulletin()
+        makers.append(lambda: bulletin_chunks(bulletin))
+        parts.append(f"bulletin:{len(bulletin.pages)}")
+    report_doc = st.session_state.get('report_doc')
+    if report_doc is not None:
+        makers.append(lambda: pdf_chunks(report_doc))
+        parts.append(f"report:{report_doc.digest}")
+    mrds_sites = st.session_state.get('usgs_df')
+    if mrds_sites is not None and not mrds_sites.empty:
+        makers.append(lambda: mrds_chunks(mrds_sites))
+        parts.append(f"mrds:{st.session_state.get('usgs_query_key')}")
+    if not makers:
+        return ""
+    index = get_retrieval_index(fingerprint(*parts), st.session_state.get('use_embeddings', False), makers)
+    k = st.session_state.get('retrieval_k', DEFAULT_TOP_K)
+    # One-line MRDS site records would otherwise crowd out the document passages
+    return index.context(query, k, max_chars, sources, per_source=max(1, (k + 1) // 2) if len(makers) > 1 else None)
+
+# AI responses are cached on disk per request and dataset, so re-rendering a
+# report for the same area and data costs no tokens. The instance is shared
+# by all sessions and keyed on its size limit, so one session's setting does
+# not reconfigure another's cache.
+@st.cache_resource(max_entries=4)
+def get_response_cache(max_bytes=RESPONSE_CACHE_MAX_BYTES):
+    return ResponseCache(max_bytes=max_bytes)
+
+def ai_response_cache():
+    return get_response_cache(st.session_state.get('ai_cache_max_mb', RESPONSE_CACHE_MAX_BYTES // (1024 * 1024)) * 1024 * 1024)
+
+def ai_request_options():
+    # Provider route and cache arguments for the llm request functions; the
+    # dataset key covers the data a prompt draws on beyond its own text
+    report_doc = st.session_state.get('report_doc')
+    dataset = fingerprint(st.session_state.get('workbook_digest', ""), report_doc.digest if report_doc else "",
+                          st.session_state.get('usgs_query_key', ""))
+    return {'provider': st.session_state.get('ai_provider', "openai"), 'fallback': st.session_state.get('ai_fallback', True),
+            'cache': ai_response_cache(), 'dataset': dataset, 'refresh': st.session_state.get('refresh_ai_responses', False)}
+
+def record_ai_timing(label, stats):
+    st.session_state.setdefault('ai_timings', []).append({'request': label, **stats.record()})
+
+def write_ai_stream(label, prompt, max_tokens, temperature=None):
+    # Streams a completion into the page as it is generated, records time to
+    # first token and throughput, and returns the full text
+    stats = StreamStats()
+    text = st.write_stream(stream_complete(prompt, max_tokens=max_tokens, temperature=temperature, stats=stats,
+                                           **ai_request_options()))
+    st.caption(stats.summary())
+    record_ai_timing(label, stats)
+    return text
+
+def grounded_prompt(prompt, query, sources=None):
+    excerpts = source_excerpts(query, sources)
+    if not excerpts:
+        return prompt
+    return f"{prompt}\n\nBase the answer on these relevant source excerpts where applicable:\n{excerpts}"
+
+ai_router = default_router()
+with st.expander("AI Providers"):
+    st.selectbox("AI Provider", list(ai_router.providers), key='ai_provider',
+                 format_func=lambda name: PROVIDER_LABELS.get(name, name) + ("" if ai_router.providers[name].available() else " (no API key)"))
+    st.checkbox("Fall back to other providers when the selected one fails or times out", value=True, key='ai_fallback')
+    st.dataframe(pd.DataFrame(ai_router.stats()))
+
+with st.expander("AI Response Cache and Timings"):
+    ai_cache_col1, ai_cache_col2 = st.columns(2)
+    with ai_cache_col1:
+        st.number_input("Cache Size Limit (MB)", min_value=16, max_value=4096, value=RESPONSE_CACHE_MAX_BYTES // (1024 * 1024),
+                        key='ai_cache_max_mb')
+    with ai_cache_col2:
+        st.checkbox("Refresh AI responses (ignore cached answers)", key='refresh_ai_responses')
+    response_cache = ai_response_cache()
+    ai_cache_stats = response_cache.stats()
+    st.write(f"Hits: {ai_cache_stats['hits']} | Misses: {ai_cache_stats['misses']} | "
+             f"Entries: {ai_cache_stats['entries']} ({ai_cache_stats['bytes'] / 1024 / 1024:.1f} MB)")
+    if st.button("Clear AI Response Cache"):
+        response_cache.clear()
+    if st.session_state.get('ai_timings'):
+        # Streamed requests: time to first token and generation throughput
+        st.dataframe(pd.DataFrame(st.session_state['ai_timings']).tail(50))
+
 # Area Selection
 selected_area = st.selectbox("Select Mineral/Geological Area for Analysis", list(mineral_areas.keys()))
 
@@ -198,29 +351,26 @@ if selected_area:
     st.subheader("USGS Bulletin 1693 Integration (Mineral Deposit Models)")
     if st.button("Summarize USGS Bulletin 1693 PDF"):
         try:
-            bulletin_url = "https://pubs.usgs.gov/bul/1693/report.pdf"
-            response = requests.get(bulletin_url)
-            if response.status_code == 200:
-                pdf_buffer = io.BytesIO(response.content)
-                with pdfplumber.open(pdf_buffer) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        text += page.extract_text() or ""
-                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                summary_prompt = f"Summarize the USGS Bulletin 1693 PDF content: {text[:4000]}. Focus on mineral deposit models, especially PGM-related ones."
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": summary_prompt}],
-                    max_tokens=1000
-                )
-                st.session_state['bulletin_summary'] = response.choices[0].message.content
-                st.write("USGS Bulletin 1693 Summary:")
-                st.write(st.session_state['bulletin_summary'])
-            else:
-                st.error("Failed to fetch USGS Bulletin 1693 PDF.")
+            bulletin = get_bulletin()
+            sections = bulletin.models_text(PGM_MODELS + REE_MODELS, max_chars=12000)
+            if not sections:
+                # No model headings recognised: use the best-matching passages instead
+                sections = source_excerpts("platinum group metals PGE deposit model rare earth elements REE carbonatite",
+                                           sources=["USGS Bulletin 1693"], max_chars=12000)
+            summary_prompt = f"Summarize the following USGS Bulletin 1693 deposit model sections: {sections}. Focus on mineral deposit models, especially PGM-related ones, and also cover the REE models."
+            st.write("USGS Bulletin 1693 Summary:")
+            st.session_state['bulletin_summary'] = write_ai_stream("Bulletin 1693 summary", summary_prompt, max_tokens=1000)
         except Exception as e:
             st.error(f"Bulletin Integration Error: {e}")
 
+    if bulletin_cached():
+        bulletin = get_bulletin()
+        with st.expander("Bulletin 1693 Model Lookup"):
+            pgm_ree = set(PGM_MODELS + REE_MODELS)
+            model_no = st.selectbox("Deposit Model", bulletin.models(),
+                                    format_func=lambda m: f"Model {m} - {bulletin.title(m)}" + (" (PGM/REE)" if m in pgm_ree else ""))
+            st.text(bulletin.section_text(model_no, max_chars=20000))
+
     # USGS Mineral Resources Data System (MRDS) Integration - Updated with CSV Download
     st.subheader("USGS Mineral Resources Data System (MRDS) Integration")
     st.write("""
@@ -230,6 +380,125 @@ if selected_area:
     st.markdown("[Download Full MRDS CSV Dataset](https://mrdata.usgs.gov/mrds/mrds.csv)")
     st.info("Download the CSV for offline analysis or import into GIS tools. Contains all worldwide mineral sites with detailed attributes.")
 
+    # Offline MRDS engine: the CSV is ingested once into a local Parquet store
+    # and queried through in-memory spatial and commodity indexes
+    mrds_info = store_info(MRDS_DIR)
+    with st.expander("Offline MRDS Dataset", expanded=mrds_info is None):
+        if mrds_info:
+            st.write(f"Local MRDS store: {mrds_info['rows']:,} sites (built {mrds_info['built_at']})")
+        else:
+            st.write("No local MRDS store yet. Download the dataset or upload the CSV (or zipped CSV) once to enable offline queries.")
+        mrds_upload = st.file_uploader("MRDS CSV file", type=["csv", "zip"], key="mrds_upload")
+        if st.button("Build MRDS Store from Upload" if mrds_upload is not None else "Download and Build MRDS Store"):
+            try:
+                mrds_bar = st.progress(0.0, text="Preparing MRDS dataset...")
+                if mrds_upload is not None:
+                    source = mrds_upload
+                else:
+                    source = download_csv(MRDS_CSV_URL, MRDS_DIR, progress=lambda done, total: mrds_bar.progress(
+                        min(done / total, 1.0) if total else 0.0, text=f"Downloaded {done / 1e6:.0f} MB"))
+                mrds_info = build_store(source, MRDS_DIR, progress=lambda rows: mrds_bar.progress(1.0, text=f"Ingested {rows:,} sites"))
+                st.success(f"MRDS store built with {mrds_info['rows']:,} sites.")
+            except Exception as e:
+                st.error(f"MRDS Ingest Error: {e}")
+
+    if mrds_info:
+        mrds_index = get_mrds_index(mrds_info['built_at'])
+        col_commod, col_state, col_radius = st.columns(3)
+        with col_commod:
+            mrds_commodities = st.text_input("Commodities (comma-separated)", value=area_info['usgs_query']['commodity'].replace(",", ", "))
+        with col_state:
+            mrds_state = st.text_input("MRDS State", value=area_info['usgs_query']['state'])
+        with col_radius:
+            mrds_radius = st.number_input("Radius around area center (km, 0 = no limit)", min_value=0, max_value=2000, value=0, step=10)
+        if st.button("Query MRDS for Selected Area"):
+            usgs_df = mrds_index.query(commodity=mrds_commodities or None, state=mrds_state or None,
+                                       near=area_coord if mrds_radius else None, radius_km=mrds_radius or None)
+            site_classes = classify_sites(usgs_df)
+            usgs_df = usgs_df.dropna(axis=1, how='all').join(site_classes.add_prefix('is_'))
+            st.session_state['usgs_df'] = usgs_df
+            st.session_state['usgs_query_key'] = fingerprint(mrds_info['built_at'], mrds_commodities, mrds_state,
+                                                             area_coord, mrds_radius)
+            set_commodity_flags('mrds', commodity_flags(site_classes),
+                                f"MRDS: {int(site_classes['pgm'].sum())} PGM, {int(site_classes['ree'].sum())} REE and "
+                                f"{int(site_classes['critical'].sum())} critical-mineral sites of {len(usgs_df)}")
+
+        usgs_df = st.session_state.get('usgs_df')
+        if usgs_df is not None:
+            if usgs_df.empty:
+                st.write("No records found.")
+            else:
+                st.write(f"{len(usgs_df):,} MRDS sites match.")
+                st.dataframe(usgs_df.head(1000))
+                st.write("Summary of Commodities:")
+                commod_cols = [col for col in ['commod1', 'commod2', 'commod3'] if col in usgs_df.columns]
+                commodities = usgs_df[commod_cols].melt().value.dropna().value_counts().head(10)
+                st.bar_chart(commodities)
+                st.session_state['usgs_summary_chart'] = commodities
+
+                # PGM / REE / critical mineral presence from the per-site class columns
+                pgm_sites, ree_sites = int(usgs_df['is_pgm'].sum()), int(usgs_df['is_ree'].sum())
+                st.write(f"PGM Presence Detected: {pgm_sites > 0} ({pgm_sites} sites) | REE Presence Detected: {ree_sites > 0} ({ree_sites} sites) | "
+                         f"Critical-mineral sites: {int(usgs_df['is_critical'].sum())}")
+                if pgm_sites:
+                    with st.expander("Detailed PGM Deposit Models and Case Studies"):
+                        st.write("""
+                        Detailed PGM Model Examples (from USGS Bulletin 1693 and similar):
+                        1. **Alaskan-type PGE Deposits (Model 9)**: Associated with zoned mafic-ultramafic intrusions (e.g., dunite, clinopyroxenite). PGE in sulfides like pentlandite, pyrrhotite. Characteristics: High Pd/Pt ratios, formed in arc settings. Case Study: Stillwater Complex (MT) - Layered intrusion with J-M Reef, world's highest-grade PGE deposit.
+                        2. **Podiform Chromite Deposits (Model 8a)**: PGE as by-product in ophiolites. PGE in laurite inclusions in chromite. Characteristics: Low Pd, high Ru-Ir-Os. Case Study: Josephine Ophiolite (OR-CA).
+                        3. **Stratiform PGE in Layered Intrusions (Model 2b)**: Reef-style in Bushveld-type complexes. Characteristics: High Pt-Pd. Case Study: Duluth Complex (MN).
+                        4. **Synorogenic-Synvolcanic Ni-Cu (Model 7a)**: PGE in massive sulfides. Case Study: Eagle Mine (MI).
+                        5. **Basaltic Cu and Ni-Cu-PGE (Model 5a/5b)**: In komatiitic flows or sills. Characteristics: High Pd.
+                        """)
+                if ree_sites:
+                    with st.expander("Detailed REE Deposit Models"):
+                        st.write("""
+                        Detailed REE Model Examples (from USGS Bulletin 1693 and similar):
+                        1. **Carbonatite Deposits (Model 10)**: REE in apatite, monazite, bastnaesite. Examples: Mountain Pass (CA), Bear Lodge (WY).
+                        2. **Peralkaline Granite Deposits**: REE in allanite, zircon, eudialyte. Examples: Bokan Mountain (AK). High HREE, U-Th associated.
+                        3. **Phosphorite Deposits**: REE as by-product in marine phosphates.
+                        4. **Ion-Adsorption Clay Deposits**: Weathered granites with adsorbed REE.
+                        5. **Placer Deposits (Model 39c, shoreline placer Ti)**: REE in monazite sands. Examples: Idaho placers.
+                        """)
+
+                # MRDS Deposit Type and Model Analysis
+                if 'dep_type' in usgs_df.columns or 'model' in usgs_df.columns:
+                    dep_types = usgs_df.get('dep_type', pd.Series(dtype=str)).value_counts()
+                    models = usgs_df.get('model', pd.Series(dtype=str)).value_counts()
+                    dep_types, models = dep_types[dep_types > 0].head(20), models[models > 0].head(20)
+                    st.write("Deposit Type Analysis:")
+                    st.bar_chart(dep_types)
+                    st.session_state['deposit_types_chart'] = dep_types
+                    st.write("Common Deposit Types: " + ', '.join(map(str, dep_types.index[:5])))
+                    st.write("Deposit Model Analysis:")
+                    st.bar_chart(models)
+                    st.session_state['deposit_models_chart'] = models
+                    st.write("Common Deposit Models: " + ', '.join(map(str, models.index[:5])))
+                    if st.button("Analyze MRDS Deposit Models with AI"):
+                        ai_prompt = f"Analyze the following MRDS deposit types and models data: Deposit Types: {dep_types.to_string()}\nModels: {models.to_string()}\nProvide insights on common characteristics, economic significance, and relations to geology in {selected_area}."
+                        ai_prompt = grounded_prompt(ai_prompt, " ".join(map(str, list(models.index[:5]) + list(dep_types.index[:5])))
+                                                    + " deposit model platinum group metals rare earth elements",
+                                                    sources=["USGS Bulletin 1693"])
+                        try:
+                            st.write("AI Analysis of MRDS Deposit Models:")
+                            st.session_state['mrds_ai_analysis'] = write_ai_stream("MRDS deposit models", ai_prompt, max_tokens=1000)
+                        except Exception as e:
+                            st.error(f"AI Analysis Error: {e}")
+                else:
+                    st.write("No deposit type or model data available in results.")
+
+                # Sites are binned like the claims map once there are too many for markers
+                map_df = usgs_df[['latitude', 'longitude', 'site_name']].dropna(subset=['latitude', 'longitude'])
+                if len(map_df) > 300:
+                    bin_size = auto_bin_size(map_df['latitude'], map_df['longitude'], DEFAULT_MAX_FEATURES)
+                    map_df = grid_bins(map_df['latitude'], map_df['longitude'], bin_size).assign(
+                        site_name=lambda bins: bins['count'].astype(str) + " sites")
+                if not map_df.empty:
+                    mrds_map = folium.Map(location=[map_df['latitude'].mean(), map_df['longitude'].mean()], zoom_start=5)
+                    for row in map_df.itertuples(index=False):
+                        folium.Marker([row.latitude, row.longitude], popup=str(row.site_name)).add_to(mrds_map)
+                    folium_static(mrds_map)
+
     # Mindat.org Mineral Data Integration
     st.subheader("Mindat.org Mineral Locality Data")
     st.write("""
@@ -261,26 +530,68 @@ if selected_area:
         county = st.text_input("County Name (optional)", value="")
     with col2:
         records_per_page = st.selectbox("Records Per Page", [50, 100, 200, 300, 400, 500, 1000, 2000], index=4)
+        blm_source = st.radio("Claims Source", ["Live BLM API", "Local mirror"], horizontal=True,
+                              help="The local mirror answers searches and paging from an indexed on-disk copy. Sync it below.")
+
+    @st.cache_resource
+    def get_claim_store():
+        return ClaimStore()
+
+    # Page responses are cached on the normalized query so back-paging and
+    # repeated searches skip the network. The cache is shared by all sessions,
+    # so each combination of settings gets its own instance rather than one
+    # session's widgets reconfiguring everyone's cache.
+    @st.cache_resource(max_entries=4)
+    def get_blm_query_cache(ttl, max_bytes, disk_dir):
+        return QueryCache(ttl=ttl, max_bytes=max_bytes, disk_dir=disk_dir)
+
+    with st.expander("BLM Response Cache"):
+        cache_col1, cache_col2, cache_col3 = st.columns(3)
+        with cache_col1:
+            blm_cache_ttl = st.number_input("Cache TTL (minutes)", min_value=1, max_value=1440, value=15) * 60
+        with cache_col2:
+            blm_cache_bytes = st.number_input("Memory Limit (MB)", min_value=8, max_value=2048, value=64) * 1024 * 1024
+        with cache_col3:
+            blm_cache_dir = QUERY_CACHE_DIR if st.checkbox("Keep responses on disk", value=False) else None
+        blm_cache = get_blm_query_cache(blm_cache_ttl, blm_cache_bytes, blm_cache_dir)
+        cache_stats = blm_cache.stats()
+        st.write(f"Hits: {cache_stats['hits']} (disk: {cache_stats['disk_hits']}) | Misses: {cache_stats['misses']} | "
+                 f"Entries: {cache_stats['entries']} ({cache_stats['bytes'] / 1024 / 1024:.1f} MB)")
+        if st.button("Clear Response Cache"):
+            blm_cache.clear()
+
+    claim_store = get_claim_store()
+    with st.expander("Local Claims Mirror"):
+        mirror_state = claim_store.sync_state(state_code) if state_code else None
+        if mirror_state:
+            st.write(f"{state_code.upper()}: {mirror_state['records']:,} claims, last synced {mirror_state['synced_at']} UTC"
+                     + (f" (incremental on {mirror_state['edit_field']})" if mirror_state['edit_field'] else " (full resync, the layer has no edit-date field)"))
+        else:
+            st.write(f"No local copy of {state_code.upper() or 'this state'} yet. The first sync downloads every claim in the state.")
+        if state_code and st.button(f"Sync Local Mirror for {state_code.upper()}"):
+            try:
+                sync_bar = st.progress(0.0, text="Syncing...")
+                changed = claim_store.sync(state_code, progress=lambda done, pages: sync_bar.progress(done / pages, text=f"{done} / {pages} pages"))
+                sync_bar.progress(1.0, text="Sync complete")
+                st.success(f"Synced {changed:,} new or updated claims for {state_code.upper()}.")
+            except Exception as e:
+                st.error(f"Sync failed: {e}")
 
     # Session state for pagination and data
     if 'blm_page_offset' not in st.session_state:
         st.session_state.blm_page_offset = 0
     if 'blm_current_df' not in st.session_state:
         st.session_state.blm_current_df = None
-    if 'blm_all_results_df' not in st.session_state:
-        st.session_state.blm_all_results_df = pd.DataFrame()
+    if 'blm_results' not in st.session_state:
+        st.session_state.blm_results = ClaimPages()
 
     def fetch_blm_claims(offset=0):
+        if blm_source == "Local mirror":
+            df = claim_store.query(state_code, county, offset=offset, limit=records_per_page)
+            return df, len(df)
         try:
-            base_url = "https://gis.blm.gov/nlsdb/rest/services/Mining_Claims/MiningClaims/MapServer/1/query"
-            
-            where_parts = []
-            if state_code:
-                where_parts.append(f"ADMIN_STATE = '{state_code.upper()}'")
-            if county:
-                where_parts.append(f"UPPER(COUNTY_NM) LIKE '%{county.upper()}%'")
-            
-            where = " AND ".join(where_parts) if where_parts else "1=1"
+            base_url = BLM_QUERY_URL
+            where = build_where(state_code, county)
 
             params = {
                 "where": where,
@@ -292,20 +603,24 @@ if selected_area:
                 "orderByFields": "CSE_NR DESC"
             }
 
-            response = requests.get(base_url, params=params, timeout=60)
-            if response.status_code == 200:
+            cache_key = blm_cache.key(base_url, params)
+            data = blm_cache.get(cache_key)
+            if data is None:
+                response = requests.get(base_url, params=params, timeout=60)
+                if response.status_code != 200:
+                    st.error(f"API Error: {response.status_code} - {response.text}")
+                    return pd.DataFrame(), 0
                 data = response.json()
-                if 'features' in data and data['features']:
-                    claims_list = [feature['attributes'] for feature in data['features']]
-                    df = pd.DataFrame(claims_list)
-                    if df.empty:
-                        return pd.DataFrame(), 0
-                    df.columns = [col.lower() for col in df.columns]
-                    return df, len(claims_list)
-                else:
+                if 'error' not in data:
+                    blm_cache.put(cache_key, data)
+            if 'features' in data and data['features']:
+                claims_list = [feature['attributes'] for feature in data['features']]
+                df = pd.DataFrame(claims_list)
+                if df.empty:
                     return pd.DataFrame(), 0
+                df.columns = [col.lower() for col in df.columns]
+                return df, len(claims_list)
             else:
-                st.error(f"API Error: {response.status_code} - {response.text}")
                 return pd.DataFrame(), 0
         except Exception as e:
             st.error(f"Request failed: {e}")
@@ -315,44 +630,70 @@ if selected_area:
     with col_mid:
         if st.button("🔍 Search BLM Mining Claims", use_container_width=True):
             st.session_state.blm_page_offset = 0
-            st.session_state.blm_all_results_df = pd.DataFrame()
+            st.session_state.blm_results = ClaimPages()
             df_page, count = fetch_blm_claims(offset=0)
             if not df_page.empty:
                 st.session_state.blm_current_df = df_page
-                st.session_state.blm_all_results_df = df_page.copy()
+                st.session_state.blm_results.append(df_page)
                 st.success(f"Found {len(df_page)} claims (page 1)")
             else:
                 st.info("No claims found. Try 'NV' for Nevada — it has thousands of claims.")
 
     if st.session_state.blm_current_df is not None and not st.session_state.blm_current_df.empty:
-        st.success(f"Showing {len(st.session_state.blm_current_df)} claims (Total loaded: {len(st.session_state.blm_all_results_df)})")
+        st.success(f"Showing {len(st.session_state.blm_current_df)} claims (Total loaded: {len(st.session_state.blm_results)})")
 
         display_cols = ['cse_nr', 'cse_name', 'cse_type_nr', 'cse_disp', 'admin_state', 'county_nm', 'claimant_name', 'loc_date']
         available_cols = [col for col in display_cols if col in st.session_state.blm_current_df.columns]
         st.dataframe(st.session_state.blm_current_df[available_cols], use_container_width=True)
 
-        if 'latitude' in st.session_state.blm_current_df.columns and 'longitude' in st.session_state.blm_current_df.columns:
-            map_df = st.session_state.blm_current_df[['latitude', 'longitude', 'cse_name']].dropna()
-            if not map_df.empty and len(map_df) <= 300:
-                blm_map = folium.Map(location=[map_df['latitude'].mean(), map_df['longitude'].mean()], zoom_start=8)
-                for _, row in map_df.iterrows():
-                    folium.CircleMarker(
-                        location=[row['latitude'], row['longitude']],
-                        radius=4,
-                        popup=row.get('cse_name', 'Claim'),
-                        color='blue',
-                        fill=True,
-                        fillOpacity=0.6
-                    ).add_to(blm_map)
-                folium_static(blm_map)
-
-        csv = st.session_state.blm_all_results_df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📥 Download All Loaded Claims as CSV",
-            data=csv,
-            file_name=f"blm_claims_{state_code.upper()}.csv",
-            mime="text/csv"
-        )
+        loaded_columns = st.session_state.blm_results.columns
+        if 'latitude' in loaded_columns and 'longitude' in loaded_columns:
+            map_mode = st.radio("Claim Map Mode", ["Aggregated grid bins", "Aggregated hex bins", "Individual markers (current page, ≤300)"], horizontal=True)
+            if map_mode.startswith("Aggregated"):
+                # Bin every loaded claim on the server so the map carries a few
+                # hundred features regardless of how many pages were loaded
+                all_df = st.session_state.blm_results.select([col for col in ['latitude', 'longitude', 'cse_disp'] if col in loaded_columns])
+                max_features = st.slider("Max map features", 100, 2000, DEFAULT_MAX_FEATURES, 100)
+                binner = hex_bins if "hex" in map_mode else grid_bins
+                category = all_df['cse_disp'] if 'cse_disp' in all_df.columns else None
+                bin_size = auto_bin_size(all_df['latitude'], all_df['longitude'], max_features, binner)
+                bins_df = binner(all_df['latitude'], all_df['longitude'], bin_size, category)
+                if not bins_df.empty:
+                    blm_map = folium.Map(location=[bins_df['latitude'].mean(), bins_df['longitude'].mean()], zoom_start=7)
+                    max_count = bins_df['count'].max()
+                    for row in bins_df.itertuples(index=False):
+                        popup = f"{row.count} claims"
+                        if category is not None:
+                            popup += f" (most common: {row.top_category}, {row.top_category_count})"
+                        folium.CircleMarker(
+                            location=[row.latitude, row.longitude],
+                            radius=4 + 16 * (row.count / max_count) ** 0.5,
+                            popup=popup,
+                            color='blue',
+                            fill=True,
+                            fillOpacity=0.6
+                        ).add_to(blm_map)
+                    folium_static(blm_map)
+                    st.caption(f"{len(bins_df)} bins ({bin_size:.3f}° cells) summarising {int(bins_df['count'].sum()):,} claims with coordinates.")
+            else:
+                map_df = st.session_state.blm_current_df[['latitude', 'longitude', 'cse_name']].dropna()
+                if not map_df.empty and len(map_df) <= 300:
+                    blm_map = folium.Map(location=[map_df['latitude'].mean(), map_df['longitude'].mean()], zoom_start=8)
+                    for _, row in map_df.iterrows():
+                        folium.CircleMarker(
+                            location=[row['latitude'], row['longitude']],
+                            radius=4,
+                            popup=row.get('cse_name', 'Claim'),
+                            color='blue',
+                            fill=True,
+                            fillOpacity=0.6
+                        ).add_to(blm_map)
+                    folium_static(blm_map)
+                elif len(map_df) > 300:
+                    st.info("Too many claims for individual markers — switch to an aggregated map mode.")
+
+        export_controls("Download All Loaded Claims", st.session_state.blm_results, f"blm_claims_{state_code.upper()}",
+                        key="blm_export", columns=st.session_state.blm_results.columns)
 
         col_prev, col_info, col_next = st.columns([1, 3, 1])
         with col_prev:
@@ -374,16 +715,52 @@ if selected_area:
                 df_page, count = fetch_blm_claims(offset=new_offset)
                 if not df_page.empty and count > 0:
                     st.session_state.blm_current_df = df_page
-                    st.session_state.blm_all_results_df = pd.concat([st.session_state.blm_all_results_df, df_page], ignore_index=True)
+                    st.session_state.blm_results.append(df_page)
                     st.session_state.blm_page_offset = new_offset
                     st.rerun()
                 else:
                     st.info("No more results available.")
 
+    # Bulk harvest of every claim matching the state/county filter
+    with st.expander("Bulk Download All Claims (resumable)"):
+        st.write("Downloads every matching claim using concurrent requests. Progress is checkpointed to disk, so an interrupted harvest resumes where it stopped.")
+        hv_col1, hv_col2 = st.columns(2)
+        with hv_col1:
+            harvest_workers = st.number_input("Concurrent Requests", min_value=1, max_value=16, value=4)
+        with hv_col2:
+            harvest_page_size = st.selectbox("Records Per Request", [500, 1000, 2000], index=1)
+        harvest_where = build_where(state_code, county)
+        if st.button("Start / Resume Bulk Harvest"):
+            harvester = ClaimHarvester(harvest_where, page_size=harvest_page_size, workers=int(harvest_workers))
+            try:
+                harvest_bar = st.progress(0.0, text="Planning harvest...")
+                total = harvester.run(progress=lambda done, pages: harvest_bar.progress(done / pages, text=f"{done} / {pages} pages"))
+                harvest_bar.progress(1.0, text="Harvest complete")
+                st.success(f"Harvested {total:,} claims to `{harvester.out_dir}`")
+                # The finished harvester (and its pooled session) is kept for
+                # the export controls instead of being rebuilt on every rerun
+                st.session_state['blm_harvest'] = harvester
+            except Exception as e:
+                st.error(f"Harvest interrupted: {e}. Click again to resume.")
+        harvester = st.session_state.get('blm_harvest')
+        if harvester is not None and harvester.where == harvest_where:
+            st.session_state['blm_harvest_dir'] = harvester.out_dir
+            st.write(f"Harvest on disk: {len(harvester.part_files())} part files in `{harvester.out_dir}`")
+            harvest_name = f"blm_claims_{state_code.upper()}_all"
+            harvest_fmt, harvest_compression = export_controls("Download Harvest", harvester, harvest_name, key="harvest_export")
+            # Very large harvests can be exported to disk without going through the browser
+            if st.button("Write Export to Disk"):
+                try:
+                    path = export_to_path(harvester, os.path.join(CACHE_DIR, "exports", file_name(harvest_name, harvest_fmt, harvest_compression)),
+                                          harvest_fmt, harvest_compression)
+                    st.success(f"Export written to `{path}`")
+                except Exception as e:
+                    st.error(f"Export Error: {e}")
+
     st.info("""
     **Data Source**: Official BLM ArcGIS Server  
     **Endpoint**: https://gis.blm.gov/nlsdb/rest/services/Mining_Claims/MiningClaims/MapServer/1  
-    **Features**: Pagination, CSV export of all loaded results, real-time public data.
+    **Features**: Pagination, CSV/Parquet/GeoJSON export of all loaded results, real-time public data.
     **Tip**: Use 'NV' for Nevada to see thousands of claims instantly.
     """)
 
@@ -398,17 +775,17 @@ if selected_area:
     """)
 
     # Only show if BLM data is loaded
-    if st.session_state.blm_all_results_df is not None and not st.session_state.blm_all_results_df.empty:
-        st.success(f"BLM search loaded {len(st.session_state.blm_all_results_df)} claims — use serial numbers (cse_nr) below for sale searches.")
+    if not st.session_state.blm_results.empty:
+        st.success(f"BLM search loaded {len(st.session_state.blm_results)} claims — use serial numbers (cse_nr) below for sale searches.")
 
         # Show top 10 serial numbers for easy copy
-        serial_numbers = st.session_state.blm_all_results_df['cse_nr'].astype(str).tolist()[:10]
+        serial_numbers = st.session_state.blm_results.head(10)['cse_nr'].astype(str).tolist()
         st.write("**Sample Serial Numbers (cse_nr) from your results — copy and search on sites below:**")
         for sn in serial_numbers:
             st.code(sn)
 
         st.write("**Automated Search Links (using first serial number as example):**")
-        example_sn = st.session_state.blm_all_results_df['cse_nr'].astype(str).iloc[0]
+        example_sn = serial_numbers[0]
 
         st.markdown(f"""
         - [The Diggings - Search by Serial Number](https://thediggings.com/search?serial_number={example_sn})
@@ -440,61 +817,91 @@ if selected_area:
 
     st.info("Tip: Copy cse_nr (serial number) from BLM results and paste into The Diggings, MineExchange.com, or other sites to see if the claim is listed for sale or to contact the owner.")
 
+    # Compliance prompts carry the top-k passages of the bulletin, the extracted
+    # report PDF and the queried MRDS sites instead of whole documents
+    with st.expander("Source Retrieval for AI Prompts"):
+        st.slider("Source excerpts per prompt", min_value=0, max_value=15, value=DEFAULT_TOP_K, key='retrieval_k')
+        st.checkbox("Rank with local embeddings as well as BM25", key='use_embeddings', disabled=not embeddings_available(),
+                    help="Requires the sentence-transformers package." if not embeddings_available() else None)
+        retrieval_query = st.text_input("Search indexed sources")
+        if retrieval_query:
+            excerpts = source_excerpts(retrieval_query)
+            st.text(excerpts or "No indexed sources yet: extract the bulletin or a report PDF, or query MRDS.")
+
+    # Compliance report prompts shared by the individual buttons and the
+    # concurrent report pack: key -> (title, error label, prompt, retrieval query)
+    compliance_reports = {
+        'jorc_report': ("JORC-Compliant Report Summary", "JORC Report",
+                        f"Generate a JORC-compliant report summary for {selected_area}. Include Mineral Resources classification, Competent Person statement, ESG considerations, modifying factors, and 2024 compliance.",
+                        f"JORC mineral resources classification competent person ESG modifying factors {selected_area}"),
+        'ni_report': ("NI 43-101-Compliant Report Summary", "NI 43-101 Report",
+                      f"Generate an NI 43-101-compliant report summary for {selected_area}. Include property description, exploration data, resource estimates, QP statement.",
+                      f"NI 43-101 property description exploration drilling resource estimate qualified person {selected_area}"),
+        'sk_report': ("S-K 1300-Compliant Report Summary", "S-K 1300 Report",
+                      f"Generate an S-K 1300-compliant report summary for {selected_area}. Include mineral resources, initial assessment, QP, property disclosures.",
+                      f"S-K 1300 mineral resources initial assessment qualified person property {selected_area}"),
+        'sasb_report': ("SASB-Compliant Disclosure Summary", "SASB Report",
+                        f"Generate a SASB-compliant disclosure summary for Metals & Mining based on data from {selected_area}. Cover GHG Emissions, Water Management, Waste, Biodiversity, Community Relations, Labor Practices, Business Ethics.",
+                        f"SASB GHG emissions water management waste tailings biodiversity community labor {selected_area}"),
+    }
+
+    def generate_compliance_report(key):
+        title, error_label, prompt, query = compliance_reports[key]
+        try:
+            st.write(f"{title}:")
+            st.session_state[key] = write_ai_stream(title, grounded_prompt(prompt, query), max_tokens=2000)
+        except Exception as e:
+            st.error(f"{error_label} Error: {e}")
+
     # JORC Compliance
     st.subheader("JORC Compliance Details and Reports")
     st.write("JORC Code 2024 Updates: Enhanced ESG provisions, mandatory ESG in Modifying Factors, greater transparency.")
     if st.button("Generate JORC-Compliant Report Summary"):
-        jorc_prompt = f"Generate a JORC-compliant report summary for {selected_area}. Include Mineral Resources classification, Competent Person statement, ESG considerations, modifying factors, and 2024 compliance."
-        try:
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": jorc_prompt}], max_tokens=2000)
-            st.session_state['jorc_report'] = response.choices[0].message.content
-            st.write("JORC-Compliant Report Summary:")
-            st.write(st.session_state['jorc_report'])
-        except Exception as e:
-            st.error(f"JORC Report Error: {e}")
+        generate_compliance_report('jorc_report')
 
     # NI 43-101 Compliance
     st.subheader("NI 43-101 Compliance Details and Reports")
     st.write("NI 43-101: Canadian standard requiring Qualified Person and technical reports.")
     if st.button("Generate NI 43-101-Compliant Report Summary"):
-        ni_prompt = f"Generate an NI 43-101-compliant report summary for {selected_area}. Include property description, exploration data, resource estimates, QP statement."
-        try:
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": ni_prompt}], max_tokens=2000)
-            st.session_state['ni_report'] = response.choices[0].message.content
-            st.write("NI 43-101-Compliant Report Summary:")
-            st.write(st.session_state['ni_report'])
-        except Exception as e:
-            st.error(f"NI 43-101 Report Error: {e}")
+        generate_compliance_report('ni_report')
 
     # S-K 1300 Reporting
     st.subheader("S-K 1300 Reporting Details and Reports")
     st.write("S-K 1300: US SEC regulation for mineral disclosure, aligned with CRIRSCO.")
     if st.button("Generate S-K 1300-Compliant Report Summary"):
-        sk_prompt = f"Generate an S-K 1300-compliant report summary for {selected_area}. Include mineral resources, initial assessment, QP, property disclosures."
-        try:
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": sk_prompt}], max_tokens=2000)
-            st.session_state['sk_report'] = response.choices[0].message.content
-            st.write("S-K 1300-Compliant Report Summary:")
-            st.write(st.session_state['sk_report'])
-        except Exception as e:
-            st.error(f"S-K 1300 Report Error: {e}")
+        generate_compliance_report('sk_report')
 
     # SASB Mining Standards
     st.subheader("SASB Standards for Metals & Mining (EM-MM)")
     st.write("SASB focuses on financially material ESG topics for mining.")
     if st.button("Generate SASB-Compliant Disclosure Summary"):
-        sasb_prompt = f"Generate a SASB-compliant disclosure summary for Metals & Mining based on data from {selected_area}. Cover GHG Emissions, Water Management, Waste, Biodiversity, Community Relations, Labor Practices, Business Ethics."
-        try:
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": sasb_prompt}], max_tokens=2000)
-            st.session_state['sasb_report'] = response.choices[0].message.content
-            st.write("SASB-Compliant Disclosure Summary:")
-            st.write(st.session_state['sasb_report'])
-        except Exception as e:
-            st.error(f"SASB Report Error: {e}")
+        generate_compliance_report('sasb_report')
+
+    # Full compliance pack: the four requests stream concurrently through the
+    # shared async client, each into its own slot
+    st.subheader("Compliance Report Pack (JORC, NI 43-101, S-K 1300, SASB)")
+    if st.button("Generate All Compliance Reports"):
+        pack_prompts = {key: grounded_prompt(prompt, query) for key, (_, _, prompt, query) in compliance_reports.items()}
+        pack_bar = st.progress(0.0, text=f"Generating {len(pack_prompts)} reports...")
+        pack_slots = {key: st.empty() for key in pack_prompts}
+        pack_text, pack_stats, done = {key: "" for key in pack_prompts}, {}, 0
+        for key, piece, error in stream_all(pack_prompts, max_tokens=2000, stats=pack_stats, **ai_request_options()):
+            title, error_label = compliance_reports[key][:2]
+            if piece is not None:
+                pack_text[key] += piece
+                pack_slots[key].markdown(f"**{title}:**\n\n{pack_text[key]}")
+                continue
+            done += 1
+            pack_bar.progress(done / len(pack_prompts), text=f"{done} / {len(pack_prompts)} reports finished")
+            if error is not None:
+                pack_slots[key].error(f"{error_label} Error: {error}")
+                continue
+            st.session_state[key] = pack_text[key]
+            record_ai_timing(title, pack_stats[key])
+            with pack_slots[key].container():
+                st.write(f"{title}:")
+                st.write(pack_text[key])
+                st.caption(pack_stats[key].summary())
 
     # ESG Scoring
     st.subheader("Simple ESG Scoring")
@@ -505,19 +912,83 @@ if selected_area:
     st.write(f"Overall ESG Score: {esg_score:.2f}/10")
     st.session_state['esg_score'] = esg_score
 
+# ========================================
+# Technical Report PDF Extraction
+# ========================================
+st.subheader("Technical Report PDF Extraction (NI 43-101 / JORC)")
+report_pdf = st.file_uploader("Upload a technical report (PDF)", type=["pdf"], key="report_pdf")
+if report_pdf is not None:
+    report_bytes = report_pdf.getvalue()
+    report_digest = file_hash(report_bytes)
+    report_doc = st.session_state.get('report_doc')
+    if report_doc is None or report_doc.digest != report_digest:
+        # Previously extracted reports come straight from the cache
+        report_doc = read_cached_pdf(report_digest)
+    if report_doc is None and st.button("Extract Report Text and Tables"):
+        try:
+            report_bar = st.progress(0.0, text="Extracting pages...")
+            page_preview = st.empty()
+
+            def show_page(page, done, total):
+                report_bar.progress(done / total, text=f"{done} / {total} pages")
+                page_preview.text(f"Page {page['page'] + 1}: {page['text'][:300]}")
+
+            report_doc = extract_pdf(report_bytes, name=report_pdf.name, digest=report_digest, on_page=show_page)
+            page_preview.empty()
+        except Exception as e:
+            st.error(f"PDF Extraction Error: {e}")
+    if report_doc is not None:
+        st.session_state['report_doc'] = report_doc
+        report_tables = report_doc.table_workbook()
+        st.write(f"{len(report_doc)} pages, {len(report_tables.sheets)} tables extracted.")
+        page_no = st.number_input("Page", min_value=1, max_value=max(len(report_doc), 1), value=1)
+        st.text(report_doc.page_texts[page_no - 1][:5000] if len(report_doc) else "")
+        if report_tables.sheets:
+            table_name = st.selectbox("Extracted Table", report_tables.sheet_names)
+            table_df = report_tables.sheets[table_name]
+            st.dataframe(table_df)
+            export_controls("Download Table", table_df, f"{os.path.splitext(report_pdf.name)[0]}_{table_name}", key="report_table_export")
+            # Assay columns in report tables go through the same statistics engine as uploads
+            if detect_assay_columns(table_df):
+                st.write("Assay statistics for this table:")
+                st.table(pd.DataFrame(compute_assay_stats(table_df).records()))
+
 # ========================================
 # File Upload and Analysis
 # ========================================
 uploaded_file = st.file_uploader("Upload your mining data file (Excel)", type=["xlsx"])
 
+# Parse each upload exactly once; reruns (slider moves, button clicks) reuse the
+# typed frames keyed by the file's content hash. Frames are shared read-only.
+@st.cache_resource(max_entries=4, show_spinner="Parsing workbook...")
+def load_uploaded_workbook(digest, name, streaming, _data):
+    return load_workbook(_data, name=name, streaming=streaming or None, digest=digest)
+
 if uploaded_file is not None:
-    wb = openpyxl.load_workbook(uploaded_file)
-    sheets = wb.sheetnames
+    upload_bytes = uploaded_file.getvalue()
+    streaming_mode = st.checkbox("Streaming mode for very large workbooks (read-only, chunked)", value=False,
+                                 help="Always used automatically for files of 20 MB or more.")
+    workbook = load_uploaded_workbook(file_hash(upload_bytes), uploaded_file.name, streaming_mode, upload_bytes)
+    st.session_state['workbook_digest'] = workbook.digest
+    sheets = workbook.sheet_names
     st.write("Sheets:", sheets)
 
-    df = pd.read_excel(uploaded_file, sheet_name=sheets[0])
+    df = workbook.primary
     st.dataframe(df.head())
 
+    # Element columns and commodity text in the upload feed the PGM/REE flags
+    @st.cache_resource(max_entries=8)
+    def get_commodity_evidence(digest, sheet, _df):
+        return classify_uploaded(_df)
+
+    upload_evidence = get_commodity_evidence(workbook.digest, sheets[0], df)
+    set_commodity_flags('upload', commodity_flags(upload_evidence), "; ".join(
+        f"uploaded {name.upper()} columns: {', '.join(map(str, cols))}" for name, cols in upload_evidence.items() if cols and name != 'critical'))
+    with st.expander("Export Data"):
+        export_sheet = st.selectbox("Sheet", sheets, key="export_sheet")
+        export_controls("Download Sheet", workbook.sheets[export_sheet],
+                        f"{os.path.splitext(uploaded_file.name)[0]}_{export_sheet}", key="sheet_export")
+
     # Fixed Map Display
     st.subheader("Data Visualization")
     if 'LATITUDE' in df.columns and 'LONGITUDE' in df.columns:
@@ -543,6 +1014,51 @@ if uploaded_file is not None:
             st.pyplot(fig)
             st.session_state['comp_plot'] = fig
 
+    # Nearest known deposit and overlapping claims for every located sample
+    st.subheader("Nearby Deposits and Claims")
+    if 'LATITUDE' in df.columns and 'LONGITUDE' in df.columns:
+        col_src, col_rad = st.columns(2)
+        with col_src:
+            claim_source = st.selectbox("Claims Reference", ["Loaded BLM search results", "Local claims mirror", "None"])
+        with col_rad:
+            claim_radius = st.number_input("Claim search radius (km)", min_value=0.1, max_value=100.0,
+                                           value=DEFAULT_CLAIM_RADIUS_KM, step=0.5)
+
+        # One spherical index per claims reference, rebuilt only when it changes
+        @st.cache_resource(max_entries=2, show_spinner="Indexing claims...")
+        def get_claim_index(source_key, _claims):
+            return build_claim_index(_claims)
+
+        if st.button("Run Spatial Join"):
+            try:
+                mrds_info = store_info(MRDS_DIR)
+                mrds_index = get_mrds_index(mrds_info['built_at']) if mrds_info else None
+                claims_index = None
+                if claim_source == "Loaded BLM search results":
+                    loaded = st.session_state.get('blm_results')
+                    if loaded is not None and {'latitude', 'longitude'} <= set(loaded.columns):
+                        claims_index = get_claim_index(("loaded", id(loaded), len(loaded)), loaded.select(['latitude', 'longitude']))
+                elif claim_source == "Local claims mirror":
+                    store = get_claim_store()
+                    claims_index = get_claim_index(("mirror", os.path.getmtime(store.path)), store.coordinates())
+                if mrds_index is None and claims_index is None:
+                    st.warning("Build the offline MRDS store or load BLM claims with coordinates first.")
+                else:
+                    joined = join_samples(df, mrds_index=mrds_index, claim_index=claims_index, claim_radius_km=claim_radius)
+                    st.session_state['sample_proximity'] = joined
+                    st.session_state['proximity_summary'] = summarize_proximity(joined)
+            except Exception as e:
+                st.error(f"Spatial Join Error: {e}")
+
+        joined = st.session_state.get('sample_proximity')
+        if joined is not None and joined.index.equals(df.index):
+            id_cols = [col for col in ['SAMPLE_ID', 'HOLE_ID', 'LATITUDE', 'LONGITUDE'] if col in df.columns]
+            st.dataframe(df[id_cols].join(joined).head(1000))
+            st.text(st.session_state['proximity_summary'])
+            export_controls("Download Joined Samples", df.join(joined), f"{os.path.splitext(uploaded_file.name)[0]}_proximity", key="proximity_export")
+    else:
+        st.info("The spatial join needs LATITUDE and LONGITUDE columns.")
+
     # Interactive 3D Geological Modeling
     st.subheader("Interactive 3D Geological Modeling")
     if 'LATITUDE' in df.columns and 'LONGITUDE' in df.columns and len(df.select_dtypes(include='number').columns) > 0:
@@ -557,45 +1073,218 @@ if uploaded_file is not None:
     st.subheader("Basic Resource Estimation (IDW Interpolation)")
     if 'LATITUDE' in df.columns and 'LONGITUDE' in df.columns and len(df.select_dtypes(include='number').columns) > 0:
         value_col = st.selectbox("Select Value Column for Interpolation", df.select_dtypes(include='number').columns)
+        idw_col1, idw_col2, idw_col3 = st.columns(3)
+        with idw_col1:
+            idw_power = st.slider("IDW Power", 1.0, 4.0, 2.0, 0.5)
+            idw_radius = st.number_input("Search Radius (km, 0 = unlimited)", min_value=0.0, value=0.0)
+        with idw_col2:
+            idw_max_n = st.number_input("Max Neighbours", min_value=1, max_value=64, value=16)
+            idw_min_n = st.number_input("Min Neighbours", min_value=1, max_value=64, value=1)
+        with idw_col3:
+            idw_sectors = st.selectbox("Sector Search", [1, 4, 8], format_func=lambda s: "Off" if s == 1 else f"{s} sectors")
+            idw_grid = st.select_slider("Grid Resolution", options=[100, 200, 500, 1000], value=200)
+
+        # KD-tree over projected sample coordinates, built once per dataset/column
+        @st.cache_resource(max_entries=8, show_spinner="Building neighbour index...")
+        def get_idw_estimator(digest, sheet, column, _df):
+            lat = pd.to_numeric(_df['LATITUDE'], errors='coerce').to_numpy(dtype=float)
+            lon = pd.to_numeric(_df['LONGITUDE'], errors='coerce').to_numpy(dtype=float)
+            lat0 = float(np.nanmean(lat))
+            coords = lonlat_to_km(lon, lat, lat0)
+            return IDWEstimator(coords, _df[column].to_numpy(dtype=float)), lat0
+
         if st.button("Perform IDW Estimation"):
-            points = df[['LONGITUDE', 'LATITUDE', value_col]].dropna().to_numpy()
-            values = points[:, 2]
-            grid_x, grid_y = np.mgrid[min(points[:,0]):max(points[:,0]):100j, min(points[:,1]):max(points[:,1]):100j]
-            grid_z = griddata(points[:, :2], values, (grid_x, grid_y), method='linear')
-            fig_idw, ax_idw = plt.subplots()
-            ax_idw.imshow(grid_z.T, extent=(min(points[:,0]), max(points[:,0]), min(points[:,1]), max(points[:,1])), origin='lower')
-            ax_idw.set_title("IDW Interpolation Grid")
-            st.pyplot(fig_idw)
-            st.session_state['idw_chart'] = fig_idw
-
-    # Extract full text content for AI analysis
-    content = ""
-    for sheet in wb:
-        content += f"Sheet: {sheet.title}\n"
-        for row in sheet.iter_rows(values_only=True):
-            content += ",".join([str(cell) for cell in row if cell is not None]) + "\n"
-    
-    if len(content) > 100000:
-        content = content[:100000] + "... (truncated)"
-    
-    prompt = f"""
+            try:
+                estimator, lat0 = get_idw_estimator(workbook.digest, sheets[0], value_col, df)
+                x_min, y_min = estimator.coords.min(axis=0)
+                x_max, y_max = estimator.coords.max(axis=0)
+                with st.spinner(f"Estimating {idw_grid}x{idw_grid} grid from {len(estimator):,} samples..."):
+                    _, _, grid_z, _ = estimator.estimate_grid(
+                        (x_min, x_max), (y_min, y_max), idw_grid, idw_grid,
+                        power=idw_power, radius=idw_radius or None, max_neighbors=int(idw_max_n),
+                        min_neighbors=int(idw_min_n), sectors=idw_sectors
+                    )
+                # The projection is linear per axis, so the grid maps straight back to lon/lat
+                lon_min, lat_min = km_to_lonlat(x_min, y_min, lat0)
+                lon_max, lat_max = km_to_lonlat(x_max, y_max, lat0)
+                fig_idw, ax_idw = plt.subplots()
+                im = ax_idw.imshow(grid_z, extent=(lon_min, lon_max, lat_min, lat_max), origin='lower', aspect='auto')
+                fig_idw.colorbar(im, ax=ax_idw, label=value_col)
+                ax_idw.set_title(f"IDW Interpolation Grid (power {idw_power:g})")
+                st.pyplot(fig_idw)
+                st.session_state['idw_chart'] = fig_idw
+            except Exception as e:
+                st.error(f"IDW Estimation Error: {e}")
+
+    # Ordinary Kriging with Variogram Tool
+    st.subheader("Ordinary Kriging Estimation")
+    if 'LATITUDE' in df.columns and 'LONGITUDE' in df.columns and len(df.select_dtypes(include='number').columns) > 0:
+        krig_col = st.selectbox("Select Value Column for Kriging", df.select_dtypes(include='number').columns, key="krig_col")
+        kv_col1, kv_col2, kv_col3 = st.columns(3)
+        with kv_col1:
+            krig_lag = st.number_input("Lag Size (km, 0 = auto)", min_value=0.0, value=0.0)
+            krig_n_lags = st.number_input("Number of Lags", min_value=3, max_value=50, value=15)
+        with kv_col2:
+            krig_model = st.selectbox("Variogram Model", list(VARIOGRAM_MODELS))
+            krig_max_n = st.number_input("Kriging Max Neighbours", min_value=3, max_value=64, value=16)
+        with kv_col3:
+            krig_radius = st.number_input("Kriging Search Radius (km, 0 = unlimited)", min_value=0.0, value=0.0)
+            krig_grid = st.select_slider("Kriging Grid Resolution", options=[50, 100, 200, 500], value=100)
+
+        def projected_samples(frame, column):
+            lat = pd.to_numeric(frame['LATITUDE'], errors='coerce').to_numpy(dtype=float)
+            lon = pd.to_numeric(frame['LONGITUDE'], errors='coerce').to_numpy(dtype=float)
+            lat0 = float(np.nanmean(lat))
+            return lonlat_to_km(lon, lat, lat0), frame[column].to_numpy(dtype=float), lat0
+
+        # Pair binning is cached per (dataset, value column, lag settings); refitting
+        # a model or re-estimating on another grid never recomputes pairs
+        @st.cache_data(max_entries=16, show_spinner="Computing experimental variogram...")
+        def get_experimental_variogram(digest, column, lag_size, n_lags, _df):
+            coords, values, _ = projected_samples(_df, column)
+            return experimental_variogram(coords, values, lag_size=lag_size or None, n_lags=n_lags)
+
+        @st.cache_resource(max_entries=8, show_spinner="Building kriging neighbourhoods...")
+        def get_kriging_estimator(digest, column, variogram, _df):
+            coords, values, lat0 = projected_samples(_df, column)
+            return OrdinaryKriging(coords, values, variogram), lat0
+
+        try:
+            experimental = get_experimental_variogram(workbook.digest, krig_col, krig_lag, int(krig_n_lags), df)
+            variogram = fit_variogram(experimental, krig_model)
+            if st.checkbox("Show Variogram"):
+                fig_vg, ax_vg = plt.subplots()
+                ax_vg.scatter(experimental.lags, experimental.gamma, label="Experimental")
+                h = np.linspace(0, experimental.lags.max(), 200)
+                ax_vg.plot(h, variogram(h), color='red', label=f"{krig_model.title()} fit")
+                ax_vg.set_xlabel("Lag distance (km)")
+                ax_vg.set_ylabel("Semivariance")
+                ax_vg.legend()
+                st.pyplot(fig_vg)
+                plt.close(fig_vg)
+            st.write(f"Fitted {krig_model} variogram: nugget {variogram.nugget:.4g}, partial sill {variogram.sill:.4g}, range {variogram.range:.4g} km")
+        except Exception as e:
+            variogram = None
+            st.error(f"Variogram Error: {e}")
+
+        if variogram is not None and st.button("Perform Kriging Estimation"):
+            try:
+                kriging, lat0 = get_kriging_estimator(workbook.digest, krig_col, variogram, df)
+                x_min, y_min = kriging.coords.min(axis=0)
+                x_max, y_max = kriging.coords.max(axis=0)
+                with st.spinner(f"Kriging {krig_grid}x{krig_grid} grid from {len(kriging):,} samples..."):
+                    _, _, krig_z, krig_var = kriging.estimate_grid(
+                        (x_min, x_max), (y_min, y_max), krig_grid, krig_grid,
+                        max_neighbors=int(krig_max_n), radius=krig_radius or None
+                    )
+                lon_min, lat_min = km_to_lonlat(x_min, y_min, lat0)
+                lon_max, lat_max = km_to_lonlat(x_max, y_max, lat0)
+                fig_ok, (ax_est, ax_var) = plt.subplots(1, 2, figsize=(12, 5))
+                extent = (lon_min, lon_max, lat_min, lat_max)
+                fig_ok.colorbar(ax_est.imshow(krig_z, extent=extent, origin='lower', aspect='auto'), ax=ax_est, label=krig_col)
+                ax_est.set_title("Ordinary Kriging Estimate")
+                fig_ok.colorbar(ax_var.imshow(krig_var, extent=extent, origin='lower', aspect='auto', cmap='magma'), ax=ax_var, label="Variance")
+                ax_var.set_title("Kriging Variance")
+                st.pyplot(fig_ok)
+                st.session_state['kriging_chart'] = fig_ok
+            except Exception as e:
+                st.error(f"Kriging Error: {e}")
+
+    # 3D Block Model Estimation (parallel IDW over drill hole intervals)
+    st.subheader("3D Block Model Estimation")
+    block_required = ['HOLE_ID', 'FROM', 'TO', 'LATITUDE', 'LONGITUDE']
+    if all(col in df.columns for col in block_required) and len(df.select_dtypes(include='number').columns) > 0:
+        st.write("Estimates grades into a 3D block grid from drill hole interval midpoints (holes treated as vertical). Blocks are evaluated in parallel tiles and streamed to disk.")
+        block_value_col = st.selectbox("Select Value Column for Block Model", df.select_dtypes(include='number').columns, key="block_value_col")
+        bm_col1, bm_col2, bm_col3 = st.columns(3)
+        with bm_col1:
+            block_xy = st.number_input("Block Size X/Y (m)", min_value=1.0, value=25.0)
+            block_z = st.number_input("Block Size Z (m)", min_value=0.5, value=5.0)
+        with bm_col2:
+            block_power = st.slider("Block IDW Power", 1.0, 4.0, 2.0, 0.5)
+            block_max_n = st.number_input("Block Max Neighbours", min_value=1, max_value=64, value=12)
+        with bm_col3:
+            block_radius = st.number_input("Block Search Radius (m, 0 = unlimited)", min_value=0.0, value=200.0)
+            block_workers = st.number_input("Worker Processes", min_value=1, max_value=os.cpu_count() or 1, value=os.cpu_count() or 1)
+
+        if st.button("Run Block Model Estimation"):
+            try:
+                coords, values, _ = drillhole_samples(df, block_value_col)
+                grid = BlockGrid.covering(coords, (block_xy, block_xy, block_z))
+                params = dict(power=block_power, max_neighbors=int(block_max_n), radius=block_radius or None)
+                run_key = hashlib.sha256(repr((workbook.digest, block_value_col, grid, params)).encode()).hexdigest()[:16]
+                out_path = os.path.join(CACHE_DIR, "block_models", f"{run_key}.parquet")
+                progress_bar = st.progress(0.0, text=f"Estimating {grid.n_blocks:,} blocks...")
+                if os.path.exists(out_path):
+                    meta = pq.ParquetFile(out_path).metadata
+                    summary = {"blocks": grid.n_blocks, "estimated": meta.num_rows, "path": out_path}
+                else:
+                    summary = run_block_model(
+                        coords, values, grid, out_path, params, workers=int(block_workers),
+                        progress=lambda done, total: progress_bar.progress(done / total, text=f"{done:,} / {total:,} blocks")
+                    )
+                progress_bar.progress(1.0, text="Block model complete")
+                st.session_state['block_model'] = {"grid": grid, "value_col": block_value_col, **summary}
+            except Exception as e:
+                st.error(f"Block Model Error: {e}")
+
+        block_model = st.session_state.get('block_model')
+        if block_model and os.path.exists(block_model['path']):
+            grid = block_model['grid']
+            st.write(f"Block model: {grid.shape[0]} x {grid.shape[1]} x {grid.shape[2]} blocks ({block_model['blocks']:,} total, {block_model['estimated']:,} estimated). Saved to `{block_model['path']}`")
+            # A single-level (flat) model has only bench 0; st.slider needs min < max
+            bench = st.slider("Bench (Z level, 0 = deepest)", 0, grid.shape[2] - 1, grid.shape[2] - 1) if grid.shape[2] > 1 else 0
+            # Only the selected bench is read back from disk
+            bench_df = pq.read_table(block_model['path'], columns=['ix', 'iy', 'estimate'], filters=[('iz', '==', bench)]).to_pandas()
+            plan = np.full((grid.shape[1], grid.shape[0]), np.nan)
+            plan[bench_df['iy'].to_numpy(), bench_df['ix'].to_numpy()] = bench_df['estimate'].to_numpy()
+            fig_bm, ax_bm = plt.subplots()
+            im_bm = ax_bm.imshow(plan, origin='lower', aspect='equal')
+            fig_bm.colorbar(im_bm, ax=ax_bm, label=block_model['value_col'])
+            ax_bm.set_title(f"Block Model Plan View - Bench {bench}")
+            st.pyplot(fig_bm)
+            plt.close(fig_bm)
+    else:
+        st.info("Block modelling needs HOLE_ID, FROM, TO, LATITUDE and LONGITUDE columns.")
+
+    # AI Analysis Buttons (routed to the provider selected under AI Providers)
+    # The data prompt is only built when an analysis is requested, as a compact
+    # summary plus as many raw rows as fit in the token budget, or (map-reduce)
+    # the summary plus AI summaries of every sheet / row block of the workbook
+    prompt_budget = st.number_input("AI prompt token budget", min_value=1000, max_value=120000,
+                                    value=DEFAULT_TOKEN_BUDGET, step=1000)
+    analysis_mode = st.radio("Analysis mode", ["Budgeted prompt", "Map-reduce over all rows"], horizontal=True,
+                             help="Map-reduce summarizes every row block in parallel and analyzes the combined summaries; "
+                                  "block summaries are cached, so re-analysis only sends changed blocks.")
+    if st.button("Analyze with AI"):
+        try:
+            if analysis_mode == "Map-reduce over all rows":
+                content = build_data_prompt(workbook, budget_tokens=int(prompt_budget), include_rows=False)
+                chunks = workbook_chunks(workbook)
+                chunk_progress = st.progress(0.0, text=f"Summarizing {len(chunks)} data blocks...")
+                options = ai_request_options()
+                del options['dataset']  # block summaries are keyed on the block text alone
+                summaries = summarize_chunks(
+                    chunks, chunk_summary_prompt, combine_summaries_prompt,
+                    max(int(prompt_budget) - estimate_tokens(content), 1000), **options,
+                    on_progress=lambda done, total: chunk_progress.progress(done / total, text=f"Summarized {done} of {total} data blocks"))
+                content += "Summaries of all rows, by sheet and row block:\n" + "\n\n".join(summaries)
+            else:
+                content = build_data_prompt(workbook, budget_tokens=int(prompt_budget))
+            if st.session_state.get('proximity_summary'):
+                content += "\n\nNearest known MRDS deposits and BLM claims around the samples:\n" + st.session_state['proximity_summary']
+            prompt = f"""
     Analyze the following mining data from the Excel file in the context of {selected_area}. 
     Extract all information related to metals, ores, locations, geological characteristics, samples, compositions, and any other relevant metrics. 
     Provide analysis on what metals and ores are present, where the data is related to, nearby mines, ownership, and economic factors.
-    File content:
+    File content (summary statistics followed by raw rows or row summaries):
     {content}
     """
-
-    # AI Analysis Buttons (using OpenAI only)
-    if st.button("Analyze with OpenAI"):
-        try:
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": prompt}], max_tokens=2000)
-            st.session_state['openai_analysis'] = response.choices[0].message.content
-            st.write("OpenAI Analysis:")
-            st.write(st.session_state['openai_analysis'])
+            st.caption(f"Prompt size: ~{estimate_tokens(prompt):,} tokens")
+            st.write("AI Analysis:")
+            st.session_state['openai_analysis'] = write_ai_stream("Data analysis", prompt, max_tokens=2000)
         except Exception as e:
-            st.error(f"OpenAI Error: {e}")
+            st.error(f"AI Analysis Error: {e}")
 
     # Refined Cost Estimation Calculator with ESG
     st.subheader("Refined Mining Cost Estimation Calculator with ESG")
@@ -641,9 +1330,10 @@ if uploaded_file is not None:
         st.write(f"NPV: ${npv:.2f} | IRR: {irr:.2f}%")
         st.session_state['cost_estimates'] = f"NPV: ${npv:.2f}\nIRR: {irr:.2f}%"
 
-    # Generate Mining Analyst Report - Using OpenAI only, with mandatory PGM section
+    # Generate Mining Analyst Report - with mandatory PGM section
     if st.button("Generate Mining Analyst Report"):
-        pgm_status = "PGM metals detected in the data" if st.session_state.get('pgm_present', False) else "The reviewed data provides no evidence of Platinum Group Metals (PGM) presence. No PGM-related mineralization or by-products identified in MRDS records or uploaded file."
+        evidence = "; ".join(text for text in st.session_state.get('commodity_evidence', {}).values() if text)
+        pgm_status = f"PGM metals detected in the data ({evidence})" if st.session_state.get('pgm_present', False) else "The reviewed data provides no evidence of Platinum Group Metals (PGM) presence. No PGM-related mineralization or by-products identified in MRDS records or uploaded file."
         report_prompt = f"""Generate a detailed mining analyst report for {selected_area}, structured as:
         1. Executive Summary
         2. Introduction & Area Overview
@@ -659,23 +1349,22 @@ if uploaded_file is not None:
         9. Recommendations and Conclusions
         
         Use available data from USGS MRDS, BLM claims, uploaded file analysis, cost estimates, and ESG factors. Include hypothetical charts described in text if relevant."""
+        if st.session_state.get('proximity_summary'):
+            report_prompt += f"""
+
+        Spatial context of the uploaded samples (nearest known MRDS deposits and BLM claims):
+        {st.session_state['proximity_summary']}"""
+        report_prompt = grounded_prompt(report_prompt, f"platinum group metals PGE rare earth elements deposit model {selected_area}")
         
-        if os.getenv("OPENAI_API_KEY"):
+        if ai_router.available():
             try:
-                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": report_prompt}],
-                    max_tokens=4000,
-                    temperature=0.7
-                )
-                st.session_state['analyst_report'] = response.choices[0].message.content
-                st.write("### Mining Analyst Report (Generated with OpenAI GPT-4o)")
-                st.write(st.session_state['analyst_report'])
+                st.write("### Mining Analyst Report")
+                st.session_state['analyst_report'] = write_ai_stream("Mining analyst report", report_prompt, max_tokens=4000,
+                                                                     temperature=0.7)
             except Exception as e:
-                st.error(f"OpenAI generation failed: {e}")
+                st.error(f"AI generation failed: {e}")
         else:
-            st.error("OpenAI API key not found. Please set OPENAI_API_KEY in environment variables.")
+            st.error("No AI provider API key found. Please set OPENAI_API_KEY, GOOGLE_GEMINI_API_KEY or XAI_API_KEY in environment variables.")
 
     # Generate PDF Report
     if st.button("Generate PDF Report"):
@@ -707,18 +1396,24 @@ if uploaded_file is not None:
     # ========================================
     st.subheader("Generate Technical Report")
 
+    # Assay columns are coerced to one float matrix once per dataset and shared
+    # by the statistics, histogram, correlation and high-grade sections
+    @st.cache_resource(max_entries=8)
+    def get_assay_stats(digest, sheet, _df):
+        return compute_assay_stats(_df)
+
     if uploaded_file is not None:
         if st.button("Generate Technical Report"):
             with st.spinner("Analyzing data and generating report..."):
                 try:
-                    # Load data
-                    df = pd.read_excel(uploaded_file, sheet_name=0)
+                    # Load data (already parsed by the ingestion layer)
+                    df = workbook.primary
                     
-                    # Identify numeric assay columns
-                    numeric_cols = df.select_dtypes(include='number').columns
-                    key_elements = ['AU', 'AG', 'CU', 'ZN', 'PB', 'AS', 'NI', 'CO', 'AU_GPT', 'AG_GPT']
-                    available_elements = [col.upper() for col in numeric_cols if col.upper() in [e.upper() for e in key_elements]]
-                    assay_cols = [col for col in numeric_cols if col.upper() in available_elements]
+                    # Identify numeric assay columns and compute all statistics in one pass;
+                    # every section below reads from this result
+                    assay_cols = detect_assay_columns(df)
+                    assay_stats = get_assay_stats(workbook.digest, sheets[0], df)
+                    stats_list = assay_stats.records()
                     
                     # Identify lithology column
                     lith_col = next((col for col in df.columns if col.upper() in ['LITHOLOGY', 'ROCK_TYPE', 'LITH', 'LOG']), None)
@@ -750,30 +1445,14 @@ Coordinates are present: {'Yes' if all(col in df.columns for col in ['LATITUDE',
 """
 
                     # Descriptive Statistics - Safe coercion
-                    if assay_cols:
-                        stats_list = []
-                        for col in assay_cols:
-                            series = pd.to_numeric(df[col], errors='coerce').dropna()
-                            if len(series) > 0:
-                                stats_list.append({
-                                    'Element': col.upper(),
-                                    'n': len(series),
-                                    'min': f"{series.min():.4f}",
-                                    'p10': f"{series.quantile(0.1):.4f}",
-                                    'p50': f"{series.quantile(0.5):.4f}",
-                                    'p90': f"{series.quantile(0.9):.4f}",
-                                    'max': f"{series.max():.4f}",
-                                    'mean': f"{series.mean():.4f}"
-                                })
-                        if stats_list:
-                            stats_df = pd.DataFrame(stats_list)
-                            report += "## Key Descriptive Statistics\n\n"
-                            # Manual markdown table to avoid tabulate dependency
-                            report += "| Element | n | min | p10 | p50 | p90 | max | mean |\n"
-                            report += "|---------|---|-----|-----|-----|-----|-----|------|\n"
-                            for _, row in stats_df.iterrows():
-                                report += f"| {row['Element']} | {row['n']} | {row['min']} | {row['p10']} | {row['p50']} | {row['p90']} | {row['max']} | {row['mean']} |\n"
-                            report += "\n\n"
+                    if stats_list:
+                        report += "## Key Descriptive Statistics\n\n"
+                        # Manual markdown table to avoid tabulate dependency
+                        report += "| Element | n | min | p10 | p50 | p90 | max | mean |\n"
+                        report += "|---------|---|-----|-----|-----|-----|-----|------|\n"
+                        for row in stats_list:
+                            report += f"| {row['Element']} | {row['n']} | {row['min']} | {row['p10']} | {row['p50']} | {row['p90']} | {row['max']} | {row['mean']} |\n"
+                        report += "\n\n"
 
                     # Grade Distributions (Histograms) - Safe
                     report += "## Grade Distributions\n\n"
@@ -782,11 +1461,11 @@ Coordinates are present: {'Yes' if all(col in df.columns for col in ['LATITUDE',
                     for col in assay_cols:
                         if plotted >= 2:
                             break
-                        series = pd.to_numeric(df[col], errors='coerce').dropna()
-                        positive = series[series > 0]
+                        values = assay_stats.column(col)
+                        positive = values[values > 0]
                         if len(positive) > 1:
                             fig, ax = plt.subplots()
-                            np.log10(positive).hist(bins=30, ax=ax, color='steelblue', edgecolor='black')
+                            ax.hist(np.log10(positive), bins=30, color='steelblue', edgecolor='black')
                             ax.set_title(f"{col.upper()} distribution (log10)")
                             ax.set_xlabel("log10(value)")
                             ax.set_ylabel("Frequency")
@@ -806,8 +1485,7 @@ Coordinates are present: {'Yes' if all(col in df.columns for col in ['LATITUDE',
 
                     # Element Associations - Safe
                     if len(assay_cols) > 1:
-                        numeric_assay_df = df[assay_cols].apply(pd.to_numeric, errors='coerce')
-                        corr_matrix = numeric_assay_df.corr().round(2)
+                        corr_matrix = assay_stats.corr().round(2)
                         report += "## Element Associations\n\n"
                         report += "Pearson correlation coefficients (numeric values only):\n\n"
                         # Manual markdown for correlation
@@ -822,9 +1500,8 @@ Coordinates are present: {'Yes' if all(col in df.columns for col in ['LATITUDE',
                     au_cols = [c for c in assay_cols if 'AU' in c.upper()]
                     if au_cols:
                         au_col = au_cols[0]
-                        au_series = pd.to_numeric(df[au_col], errors='coerce')
-                        top_indices = au_series.nlargest(10).index
-                        top_au = df.loc[top_indices, [df.columns[0], 'LATITUDE', 'LONGITUDE', au_col] if 'LATITUDE' in df.columns else [df.columns[0], au_col]]
+                        top_positions = assay_stats.top_positions(au_col, 10)
+                        top_au = df.iloc[top_positions][[df.columns[0], 'LATITUDE', 'LONGITUDE', au_col] if 'LATITUDE' in df.columns else [df.columns[0], au_col]]
                         report += "### Top 10 Au Samples\n\n"
                         # Manual markdown table
                         report += "| " + " | ".join(top_au.columns) + " |\n"
@@ -833,28 +1510,29 @@ Coordinates are present: {'Yes' if all(col in df.columns for col in ['LATITUDE',
                             report += "| " + " | ".join(str(val) for val in row) + " |\n"
                         report += "\n\n"
 
-                    # OpenAI Insights
-                    if os.getenv("OPENAI_API_KEY"):
+                    # AI Insights, streamed below the report so far instead of
+                    # blocking until the whole answer is in
+                    shown = 0
+                    if ai_router.available():
+                        st.markdown(report)
+                        shown = len(report)
                         try:
-                            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
                             ai_prompt = f"""
                             Act as a senior mining consultant. Review this dataset summary:
                             - Elements: {', '.join(assay_cols)}
-                            - Statistics: {stats_list if 'stats_list' in locals() else 'Limited due to mixed data'}
+                            - Statistics: {stats_list if stats_list else 'Limited due to mixed data'}
                             - Some columns contain mixed text/numeric values requiring cleaning
                             Suggest likely deposit type, exploration implications, risks, and next steps.
                             Keep response professional and concise (~300 words).
                             """
-                            response = client.chat.completions.create(
-                                model="gpt-4o",
-                                messages=[{"role": "user", "content": ai_prompt}],
-                                max_tokens=800
-                            )
-                            report += "## Additional Consultant Insights (OpenAI)\n\n"
-                            report += response.choices[0].message.content
+                            report += "## Additional Consultant Insights (AI)\n\n"
+                            st.markdown("## Additional Consultant Insights (AI)")
+                            shown = len(report)
+                            report += write_ai_stream("Technical report insights", ai_prompt, max_tokens=800)
                             report += "\n\n"
+                            shown = len(report)
                         except Exception as e:
-                            report += f"OpenAI insights unavailable: {e}\n\n"
+                            report += f"AI insights unavailable: {e}\n\n"
 
                     # Recommendations
                     report += "## Recommended Next Steps\n\n"
@@ -868,7 +1546,7 @@ Coordinates are present: {'Yes' if all(col in df.columns for col in ['LATITUDE',
                     - Consider environmental baseline for elevated pathfinders (e.g., As)
                     """
 
-                    st.markdown(report)
+                    st.markdown(report[shown:])
 
                     # PDF Download with Error Handling
                     try:
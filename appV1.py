@@ -1,8 +1,6 @@
 import streamlit as st
 import pandas as pd
 import openpyxl
-from openai import OpenAI
-import google.generativeai as genai
 import requests
 import json
 import os
@@ -16,8 +14,13 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 from PIL import Image as PilImage
-import pdfplumber  # Add to install: pip install pdfplumber
 import random
+from commodities import classify_sites, commodity_flags
+from bulletin import load_bulletin
+from retrieval import bulletin_chunks, fingerprint, load_or_build
+from llm import PROVIDER_LABELS, ResponseCache, StreamStats, default_router, fan_out, stream_complete, summarize_chunks
+from prompts import CHARS_PER_TOKEN, DEFAULT_TOKEN_BUDGET, chunk_summary_prompt, combine_summaries_prompt, sheet_chunks
+import hashlib
 
 # Note: This code assumes you have API keys for OpenAI, Google Gemini, and xAI set as environment variables.
 # Install required packages: pip install streamlit pandas openpyxl openai google-generativeai requests reportlab folium streamlit-folium matplotlib pillow pdfplumber
@@ -169,6 +172,26 @@ st.header("Colorado Plateau Overview")
 st.write(f"**Description:** {colorado_plateau_info['description']}")
 st.write(f"**Geology:** {colorado_plateau_info['geology']}")
 
+# AI responses are cached on disk per request and uploaded dataset
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+def ai_options():
+    return {'cache': get_response_cache(), 'dataset': st.session_state.get('dataset_hash', ""),
+            'refresh': st.session_state.get('refresh_ai_responses', False)}
+
+# Gemini remains the default model of this version; requests go through the
+# shared provider router (pooled clients, rate limits, retries) and the
+# answer is streamed into the page as it is generated
+def write_ai_stream(prompt, provider="gemini", max_tokens=None):
+    stats = StreamStats()
+    text = st.write_stream(stream_complete(prompt, provider=provider, max_tokens=max_tokens, stats=stats, **ai_options()))
+    st.caption(stats.summary())
+    return text
+
+st.checkbox("Refresh AI responses (ignore cached answers)", key='refresh_ai_responses')
+
 selected_area = st.selectbox("Select Mineral/Geological Area for Analysis", list(mineral_areas.keys()))
 
 if selected_area:
@@ -207,24 +230,16 @@ if selected_area:
     st.subheader("USGS Bulletin 1693 Integration (Mineral Deposit Models)")
     if st.button("Summarize USGS Bulletin 1693 PDF"):
         try:
-            bulletin_url = "https://pubs.usgs.gov/bul/1693/report.pdf"
-            response = requests.get(bulletin_url)
-            if response.status_code == 200:
-                pdf_buffer = io.BytesIO(response.content)
-                with pdfplumber.open(pdf_buffer) as pdf:
-                    text = ""
-                    for page in pdf.pages:
-                        text += page.extract_text() or ""
-                # Use Gemini to summarize
-                genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-                model = genai.GenerativeModel('gemini-1.5-pro-latest')
-                summary_prompt = f"Summarize the USGS Bulletin 1693 PDF content: {text[:10000]} Focus on mineral deposit models, especially PGM-related ones. Extract key sections on PGM deposits, characteristics, geological settings, and models for checking PGM presence."
-                summary_response = model.generate_content(summary_prompt)
-                st.session_state['bulletin_summary'] = summary_response.text
-                st.write("USGS Bulletin 1693 Summary:")
-                st.write(st.session_state['bulletin_summary'])
-            else:
-                st.error("Failed to fetch USGS Bulletin 1693 PDF.")
+            # The bulletin is extracted and indexed once; the prompt gets the
+            # best-matching PGM passages instead of the first pages
+            bulletin = load_bulletin()
+            index = load_or_build(fingerprint("bulletin", len(bulletin.pages)), lambda: bulletin_chunks(bulletin))
+            text = index.context("platinum group metals PGE PGM deposit model characteristics geological setting "
+                                 "layered intrusion Alaskan-type podiform chromite Ni-Cu sulfide", k=10, max_chars=10000)
+            # Use Gemini to summarize
+            summary_prompt = f"Summarize the USGS Bulletin 1693 PDF content: {text} Focus on mineral deposit models, especially PGM-related ones. Extract key sections on PGM deposits, characteristics, geological settings, and models for checking PGM presence."
+            st.write("USGS Bulletin 1693 Summary:")
+            st.session_state['bulletin_summary'] = write_ai_stream(summary_prompt)
         except Exception as e:
             st.error(f"Bulletin Integration Error: {e}")
 
@@ -256,8 +271,11 @@ if selected_area:
                     st.session_state['usgs_df'] = usgs_df
                     st.session_state['usgs_summary_chart'] = commodities
                     # Check for PGM Presence
-                    pgm_terms = ['platinum', 'palladium', 'rhodium', 'iridium', 'osmium', 'ruthenium', 'pge', 'pgm']
-                    pgm_present = any(any(term in str(commod).lower() for term in pgm_terms) for commod in usgs_df[['commod1', 'commod2', 'commod3']].values.flatten() if commod)
+                    site_classes = classify_sites(usgs_df)
+                    usgs_df = usgs_df.join(site_classes.add_prefix('is_'))
+                    st.session_state['usgs_df'] = usgs_df
+                    st.session_state.update(commodity_flags(site_classes))
+                    pgm_present = st.session_state['pgm_present']
                     st.write(f"PGM Presence Detected: {pgm_present}")
                     if pgm_present:
                         st.write("PGM Commodities Found - Analyzing with Bulletin 1693 Models.")
@@ -275,17 +293,12 @@ if selected_area:
                         if st.button("AI PGM Deposit Analysis"):
                             pgm_prompt = f"Analyze PGM presence in MRDS data: Commodities: {commodities.to_string()}. Cross-reference with USGS Bulletin 1693 models for PGM deposits (e.g., Alaskan PGE, Podiform Chromite). Provide insights on characteristics, settings, and exploration implications for {selected_area}."
                             try:
-                                genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-                                model = genai.GenerativeModel('gemini-1.5-pro-latest')
-                                pgm_response = model.generate_content(pgm_prompt)
-                                st.session_state['pgm_ai_analysis'] = pgm_response.text
                                 st.write("AI PGM Deposit Analysis:")
-                                st.write(st.session_state['pgm_ai_analysis'])
+                                st.session_state['pgm_ai_analysis'] = write_ai_stream(pgm_prompt)
                             except Exception as e:
                                 st.error(f"AI PGM Analysis Error: {e}")
                     # Check for REE Presence (New)
-                    ree_terms = ['lanthanum', 'cerium', 'praseodymium', 'neodymium', 'samarium', 'europium', 'gadolinium', 'terbium', 'dysprosium', 'holmium', 'erbium', 'thulium', 'ytterbium', 'lutetium', 'yttrium', 'scandium', 'ree', 'rare earth']
-                    ree_present = any(any(term in str(commod).lower() for term in ree_terms) for commod in usgs_df[['commod1', 'commod2', 'commod3']].values.flatten() if commod)
+                    ree_present = st.session_state['ree_present']
                     st.write(f"REE Presence Detected: {ree_present}")
                     if ree_present:
                         st.write("REE Commodities Found - Analyzing with Bulletin 1693 Models.")
@@ -316,12 +329,8 @@ if selected_area:
                         if st.button("AI REE Deposit Analysis"):
                             ree_prompt = f"Analyze REE presence in MRDS data: Commodities: {commodities.to_string()}. Cross-reference with USGS Bulletin 1693 models for REE deposits (e.g., Carbonatite: alkaline, LREE-rich; Peralkaline Granite: HREE, U-associated; Phosphorite: sedimentary apatite; Ion-Adsorption: weathered clays; Placer: monazite sands). Provide detailed insights on characteristics, settings, examples, and exploration implications for {selected_area}."
                             try:
-                                genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-                                model = genai.GenerativeModel('gemini-1.5-pro-latest')
-                                ree_response = model.generate_content(ree_prompt)
-                                st.session_state['ree_ai_analysis'] = ree_response.text
                                 st.write("AI REE Deposit Analysis:")
-                                st.write(st.session_state['ree_ai_analysis'])
+                                st.session_state['ree_ai_analysis'] = write_ai_stream(ree_prompt)
                             except Exception as e:
                                 st.error(f"AI REE Analysis Error: {e}")
                     # MRDS Deposit Type and Model Analysis
@@ -340,12 +349,8 @@ if selected_area:
                         if st.button("Analyze MRDS Deposit Models with AI"):
                             ai_prompt = f"Analyze the following MRDS deposit types and models data: Deposit Types: {dep_types.to_string()}\nModels: {models.to_string()}\nProvide insights on common characteristics, economic significance, and relations to geology in {selected_area}."
                             try:
-                                genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-                                model = genai.GenerativeModel('gemini-1.5-pro-latest')
-                                ai_response = model.generate_content(ai_prompt)
-                                st.session_state['mrds_ai_analysis'] = ai_response.text
                                 st.write("AI Analysis of MRDS Deposit Models:")
-                                st.write(st.session_state['mrds_ai_analysis'])
+                                st.session_state['mrds_ai_analysis'] = write_ai_stream(ai_prompt)
                             except Exception as e:
                                 st.error(f"AI Analysis Error: {e}")
                     else:
@@ -377,13 +382,9 @@ if selected_area:
             response = requests.get(earth_mri_url)
             if response.status_code == 200:
                 # Use Gemini to summarize page content
-                genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-                model = genai.GenerativeModel('gemini-1.5-pro-latest')
                 summary_prompt = f"Summarize the following page content for Earth MRI data in {selected_area}: {response.text[:10000]}"  # Truncate
-                summary_response = model.generate_content(summary_prompt)
-                st.session_state['earth_mri_summary'] = summary_response.text
                 st.write("Earth MRI Summary:")
-                st.write(st.session_state['earth_mri_summary'])
+                st.session_state['earth_mri_summary'] = write_ai_stream(summary_prompt)
             else:
                 st.error("Failed to fetch Earth MRI page.")
         except Exception as e:
@@ -427,12 +428,8 @@ if selected_area:
                     if st.button("Analyze BLM Mining Claims with AI"):
                         ai_prompt = f"Analyze the following BLM mining claims data: {claims_df.to_string()}\nProvide insights on active claims, ownership patterns, and potential for new exploration in {selected_area}."
                         try:
-                            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-                            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-                            ai_response = model.generate_content(ai_prompt)
-                            st.session_state['blm_ai_analysis'] = ai_response.text
                             st.write("AI Analysis of BLM Mining Claims:")
-                            st.write(st.session_state['blm_ai_analysis'])
+                            st.session_state['blm_ai_analysis'] = write_ai_stream(ai_prompt)
                         except Exception as e:
                             st.error(f"AI BLM Analysis Error: {e}")
                 else:
@@ -450,13 +447,9 @@ if selected_area:
             response = requests.get(mlrs_url)
             if response.status_code == 200:
                 # Use Gemini to summarize
-                genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-                model = genai.GenerativeModel('gemini-1.5-pro-latest')
                 mlrs_prompt = f"Summarize BLM MLRS mining claims data for {area_info.get('state', 'US')} from the page: {response.text[:5000]}. Provide number of active claims, trends, and links to reports or data downloads."
-                mlrs_response = model.generate_content(mlrs_prompt)
-                st.session_state['mlrs_summary'] = mlrs_response.text
                 st.write("BLM MLRS Summary:")
-                st.write(st.session_state['mlrs_summary'])
+                st.session_state['mlrs_summary'] = write_ai_stream(mlrs_prompt)
             else:
                 st.error("Failed to fetch BLM MLRS page.")
         except Exception as e:
@@ -468,12 +461,8 @@ if selected_area:
     if st.button("Generate JORC-Compliant Report Summary"):
         jorc_prompt = f"Generate a JORC-compliant report summary based on the data from {selected_area}. Include sections on Mineral Resources classification (Inferred, Indicated, Measured), Competent Person statement, ESG considerations, modifying factors, and compliance with 2024 updates (transparency, RPEE, risks disclosure)."
         try:
-            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            jorc_response = model.generate_content(jorc_prompt)
-            st.session_state['jorc_report'] = jorc_response.text
             st.write("JORC-Compliant Report Summary:")
-            st.write(st.session_state['jorc_report'])
+            st.session_state['jorc_report'] = write_ai_stream(jorc_prompt)
         except Exception as e:
             st.error(f"JORC Report Generation Error: {e}")
 
@@ -483,12 +472,8 @@ if selected_area:
     if st.button("Generate NI 43-101-Compliant Report Summary"):
         ni_prompt = f"Generate an NI 43-101-compliant report summary for {selected_area}. Include sections on Mineral Property Description, Exploration Data, Mineral Resource Estimates, Qualified Person statement, and compliance with latest standards."
         try:
-            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            ni_response = model.generate_content(ni_prompt)
-            st.session_state['ni_report'] = ni_response.text
             st.write("NI 43-101-Compliant Report Summary:")
-            st.write(st.session_state['ni_report'])
+            st.session_state['ni_report'] = write_ai_stream(ni_prompt)
         except Exception as e:
             st.error(f"NI 43-101 Report Generation Error: {e}")
 
@@ -498,12 +483,8 @@ if selected_area:
     if st.button("Generate S-K 1300-Compliant Report Summary"):
         sk_prompt = f"Generate an S-K 1300-compliant report summary for {selected_area}. Include sections on Mineral Resources, Initial Assessment, Qualified Person, and compliance with S-K 1300 requirements (e.g., property disclosures, resource classification)."
         try:
-            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            sk_response = model.generate_content(sk_prompt)
-            st.session_state['sk_report'] = sk_response.text
             st.write("S-K 1300-Compliant Report Summary:")
-            st.write(st.session_state['sk_report'])
+            st.session_state['sk_report'] = write_ai_stream(sk_prompt)
         except Exception as e:
             st.error(f"S-K 1300 Report Generation Error: {e}")
 
@@ -526,18 +507,15 @@ if selected_area:
     if st.button("Generate SASB-Compliant Disclosure Summary"):
         sasb_prompt = f"Generate a SASB-compliant disclosure summary for Metals & Mining based on data from {selected_area}. Cover key topics: GHG Emissions, Water Management, Waste (incl. tailings), Biodiversity, Community Relations, Labor Practices, and Business Ethics. Use available data and estimates."
         try:
-            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            sasb_response = model.generate_content(sasb_prompt)
-            st.session_state['sasb_report'] = sasb_response.text
             st.write("SASB-Compliant Disclosure Summary:")
-            st.write(st.session_state['sasb_report'])
+            st.session_state['sasb_report'] = write_ai_stream(sasb_prompt)
         except Exception as e:
             st.error(f"SASB Report Generation Error: {e}")
 
 uploaded_file = st.file_uploader("Upload your mining data file (Excel)", type=["xlsx"])
 
 if uploaded_file is not None:
+    st.session_state['dataset_hash'] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
     # Read the file using openpyxl
     wb = openpyxl.load_workbook(uploaded_file)
     sheets = wb.sheetnames
@@ -606,19 +584,30 @@ if uploaded_file is not None:
     st.write(f"Overall ESG Score: {esg_score:.2f}/10")
     st.session_state['esg_score'] = esg_score
 
-    # Extract full text content for AI analysis
-    content = ""
-    for sheet in wb:
-        content += f"Sheet: {sheet.title}\n"
-        for row in sheet.iter_rows(values_only=True):
-            content += ",".join([str(cell) for cell in row if cell is not None]) + "\n"
-    
-    # Truncate if too long to avoid token limits
-    if len(content) > 100000:
-        content = content[:100000] + "... (truncated)"
-    
-    # Incorporate selected area into prompt, with additional mining decision factors
-    prompt = f"""
+    # Workbooks too long for one prompt are analyzed map-reduce style: every
+    # sheet / row block is summarized in parallel (cached per block) and the
+    # prompt gets the combined summaries instead of the first rows only. The
+    # workbook text is only built when one of the AI buttons below needs it.
+    max_content_chars = DEFAULT_TOKEN_BUDGET * CHARS_PER_TOKEN
+
+    def workbook_lines():
+        return {sheet.title: [",".join([str(cell) for cell in row if cell is not None]) + "\n"
+                              for row in sheet.iter_rows(values_only=True)] for sheet in wb}
+
+    def workbook_text(sheet_lines):
+        return "".join(f"Sheet: {title}\n" + "".join(lines) for title, lines in sheet_lines.items())
+
+    def analysis_prompt():
+        # Incorporate selected area into prompt, with additional mining decision factors
+        content = workbook_text(workbook_lines())
+        if len(content) > max_content_chars:
+            saved_summaries = st.session_state.get('workbook_summaries')
+            if saved_summaries and saved_summaries[0] == st.session_state.get('dataset_hash', ""):
+                content = "Summaries of all rows, by sheet and row block:\n" + "\n\n".join(saved_summaries[1])
+            else:
+                st.warning(f"The workbook text ({len(content):,} characters) exceeds the prompt limit and was truncated; summarize all rows to analyze the full workbook.")
+                content = content[:max_content_chars] + "... (truncated)"
+        return f"""
     Analyze the following mining data from the Excel file in the context of {selected_area} along the Rio Grande Rift, including Basin and Range Province and Colorado Plateau influences. 
     Extract all information related to metals, ores, locations, geological characteristics, samples, compositions, and any other relevant metrics. 
     Provide analysis on what metals and ores are present (e.g., Platinum Group Metals, copper, zinc, etc.), where the data is related to (e.g., Las Cruces, New Mexico), 
@@ -629,69 +618,79 @@ if uploaded_file is not None:
     File content:
     {content}
     """
+
+    if st.button("Summarize All Rows for AI Analysis"):
+        sheet_lines = workbook_lines()
+        if len(workbook_text(sheet_lines)) <= max_content_chars:
+            st.info("The workbook fits in one prompt; no summaries are needed.")
+        else:
+            chunks = {}
+            for title, lines in sheet_lines.items():
+                chunks.update(sheet_chunks(title, len(lines), lambda start, stop, lines=lines: "".join(lines[start:stop])))
+            chunk_progress = st.progress(0.0, text=f"Summarizing {len(chunks)} data blocks...")
+            try:
+                options = ai_options()
+                del options['dataset']  # block summaries are keyed on the block text alone
+                st.session_state['workbook_summaries'] = (st.session_state.get('dataset_hash', ""), summarize_chunks(
+                    chunks, chunk_summary_prompt, combine_summaries_prompt, DEFAULT_TOKEN_BUDGET, provider="gemini",
+                    fallback=True, **options,
+                    on_progress=lambda done, total: chunk_progress.progress(done / total, text=f"Summarized {done} of {total} data blocks")))
+            except Exception as e:
+                st.error(f"Summarization Error: {e}")
     
     # OpenAI Analysis Section
     if st.button("Analyze with OpenAI"):
         try:
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            response = client.chat.completions.create(
-                model="gpt-4o",  # Or latest model
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=2000
-            )
-            st.session_state['openai_analysis'] = response.choices[0].message.content
             st.write("OpenAI Analysis:")
-            st.write(st.session_state['openai_analysis'])
+            st.session_state['openai_analysis'] = write_ai_stream(analysis_prompt(), provider="openai", max_tokens=2000)
         except Exception as e:
             st.error(f"OpenAI Error: {e}. Ensure API key is set.")
     
     # Google Gemini Analysis Section
     if st.button("Analyze with Google Gemini"):
         try:
-            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            response = model.generate_content(prompt)
-            st.session_state['gemini_analysis'] = response.text
             st.write("Google Gemini Analysis:")
-            st.write(st.session_state['gemini_analysis'])
+            st.session_state['gemini_analysis'] = write_ai_stream(analysis_prompt())
         except Exception as e:
             st.error(f"Gemini Error: {e}. Ensure API key is set.")
     
-    # xAI Grok Analysis Section (Hypothetical API - adjust per xAI docs)
+    # xAI Grok Analysis Section (OpenAI-compatible API; XAI_BASE_URL overrides the endpoint)
     if st.button("Analyze with xAI Grok"):
         try:
-            api_key = os.getenv("XAI_API_KEY")
-            url = "https://api.x.ai/v1/chat/completions"  # Hypothetical; check https://x.ai/api for actual
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            data = {
-                "model": "grok-4",  # Or appropriate model
-                "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": 2000
-            }
-            response = requests.post(url, headers=headers, json=data)
-            if response.status_code == 200:
-                result = response.json()
-                st.session_state['grok_analysis'] = result['choices'][0]['message']['content']
-                st.write("xAI Grok Analysis:")
-                st.write(st.session_state['grok_analysis'])
-            else:
-                st.error(f"xAI API Error: {response.status_code} - {response.text}")
+            st.write("xAI Grok Analysis:")
+            st.session_state['grok_analysis'] = write_ai_stream(analysis_prompt(), provider="xai", max_tokens=2000)
         except Exception as e:
             st.error(f"xAI Error: {e}. Ensure API key is set and endpoint is correct.")
 
+    # Multi-provider analysis: the prompt goes to every configured provider at
+    # once; either the first answer or all answers side by side
+    ai_router = default_router()
+    fan_out_mode = st.radio("Multi-provider mode", ["First answer", "All answers"], horizontal=True)
+    if st.button("Analyze with All Providers"):
+        providers = ai_router.available()
+        if not providers:
+            st.error("No AI provider API key found. Set OPENAI_API_KEY, GOOGLE_GEMINI_API_KEY or XAI_API_KEY.")
+        else:
+            try:
+                results = fan_out(analysis_prompt(), providers, first=fan_out_mode == "First answer", max_tokens=2000, **ai_options())
+                result_cols = st.columns(len(results))
+                for col, (name, result) in zip(result_cols, results.items()):
+                    with col:
+                        st.write(f"**{PROVIDER_LABELS.get(name, name)}**")
+                        if isinstance(result, BaseException):
+                            st.error(f"{PROVIDER_LABELS.get(name, name)} Error: {result}")
+                        else:
+                            st.session_state[f'{name}_fan_out_analysis'] = result
+                            st.write(result)
+            except Exception as e:
+                st.error(f"Multi-provider Error: {e}")
+
     # Additional: Search for Nearby Mines (Using Gemini as proxy for search)
     if st.button("Search Nearby Mines and Ownership in Selected Area"):
         search_prompt = f"Provide details on mines in {selected_area}, including metals/ores, owners, if for sale, production metrics, reserves, economic viability, regulations, environmental impacts."
         try:
-            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            response = model.generate_content(search_prompt)
-            st.session_state['mines_info'] = response.text
             st.write("Nearby Mines Information:")
-            st.write(st.session_state['mines_info'])
+            st.session_state['mines_info'] = write_ai_stream(search_prompt)
         except Exception as e:
             st.error(f"Search Error: {e}")
 
@@ -750,12 +749,8 @@ if uploaded_file is not None:
     if st.button("Generate Mining Analyst Report"):
         report_prompt = f"Generate a detailed mining analyst report for {selected_area}, structured as: Executive Summary, Introduction, Geological Analysis, Economic Evaluation (including ESG costs), Risks and Mitigation (with ESG focus), Recommendations. Incorporate MRDS, BLM, cost estimates, ESG factors, and competitor analysis."
         try:
-            genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-            model = genai.GenerativeModel('gemini-1.5-pro-latest')
-            report_response = model.generate_content(report_prompt)
-            st.session_state['analyst_report'] = report_response.text
             st.write("Mining Analyst Report:")
-            st.write(st.session_state['analyst_report'])
+            st.session_state['analyst_report'] = write_ai_stream(report_prompt)
         except Exception as e:
             st.error(f"Report Generation Error: {e}")
 
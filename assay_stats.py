@@ -0,0 +1,78 @@
+# ========================================
+# Assay Statistics Engine
+# ========================================
+# Coerces all assay columns once into a float matrix and computes counts,
+# quantiles and moments for every column in a single vectorized pass. The
+# resulting AssayStats object is shared by every section of the technical
+# report (statistics table, histograms, correlations, high-grade listings).
+import warnings
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+KEY_ELEMENTS = ['AU', 'AG', 'CU', 'ZN', 'PB', 'AS', 'NI', 'CO', 'AU_GPT', 'AG_GPT']
+QUANTILES = (0.0, 0.1, 0.5, 0.9, 1.0)
+
+
+def detect_assay_columns(df, key_elements=KEY_ELEMENTS):
+    keys = {e.upper() for e in key_elements}
+    return [col for col in df.select_dtypes(include='number').columns if str(col).upper() in keys]
+
+
+@dataclass
+class AssayStats:
+    columns: list
+    matrix: np.ndarray           # (rows, columns) float64, NaN where not numeric
+    counts: np.ndarray
+    quantiles: np.ndarray        # (len(QUANTILES), columns)
+    mean: np.ndarray
+    std: np.ndarray
+    _corr: pd.DataFrame = field(default=None, repr=False)
+
+    @property
+    def table(self):
+        q = dict(zip(QUANTILES, self.quantiles))
+        return pd.DataFrame({
+            'Element': [str(col).upper() for col in self.columns],
+            'n': self.counts,
+            'min': q[0.0], 'p10': q[0.1], 'p50': q[0.5], 'p90': q[0.9], 'max': q[1.0],
+            'mean': self.mean,
+        })
+
+    def records(self):
+        # Formatted rows for markdown tables and AI prompts; columns without
+        # any numeric values are left out
+        table = self.table[self.counts > 0].copy()
+        numeric = ['min', 'p10', 'p50', 'p90', 'max', 'mean']
+        table[numeric] = table[numeric].map(lambda v: f"{v:.4f}")
+        return table.to_dict('records')
+
+    def column(self, col):
+        values = self.matrix[:, self.columns.index(col)]
+        return values[~np.isnan(values)]
+
+    def corr(self):
+        # Pairwise-complete Pearson correlation, computed once on first use
+        if self._corr is None:
+            self._corr = pd.DataFrame(self.matrix, columns=self.columns).corr()
+        return self._corr
+
+    def top_positions(self, col, n=10):
+        # Row positions of the n highest values of `col`, highest first
+        values = self.matrix[:, self.columns.index(col)]
+        order = np.argsort(np.where(np.isnan(values), -np.inf, values), kind='stable')[::-1][:n]
+        return order[~np.isnan(values[order])]
+
+
+def compute_assay_stats(df, columns=None):
+    columns = list(columns) if columns is not None else detect_assay_columns(df)
+    matrix = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64) if columns else np.empty((len(df), 0))
+    counts = np.count_nonzero(~np.isnan(matrix), axis=0)
+    with warnings.catch_warnings():
+        # All-NaN columns produce NaN statistics rather than warnings
+        warnings.simplefilter('ignore', RuntimeWarning)
+        quantiles = np.nanquantile(matrix, QUANTILES, axis=0) if len(matrix) else np.full((len(QUANTILES), len(columns)), np.nan)
+        mean = np.nanmean(matrix, axis=0)
+        std = np.nanstd(matrix, axis=0, ddof=1)
+    return AssayStats(columns, matrix, counts, quantiles, mean, std)
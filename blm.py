@@ -0,0 +1,341 @@
+# ========================================
+# BLM Mining Claims (ArcGIS REST)
+# ========================================
+# Query helpers for the BLM NLSDB mining claims layer and a bulk harvester
+# that downloads every claim matching a filter. The harvester asks the layer
+# for the matching object IDs, fetches pages of IDs concurrently over one
+# pooled requests.Session, writes each page to its own Parquet part file and
+# checkpoints progress so an interrupted harvest resumes where it stopped.
+# Any ArcGIS-compatible endpoint (including a local stand-in) can be used by
+# passing its query URL or setting BLM_QUERY_URL. Interactive page queries go
+# through QueryCache, a TTL + LRU response cache with an optional disk tier,
+# and loaded pages accumulate in ClaimPages without re-copying earlier pages.
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ingest import CACHE_DIR
+
+# Override with a local ArcGIS stand-in for testing
+BLM_QUERY_URL = os.getenv("BLM_QUERY_URL", "https://gis.blm.gov/nlsdb/rest/services/Mining_Claims/MiningClaims/MapServer/1/query")
+HARVEST_DIR = os.path.join(CACHE_DIR, "blm_harvest")
+HARVEST_PAGE_SIZE = 1000
+HARVEST_WORKERS = 4
+REQUEST_TIMEOUT = 60
+QUERY_CACHE_DIR = os.path.join(CACHE_DIR, "blm_queries")
+QUERY_CACHE_TTL = 15 * 60
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def build_where(state_code="", county=""):
+    where_parts = []
+    if state_code:
+        where_parts.append(f"ADMIN_STATE = '{state_code.upper().replace(chr(39), '')}'")
+    if county:
+        where_parts.append(f"UPPER(COUNTY_NM) LIKE '%{county.upper().replace(chr(39), chr(39) * 2)}%'")
+    return " AND ".join(where_parts) if where_parts else "1=1"
+
+
+def make_session(pool_size=HARVEST_WORKERS, retries=3):
+    # One connection pool shared by all worker threads, with retry/backoff on
+    # throttling and transient server errors
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset(["GET", "POST"]))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def query_layer(session, url, params, timeout=REQUEST_TIMEOUT):
+    # POST keeps long objectIds lists out of the URL
+    response = session.post(url, data={**params, "f": "json"}, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    if "error" in data:
+        raise RuntimeError(f"ArcGIS error: {data['error'].get('message', data['error'])}")
+    return data
+
+
+def features_to_frame(features):
+    df = pd.DataFrame([feature['attributes'] for feature in features])
+    df.columns = [col.lower() for col in df.columns]
+    return df
+
+
+class QueryCache:
+    # Response cache keyed on the normalized query. Entries expire after `ttl`
+    # seconds; the memory tier is bounded by the serialized size of its
+    # entries and evicts least recently used first. With `disk_dir` set,
+    # responses are also written to disk and survive restarts.
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_bytes=QUERY_CACHE_MAX_BYTES, disk_dir=None):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(url, params):
+        normalized = {str(k): " ".join(str(v).split()) for k, v in params.items()}
+        return hashlib.sha256(json.dumps([url, normalized], sort_keys=True).encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _store(self, key, expires, size, payload):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (expires, size, payload)
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._bytes -= self._entries.pop(key)[1]
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path) as f:
+                    record = json.load(f)
+                if record["expires"] > now:
+                    with self._lock:
+                        self._store(key, record["expires"], os.path.getsize(path), record["payload"])
+                        self.hits += 1
+                        self.disk_hits += 1
+                    return record["payload"]
+                os.remove(path)
+            except (OSError, ValueError, KeyError):
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, payload):
+        expires = time.time() + self.ttl
+        text = json.dumps({"expires": expires, "payload": payload})
+        with self._lock:
+            self._store(key, expires, len(text), payload)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_text(path, text)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir:
+            shutil.rmtree(self.disk_dir, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self._bytes}
+
+
+class ClaimPages:
+    # Append-only store of loaded result pages, de-duplicated by cse_nr.
+    # Appending a page never copies earlier pages; readers take the first
+    # rows, selected columns or the pages one by one (iter_chunks).
+    def __init__(self):
+        self.pages = []
+        self._seen = set()
+        self._rows = 0
+
+    def append(self, df):
+        if 'cse_nr' in df.columns:
+            keys = df['cse_nr'].astype(str)
+            new = ~keys.isin(self._seen) & ~keys.duplicated()
+            df = df[new]
+            self._seen.update(keys[new])
+        if not df.empty:
+            self.pages.append(df.reset_index(drop=True))
+            self._rows += len(df)
+        return len(df)
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def empty(self):
+        return self._rows == 0
+
+    @property
+    def columns(self):
+        seen = {}
+        for page in self.pages:
+            seen.update(dict.fromkeys(page.columns))
+        return list(seen)
+
+    def iter_chunks(self):
+        yield from self.pages
+
+    def head(self, n=5):
+        rows, taken = 0, []
+        for page in self.pages:
+            if rows >= n:
+                break
+            taken.append(page.head(n - rows))
+            rows += len(taken[-1])
+        return pd.concat(taken, ignore_index=True) if taken else pd.DataFrame()
+
+    def select(self, columns):
+        # Concatenates only the requested columns across pages
+        parts = [page.reindex(columns=columns) for page in self.pages]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns)
+
+
+def _write_text(path, text):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _write_json(path, payload):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+class ClaimHarvester:
+    def __init__(self, where, url=BLM_QUERY_URL, out_dir=None, page_size=HARVEST_PAGE_SIZE,
+                 workers=HARVEST_WORKERS, session=None):
+        self.where = where
+        self.url = url
+        key = hashlib.sha256(f"{url}|{where}".encode()).hexdigest()[:16]
+        self.out_dir = out_dir or os.path.join(HARVEST_DIR, key)
+        self.page_size = page_size
+        self.workers = workers
+        self.session = session or make_session(workers)
+        self.plan_path = os.path.join(self.out_dir, "plan.json")
+        self.checkpoint_path = os.path.join(self.out_dir, "checkpoint.json")
+
+    def _plan(self):
+        # Object IDs give stable pages even if records are added mid-harvest;
+        # layers without ID support fall back to offset paging by count
+        try:
+            data = query_layer(self.session, self.url, {"where": self.where, "returnIdsOnly": "true"})
+            ids = sorted(data.get("objectIds") or [])
+            oid_field = data.get("objectIdFieldName", "OBJECTID")
+            pages = [ids[i:i + self.page_size] for i in range(0, len(ids), self.page_size)]
+            return {"mode": "ids", "oid_field": oid_field, "pages": pages, "total": len(ids)}
+        except (requests.RequestException, RuntimeError, ValueError):
+            data = query_layer(self.session, self.url, {"where": self.where, "returnCountOnly": "true"})
+            total = int(data.get("count", 0))
+            pages = list(range(0, total, self.page_size))
+            return {"mode": "offset", "pages": pages, "total": total}
+
+    def load_checkpoint(self):
+        # The page plan (which can hold hundreds of thousands of IDs) is written
+        # once; the checkpoint only records finished pages
+        if not (os.path.exists(self.plan_path) and os.path.exists(self.checkpoint_path)):
+            return None
+        with open(self.plan_path) as f:
+            plan = json.load(f)
+        if plan.get("where") != self.where or plan.get("url") != self.url:
+            return None
+        with open(self.checkpoint_path) as f:
+            done = json.load(f)
+        return plan, done
+
+    def _part_path(self, page_no):
+        return os.path.join(self.out_dir, f"part-{page_no:06d}.parquet")
+
+    def _fetch_page(self, plan, page_no):
+        page = plan["pages"][page_no]
+        if plan["mode"] == "ids":
+            params = {"objectIds": ",".join(str(i) for i in page), "outFields": "*", "returnGeometry": "false"}
+        else:
+            params = {"where": self.where, "outFields": "*", "returnGeometry": "false",
+                      "resultOffset": page, "resultRecordCount": self.page_size, "orderByFields": "CSE_NR"}
+        data = query_layer(self.session, self.url, params)
+        df = features_to_frame(data.get("features") or [])
+        tmp = self._part_path(page_no) + ".tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, self._part_path(page_no))
+        return page_no, len(df)
+
+    def run(self, progress=None):
+        # Returns the number of records harvested; safe to call again after an
+        # interruption, only missing pages are fetched
+        os.makedirs(self.out_dir, exist_ok=True)
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None:
+            plan = {"where": self.where, "url": self.url, **self._plan()}
+            done = {}
+            _write_json(self.plan_path, plan)
+            _write_json(self.checkpoint_path, done)
+        else:
+            plan, done = checkpoint
+        remaining = [i for i in range(len(plan["pages"]))
+                     if str(i) not in done or not os.path.exists(self._part_path(i))]
+
+        # After the first failed page the queued ones are cancelled, but pages
+        # already in flight are still checkpointed before the error is raised
+        error = None
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._fetch_page, plan, i) for i in remaining]
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                if future.exception() is not None:
+                    if error is None:
+                        error = future.exception()
+                        for pending in futures:
+                            pending.cancel()
+                    continue
+                page_no, n_records = future.result()
+                done[str(page_no)] = n_records
+                _write_json(self.checkpoint_path, done)
+                if progress:
+                    progress(len(done), len(plan["pages"]))
+        if error is not None:
+            raise error
+        return sum(done.values())
+
+    @property
+    def complete(self):
+        checkpoint = self.load_checkpoint()
+        return checkpoint is not None and len(checkpoint[1]) == len(checkpoint[0]["pages"])
+
+    def part_files(self):
+        if not os.path.isdir(self.out_dir):
+            return []
+        return sorted(os.path.join(self.out_dir, name) for name in os.listdir(self.out_dir)
+                      if name.startswith("part-") and name.endswith(".parquet"))
+
+    def iter_frames(self):
+        for path in self.part_files():
+            yield pd.read_parquet(path)
+
+    def read(self):
+        # Parts are read one by one so pages with all-null columns don't clash
+        frames = [df for df in self.iter_frames() if not df.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
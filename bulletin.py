@@ -0,0 +1,134 @@
+# ========================================
+# USGS Bulletin 1693 (Mineral Deposit Models)
+# ========================================
+# The bulletin PDF is downloaded and extracted once: per-page text and an
+# index of the descriptive model sections ("Model 9", "Model 39a", ...) are
+# stored under the cache directory. Summaries and PGM/REE model lookups then
+# read just the relevant sections from disk instead of re-downloading and
+# re-parsing the whole document.
+import json
+import os
+import re
+
+import requests
+
+from ingest import CACHE_DIR
+from pdf_text import extract_pdf
+
+BULLETIN_URL = os.getenv("BULLETIN_1693_URL", "https://pubs.usgs.gov/bul/1693/report.pdf")
+BULLETIN_DIR = os.path.join(CACHE_DIR, "bulletin1693")
+BULLETIN_CACHE_VERSION = 1
+DOWNLOAD_TIMEOUT = 120
+# Deposit model numbers relevant to the PGM and REE analyses
+PGM_MODELS = ['1', '2a', '2b', '5a', '5b', '7a', '8a', '9', '39a', '39b']
+REE_MODELS = ['10', '39c']
+# "Model 9", "MODEL 39a", "Descriptive model of ... (Model 2b)"; headings sit at
+# the start of a line
+MODEL_HEADING = re.compile(r'^\s*(?:descriptive\s+)?model\s+(\d{1,2}[a-e]?(?:\.\d+)?)\b[\s:.,;-]*(.*)$', re.IGNORECASE)
+# Pages with more headings than this are contents/index pages, not sections
+MAX_HEADINGS_PER_PAGE = 4
+
+
+def normalize_model(number):
+    return str(number).strip().lower().lstrip('0') or '0'
+
+
+def build_section_index(pages):
+    # model -> list of {title, start: [page, line], end: [page, line]}; a
+    # section runs until the next model heading
+    headings = []
+    for page_no, text in enumerate(pages):
+        lines = text.splitlines()
+        found = []
+        for line_no, line in enumerate(lines):
+            match = MODEL_HEADING.match(line)
+            if match:
+                # Bare "Model 9" headings take the following line as title
+                title = match.group(2).strip() or next((l.strip() for l in lines[line_no + 1:] if l.strip()), "")
+                found.append((page_no, line_no, match.group(1), title))
+        if len(found) <= MAX_HEADINGS_PER_PAGE:
+            headings += found
+    index = {}
+    for i, (page_no, line_no, model, title) in enumerate(headings):
+        end = [headings[i + 1][0], headings[i + 1][1]] if i + 1 < len(headings) else [len(pages), 0]
+        index.setdefault(normalize_model(model), []).append({
+            'title': title,
+            'start': [page_no, line_no],
+            'end': end,
+        })
+    return index
+
+
+class Bulletin:
+    def __init__(self, pages, sections):
+        self.pages = pages
+        self.sections = sections
+
+    def models(self):
+        return sorted(self.sections, key=lambda m: (int(re.match(r'\d+', m).group()), m))
+
+    def title(self, model):
+        entries = self.sections.get(normalize_model(model), [])
+        return next((entry['title'] for entry in entries if entry['title']), "")
+
+    def _slice(self, start, end):
+        (first_page, first_line), (last_page, last_line) = start, end
+        parts = []
+        for page_no in range(first_page, min(last_page, len(self.pages) - 1) + 1):
+            lines = self.pages[page_no].splitlines()
+            lo = first_line if page_no == first_page else 0
+            hi = last_line if page_no == last_page else len(lines)
+            parts.append("\n".join(lines[lo:hi]))
+        return "\n".join(part for part in parts if part)
+
+    def section_text(self, model, max_chars=None):
+        text = "\n\n".join(self._slice(entry['start'], entry['end'])
+                           for entry in self.sections.get(normalize_model(model), []))
+        return text[:max_chars] if max_chars else text
+
+    def models_text(self, models, max_chars=12000):
+        # Sections of several models, sharing the character budget evenly
+        found = [m for m in map(normalize_model, models) if m in self.sections]
+        if not found:
+            return ""
+        per_model = max_chars // len(found)
+        return "\n\n".join(f"[Model {m}]\n{self.section_text(m, per_model)}" for m in found)
+
+
+def _cache_paths(directory):
+    return (os.path.join(directory, f"pages_v{BULLETIN_CACHE_VERSION}.json"),
+            os.path.join(directory, f"sections_v{BULLETIN_CACHE_VERSION}.json"))
+
+
+def is_cached(directory=BULLETIN_DIR):
+    return all(os.path.exists(path) for path in _cache_paths(directory))
+
+
+def extract_pages(pdf_bytes):
+    # Parallel page extraction; the bulletin keeps its own cache below
+    return extract_pdf(pdf_bytes, name="bulletin1693", tables=False, use_cache=False).page_texts
+
+
+def load_bulletin(url=BULLETIN_URL, directory=BULLETIN_DIR, pdf_bytes=None):
+    # Reads the cached extraction, or downloads (unless `pdf_bytes` is given),
+    # extracts and indexes the bulletin once and caches the result
+    pages_path, sections_path = _cache_paths(directory)
+    if is_cached(directory):
+        with open(pages_path) as f:
+            pages = json.load(f)
+        with open(sections_path) as f:
+            return Bulletin(pages, json.load(f))
+
+    if pdf_bytes is None:
+        response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        pdf_bytes = response.content
+    pages = extract_pages(pdf_bytes)
+    sections = build_section_index(pages)
+
+    os.makedirs(directory, exist_ok=True)
+    for path, payload in ((pages_path, pages), (sections_path, sections)):
+        with open(path + ".tmp", 'w') as f:
+            json.dump(payload, f)
+        os.replace(path + ".tmp", path)
+    return Bulletin(pages, sections)
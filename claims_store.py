@@ -0,0 +1,207 @@
+# ========================================
+# Local BLM Claims Mirror
+# ========================================
+# SQLite mirror of BLM mining claims, populated by the bulk harvester and kept
+# current with incremental delta syncs (or full resyncs on layers without an
+# edit-date field). The indexed columns (state, county,
+# disposition, claimant) answer the app's search and pagination locally; the
+# full attribute record of every claim is kept as JSON.
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+
+import pandas as pd
+
+from blm import BLM_QUERY_URL, HARVEST_DIR, ClaimHarvester, build_where
+from ingest import CACHE_DIR
+
+CLAIMS_DB_PATH = os.path.join(CACHE_DIR, "blm_claims.sqlite")
+# Edit-tracking fields seen on BLM/ArcGIS layers, in order of preference
+EDIT_FIELDS = ["last_edited_date", "edit_date", "editdate", "last_updt_dt", "modified_date"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS claims (
+    cse_nr TEXT PRIMARY KEY,
+    admin_state TEXT,
+    county_nm TEXT,
+    cse_disp TEXT,
+    claimant_name TEXT,
+    last_edited INTEGER,
+    attrs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_claims_state_nr ON claims (admin_state, cse_nr);
+CREATE INDEX IF NOT EXISTS idx_claims_state_county ON claims (admin_state, county_nm);
+CREATE INDEX IF NOT EXISTS idx_claims_state_disp ON claims (admin_state, cse_disp);
+CREATE INDEX IF NOT EXISTS idx_claims_claimant ON claims (claimant_name);
+CREATE TABLE IF NOT EXISTS sync_state (
+    admin_state TEXT PRIMARY KEY,
+    edit_field TEXT,
+    last_edited INTEGER,
+    records INTEGER,
+    synced_at TEXT
+);
+"""
+
+UPSERT = """
+INSERT INTO claims (cse_nr, admin_state, county_nm, cse_disp, claimant_name, last_edited, attrs)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (cse_nr) DO UPDATE SET
+    admin_state = excluded.admin_state, county_nm = excluded.county_nm, cse_disp = excluded.cse_disp,
+    claimant_name = excluded.claimant_name, last_edited = excluded.last_edited, attrs = excluded.attrs
+"""
+
+
+def _edit_field(columns):
+    return next((field for field in EDIT_FIELDS if field in columns), None)
+
+
+class ClaimStore:
+    def __init__(self, path=CLAIMS_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per operation; safe across Streamlit threads
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def upsert(self, df):
+        if df.empty or 'cse_nr' not in df.columns:
+            return 0
+        edit_field = _edit_field(df.columns)
+        records = df.astype(object).where(df.notna(), None).to_dict('records')
+
+        def text(record, key):
+            value = record.get(key)
+            return None if value is None else str(value).upper()
+
+        rows = [(
+            str(record['cse_nr']),
+            text(record, 'admin_state'),
+            text(record, 'county_nm'),
+            text(record, 'cse_disp'),
+            text(record, 'claimant_name'),
+            record.get(edit_field) if edit_field else None,
+            json.dumps(record, default=str),
+        ) for record in records if record.get('cse_nr') is not None]
+        with self._connect() as conn:
+            conn.executemany(UPSERT, rows)
+        return len(rows)
+
+    def _filters(self, state_code="", county="", disposition="", claimant=""):
+        clauses, params = [], []
+        if state_code:
+            clauses.append("admin_state = ?")
+            params.append(state_code.upper())
+        if county:
+            clauses.append("county_nm LIKE ?")
+            params.append(f"%{county.upper()}%")
+        if disposition:
+            clauses.append("cse_disp = ?")
+            params.append(disposition.upper())
+        if claimant:
+            clauses.append("claimant_name LIKE ?")
+            params.append(f"%{claimant.upper()}%")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, state_code="", county="", disposition="", claimant="", offset=0, limit=500):
+        # Same ordering as the live API (CSE_NR DESC) so paging is identical
+        where, params = self._filters(state_code, county, disposition, claimant)
+        sql = f"SELECT attrs FROM claims{where} ORDER BY cse_nr DESC LIMIT ? OFFSET ?"
+        with self._connect() as conn:
+            rows = conn.execute(sql, params + [int(limit), int(offset)]).fetchall()
+        return pd.DataFrame([json.loads(attrs) for (attrs,) in rows])
+
+    def count(self, state_code="", county="", disposition="", claimant=""):
+        where, params = self._filters(state_code, county, disposition, claimant)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM claims{where}", params).fetchone()[0]
+
+    def coordinates(self, state_code=""):
+        # cse_nr/latitude/longitude of mirrored claims that carry coordinates,
+        # read straight out of the stored attribute JSON
+        where, params = self._filters(state_code)
+        located = "json_extract(attrs, '$.latitude') IS NOT NULL AND json_extract(attrs, '$.longitude') IS NOT NULL"
+        where = f"{where} AND {located}" if where else f" WHERE {located}"
+        sql = f"SELECT cse_nr, json_extract(attrs, '$.latitude'), json_extract(attrs, '$.longitude') FROM claims{where}"
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=['cse_nr', 'latitude', 'longitude'])
+
+    def sync_state(self, state_code):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT edit_field, last_edited, records, synced_at FROM sync_state WHERE admin_state = ?",
+                (state_code.upper(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(["edit_field", "last_edited", "records", "synced_at"], row))
+
+    def _delta_where(self, state_code, state):
+        # Without an edit field there is no reliable "changed since" filter
+        # (serial numbers do not sort by recording date), so the whole state
+        # is harvested again
+        base = build_where(state_code)
+        if state["edit_field"] and state["last_edited"] is not None:
+            stamp = datetime.datetime.fromtimestamp(state["last_edited"] / 1000, datetime.timezone.utc)
+            return f"{base} AND {state['edit_field'].upper()} > TIMESTAMP '{stamp:%Y-%m-%d %H:%M:%S}'"
+        return base
+
+    def sync(self, state_code, url=BLM_QUERY_URL, workers=4, page_size=1000, progress=None):
+        # First sync harvests the whole state; later syncs only fetch claims
+        # edited since the previous one, or the whole state again when the
+        # layer has no edit field. A full harvest also drops claims the layer
+        # no longer returns; delta syncs cannot see removals. Returns records
+        # upserted.
+        state_code = state_code.upper()
+        previous = self.sync_state(state_code)
+        where = self._delta_where(state_code, previous) if previous else build_where(state_code)
+        full = where == build_where(state_code)
+        out_dir = None
+        if previous and full:
+            # A full resync gets its own harvest directory so the finished
+            # first harvest of the state is not resumed as if it were this one
+            out_dir = os.path.join(HARVEST_DIR, f"resync-{state_code}")
+        harvester = ClaimHarvester(where, url=url, out_dir=out_dir, page_size=page_size, workers=workers)
+        harvester.run(progress=progress)
+
+        upserted, harvested = 0, set()
+        edit_field = previous["edit_field"] if previous else None
+        for frame in harvester.iter_frames():
+            upserted += self.upsert(frame)
+            edit_field = edit_field or _edit_field(frame.columns)
+            if full and 'cse_nr' in frame.columns:
+                harvested.update(frame['cse_nr'].dropna().astype(str))
+        # Delta and resync harvests are disposable once merged
+        if previous:
+            shutil.rmtree(harvester.out_dir, ignore_errors=True)
+
+        with self._connect() as conn:
+            if harvested:
+                conn.execute("CREATE TEMP TABLE harvested (cse_nr TEXT PRIMARY KEY)")
+                conn.executemany("INSERT OR IGNORE INTO harvested VALUES (?)", ((nr,) for nr in harvested))
+                conn.execute("DELETE FROM claims WHERE admin_state = ? AND cse_nr NOT IN (SELECT cse_nr FROM harvested)",
+                             (state_code,))
+            last_edited, records = conn.execute(
+                "SELECT MAX(last_edited), COUNT(*) FROM claims WHERE admin_state = ?", (state_code,)
+            ).fetchone()
+            # Named columns so mirrors created with the older max_cse_nr column still work
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (admin_state, edit_field, last_edited, records, synced_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (state_code, edit_field, last_edited, records,
+                 datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'))
+            )
+        return upserted
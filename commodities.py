@@ -0,0 +1,113 @@
+# ========================================
+# Commodity Classification
+# ========================================
+# Classifies commodity strings (MRDS commod1-3, text columns of uploaded
+# data) as platinum-group metals, rare earth elements and USGS critical
+# minerals. Each class is one compiled word-boundary regex, and it is only
+# evaluated on the distinct normalized values of a column, so 300k MRDS rows
+# with a few thousand distinct commodity lists cost a few thousand matches.
+# Uploaded assay sheets are also classified by element-symbol columns that
+# carry an assay unit or method (PT_PPB, Y (ppm), ND_ICP, ...) and hold
+# positive values; bare names like Y or IN are coordinates or IDs too often.
+import re
+
+import numpy as np
+import pandas as pd
+
+PGM_TERMS = ['platinum', 'palladium', 'rhodium', 'iridium', 'osmium', 'ruthenium', 'pge', 'pgm',
+             'platinum group metals', 'platinum group elements']
+REE_TERMS = ['lanthanum', 'cerium', 'praseodymium', 'neodymium', 'samarium', 'europium', 'gadolinium', 'terbium',
+             'dysprosium', 'holmium', 'erbium', 'thulium', 'ytterbium', 'lutetium', 'yttrium', 'scandium',
+             'ree', 'rare earth', 'rare earth elements', 'rare earth oxides', 'reo', 'monazite', 'bastnaesite', 'xenotime']
+# USGS 2022 list of critical minerals (PGM and REE members included)
+CRITICAL_TERMS = ['aluminum', 'aluminium', 'bauxite', 'antimony', 'arsenic', 'barite', 'beryllium', 'bismuth', 'cesium',
+                  'chromium', 'chromite', 'cobalt', 'fluorspar', 'fluorite', 'gallium', 'germanium', 'graphite', 'hafnium',
+                  'indium', 'lithium', 'magnesium', 'manganese', 'nickel', 'niobium', 'columbium', 'rubidium', 'tantalum',
+                  'tellurium', 'tin', 'titanium', 'tungsten', 'vanadium', 'zinc', 'zirconium'] + PGM_TERMS + REE_TERMS
+COMMODITY_CLASSES = {'pgm': PGM_TERMS, 'ree': REE_TERMS, 'critical': CRITICAL_TERMS}
+
+PGM_SYMBOLS = ['PT', 'PD', 'RH', 'IR', 'OS', 'RU', 'PGE', 'PGM', '3E', '4E']
+REE_SYMBOLS = ['LA', 'CE', 'PR', 'ND', 'SM', 'EU', 'GD', 'TB', 'DY', 'HO', 'ER', 'TM', 'YB', 'LU', 'Y', 'SC',
+               'TREO', 'TREE', 'REO']
+CRITICAL_SYMBOLS = ['AL', 'SB', 'AS', 'BA', 'BE', 'BI', 'CS', 'CR', 'CO', 'F', 'GA', 'GE', 'HF', 'IN', 'LI', 'MG', 'MN',
+                    'NI', 'NB', 'RB', 'TA', 'TE', 'SN', 'TI', 'W', 'V', 'ZN', 'ZR'] + PGM_SYMBOLS + REE_SYMBOLS
+ELEMENT_CLASSES = {'pgm': PGM_SYMBOLS, 'ree': REE_SYMBOLS, 'critical': CRITICAL_SYMBOLS}
+# Unit/method suffixes an assay column name must end with; stripped before
+# symbol lookup
+ASSAY_SUFFIX = re.compile(r'(?:[_\s\-(]+(?:ppm|ppb|pct|percent|gpt|g/t|opt|oz/t|fa|icp|aa)\)?|\s*\(?%\)?)+$',
+                          re.IGNORECASE)
+# Coordinate and identifier names never read as element columns
+NON_ASSAY_COLUMNS = {'X', 'Y', 'Z', 'EAST', 'EASTING', 'NORTH', 'NORTHING', 'ELEV', 'ELEVATION', 'RL', 'ID',
+                     'HOLE_ID', 'SAMPLE_ID', 'FROM', 'TO', 'LAT', 'LATITUDE', 'LON', 'LONG', 'LONGITUDE'}
+
+
+def _compile(terms):
+    # Longest alternatives first; optional plural "s"; word boundaries so
+    # "ree" does not match "green" nor "tin" match "platinum"
+    alternatives = sorted({re.escape(term).replace(r'\ ', r'[\s\-]+') for term in terms}, key=len, reverse=True)
+    return re.compile(r'\b(?:' + '|'.join(alternatives) + r')s?\b')
+
+
+MATCHERS = {name: _compile(terms) for name, terms in COMMODITY_CLASSES.items()}
+
+
+def normalize_commodity(series):
+    return series.astype(object).where(series.notna(), "").astype(str).str.lower().str.replace(r'[_/]+', ' ', regex=True)
+
+
+def classify_values(series):
+    # Boolean frame (one column per class) for a single text column
+    codes, uniques = pd.factorize(normalize_commodity(pd.Series(series)))
+    uniques = pd.Series(uniques, dtype=object)
+    classes = {}
+    for name, matcher in MATCHERS.items():
+        hits = uniques.str.contains(matcher, na=False).to_numpy(dtype=bool)
+        classes[name] = hits[codes] if len(codes) else np.zeros(0, dtype=bool)
+    return pd.DataFrame(classes, index=getattr(series, 'index', None))
+
+
+def classify_sites(df, columns=('commod1', 'commod2', 'commod3')):
+    # Per-site class flags over the commodity columns that exist in `df`
+    columns = [col for col in columns if col in df.columns]
+    classes = pd.DataFrame(False, index=df.index, columns=list(COMMODITY_CLASSES))
+    for col in columns:
+        classes |= classify_values(df[col])
+    return classes
+
+
+def element_symbol(column):
+    # "PD_PPB" -> "PD", "Y (ppm)" -> "Y"; "" for names without an assay unit
+    name = str(column).strip()
+    if name.upper() in NON_ASSAY_COLUMNS:
+        return ""
+    symbol = ASSAY_SUFFIX.sub('', name).strip().upper()
+    return symbol if symbol != name.upper() else ""
+
+
+def classify_columns(df):
+    # class -> numeric columns named after an element of that class that hold
+    # at least one positive value
+    numeric = df.select_dtypes(include='number')
+    positive = numeric.columns[(numeric > 0).any().to_numpy()] if len(numeric.columns) else []
+    symbols = {col: element_symbol(col) for col in positive}
+    return {name: [col for col, symbol in symbols.items() if symbol in set(members)]
+            for name, members in ELEMENT_CLASSES.items()}
+
+
+def classify_uploaded(df):
+    # Flags for an uploaded sheet from element columns and any text column
+    # mentioning a commodity of the class; returns {class: [evidence columns]}
+    evidence = classify_columns(df)
+    for col in df.select_dtypes(exclude='number').columns:
+        hits = classify_values(df[col]).any()
+        for name in COMMODITY_CLASSES:
+            if hits[name]:
+                evidence[name].append(col)
+    return evidence
+
+
+def commodity_flags(classes):
+    # {'pgm_present': bool, 'ree_present': bool, 'critical_present': bool}
+    if isinstance(classes, dict):
+        return {f"{name}_present": bool(classes.get(name)) for name in COMMODITY_CLASSES}
+    return {f"{name}_present": bool(classes[name].any()) for name in COMMODITY_CLASSES}
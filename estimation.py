@@ -0,0 +1,427 @@
+# ========================================
+# Resource Estimation Engines
+# ========================================
+# Inverse-distance weighting backed by a KD-tree that is built once per
+# dataset/value column and reused for every grid evaluation. Grids are
+# evaluated in chunks with fully vectorized neighbour weighting. 3D block
+# models are split into tiles evaluated across a process pool, with finished
+# tiles streamed straight to a Parquet file. Ordinary kriging uses the same
+# tree for neighbourhood-limited, batched kriging systems.
+import math
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import curve_fit
+from scipy.spatial import cKDTree
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON = 111.320
+CHUNK_SIZE = 65536
+# Distances below this are treated as exact hits on a sample
+EXACT_DISTANCE = 1e-9
+
+
+def lonlat_to_km(lon, lat, lat0):
+    # Local equirectangular projection; accurate enough for deposit-scale grids
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    x = lon * KM_PER_DEG_LON * math.cos(math.radians(lat0))
+    y = lat * KM_PER_DEG_LAT
+    return np.column_stack([x, y])
+
+
+def km_to_lonlat(x, y, lat0):
+    lon = np.asarray(x, dtype=float) / (KM_PER_DEG_LON * math.cos(math.radians(lat0)))
+    lat = np.asarray(y, dtype=float) / KM_PER_DEG_LAT
+    return lon, lat
+
+
+def _sector_filter(coords, targets, idx, valid, sectors, max_neighbors):
+    # Keeps at most ceil(max_neighbors / sectors) of the nearest samples in each
+    # angular sector (in the XY plane) around every target
+    per_sector = math.ceil(max_neighbors / sectors)
+    offsets = coords[idx, :2] - targets[:, None, :2]
+    angle = np.arctan2(offsets[..., 1], offsets[..., 0])
+    sector = ((angle + np.pi) * (sectors / (2 * np.pi))).astype(np.int8) % sectors
+    keep = np.zeros_like(valid)
+    for s in range(sectors):
+        in_sector = valid & (sector == s)
+        # Neighbours come back sorted by distance, so a running count is the rank
+        keep |= in_sector & (np.cumsum(in_sector, axis=1, dtype=np.int16) <= per_sector)
+    return keep
+
+
+class IDWEstimator:
+    def __init__(self, coords, values):
+        coords = np.asarray(coords, dtype=float)
+        values = np.asarray(values, dtype=float)
+        mask = np.isfinite(coords).all(axis=1) & np.isfinite(values)
+        self.coords = coords[mask]
+        self.values = values[mask]
+        if len(self.values) == 0:
+            raise ValueError("No samples with finite coordinates and values")
+        self.tree = cKDTree(self.coords)
+
+    def __len__(self):
+        return len(self.values)
+
+    def estimate(self, targets, power=2.0, radius=None, max_neighbors=16, min_neighbors=1,
+                 sectors=1, chunk_size=CHUNK_SIZE, workers=-1):
+        # Returns (estimates, neighbour counts); targets with fewer than
+        # min_neighbors samples in range are NaN
+        targets = np.atleast_2d(np.asarray(targets, dtype=float))
+        estimates = np.full(len(targets), np.nan)
+        counts = np.zeros(len(targets), dtype=np.int32)
+        for start in range(0, len(targets), chunk_size):
+            stop = start + chunk_size
+            estimates[start:stop], counts[start:stop] = self._estimate_chunk(
+                targets[start:stop], power, radius, max_neighbors, min_neighbors, sectors, workers
+            )
+        return estimates, counts
+
+    def _estimate_chunk(self, targets, power, radius, max_neighbors, min_neighbors, sectors, workers):
+        n = len(self.values)
+        # Sector search needs a wider candidate pool to fill every sector
+        k = min(max_neighbors * (sectors if sectors > 1 else 1), n)
+        dist, idx = self.tree.query(
+            targets, k=k, distance_upper_bound=radius if radius else np.inf, workers=workers
+        )
+        if k == 1:
+            dist, idx = dist[:, None], idx[:, None]
+        valid = np.isfinite(dist)
+        idx = np.where(valid, idx, 0)
+
+        if sectors > 1:
+            valid = _sector_filter(self.coords, targets, idx, valid, sectors, max_neighbors)
+            valid &= np.cumsum(valid, axis=1) <= max_neighbors
+
+        values = self.values[idx]
+        exact = valid & (dist <= EXACT_DISTANCE)
+        with np.errstate(divide='ignore'):
+            weights = np.where(valid & ~exact, 1.0 / np.where(valid, dist, 1.0) ** power, 0.0)
+        weight_sum = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            estimates = (weights * values).sum(axis=1) / weight_sum
+
+        has_exact = exact.any(axis=1)
+        if has_exact.any():
+            first = exact[has_exact].argmax(axis=1)
+            estimates[has_exact] = values[has_exact, first]
+
+        counts = valid.sum(axis=1)
+        estimates[counts < max(min_neighbors, 1)] = np.nan
+        return estimates, counts
+
+    def estimate_grid(self, x_range, y_range, nx, ny, **kwargs):
+        # Regular nx-by-ny grid over the given extents; result is (ny, nx)
+        xs = np.linspace(x_range[0], x_range[1], nx)
+        ys = np.linspace(y_range[0], y_range[1], ny)
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        targets = np.column_stack([grid_x.ravel(), grid_y.ravel()])
+        estimates, counts = self.estimate(targets, **kwargs)
+        return grid_x, grid_y, estimates.reshape(ny, nx), counts.reshape(ny, nx)
+
+
+# ========================================
+# 3D Block Model Estimation
+# ========================================
+BLOCK_TILE_SIZE = 250000
+BLOCK_SCHEMA_FIELDS = [
+    ("ix", "int32"), ("iy", "int32"), ("iz", "int32"),
+    ("x", "float64"), ("y", "float64"), ("z", "float64"),
+    ("estimate", "float64"), ("n_samples", "int32"),
+]
+
+
+def drillhole_samples(df, value_col):
+    # Sample points at interval midpoints below the collar. Holes are treated
+    # as vertical (no downhole survey); collar coordinates missing on interval
+    # rows are filled from the first row of the same hole. Coordinates are
+    # returned in metres: (x, y, z) with z negative downwards.
+    data = pd.DataFrame({
+        'HOLE_ID': df['HOLE_ID'],
+        'FROM': pd.to_numeric(df['FROM'], errors='coerce'),
+        'TO': pd.to_numeric(df['TO'], errors='coerce'),
+        'LATITUDE': pd.to_numeric(df['LATITUDE'], errors='coerce'),
+        'LONGITUDE': pd.to_numeric(df['LONGITUDE'], errors='coerce'),
+        'VALUE': pd.to_numeric(df[value_col], errors='coerce'),
+    })
+    collars = data.groupby('HOLE_ID')[['LATITUDE', 'LONGITUDE']].transform('first')
+    data[['LATITUDE', 'LONGITUDE']] = data[['LATITUDE', 'LONGITUDE']].fillna(collars)
+    data = data.dropna()
+    lat0 = float(data['LATITUDE'].mean()) if len(data) else 0.0
+    xy = lonlat_to_km(data['LONGITUDE'], data['LATITUDE'], lat0) * 1000.0
+    z = -(data['FROM'].to_numpy() + data['TO'].to_numpy()) / 2.0
+    return np.column_stack([xy, z]), data['VALUE'].to_numpy(dtype=float), lat0
+
+
+@dataclass
+class BlockGrid:
+    origin: tuple   # minimum corner (x, y, z) in metres
+    size: tuple     # block dimensions (dx, dy, dz) in metres
+    shape: tuple    # number of blocks (nx, ny, nz)
+
+    @classmethod
+    def covering(cls, coords, size):
+        lo = coords.min(axis=0)
+        hi = coords.max(axis=0)
+        shape = tuple(int(n) for n in np.maximum(np.ceil((hi - lo) / np.asarray(size, dtype=float)), 1))
+        return cls(origin=tuple(float(v) for v in lo), size=tuple(float(v) for v in size), shape=shape)
+
+    @property
+    def n_blocks(self):
+        return int(np.prod(self.shape))
+
+    def tiles(self, tile_size=BLOCK_TILE_SIZE):
+        for start in range(0, self.n_blocks, tile_size):
+            yield start, min(start + tile_size, self.n_blocks)
+
+    def centroids(self, start, stop):
+        nx, ny, nz = self.shape
+        # z varies slowest, so each tile covers whole or partial benches
+        iz, iy, ix = np.unravel_index(np.arange(start, stop), (nz, ny, nx))
+        index = np.column_stack([ix, iy, iz]).astype(np.int32)
+        centres = np.asarray(self.origin) + (index + 0.5) * np.asarray(self.size)
+        return index, centres
+
+
+_block_estimator = None
+
+
+def _init_block_worker(coords, values):
+    # Each worker builds its own KD-tree once and reuses it for every tile
+    global _block_estimator
+    _block_estimator = IDWEstimator(coords, values)
+
+
+def _estimate_block_tile(grid, start, stop, params):
+    index, centres = grid.centroids(start, stop)
+    estimates, counts = _block_estimator.estimate(centres, workers=1, **params)
+    keep = np.isfinite(estimates)
+    return stop - start, index[keep], centres[keep], estimates[keep], counts[keep]
+
+
+def _tile_table(index, centres, estimates, counts):
+    columns = {
+        "ix": index[:, 0], "iy": index[:, 1], "iz": index[:, 2],
+        "x": centres[:, 0], "y": centres[:, 1], "z": centres[:, 2],
+        "estimate": estimates, "n_samples": counts.astype(np.int32),
+    }
+    return pa.table({name: pa.array(columns[name], type=dtype) for name, dtype in BLOCK_SCHEMA_FIELDS})
+
+
+def run_block_model(coords, values, grid, out_path, params, tile_size=BLOCK_TILE_SIZE,
+                    workers=None, progress=None):
+    # Estimates every block in `grid` with IDW and writes estimated blocks to
+    # `out_path` as tiles finish. Only a bounded window of tiles is in flight,
+    # so memory use does not grow with the number of blocks.
+    if pa is None:
+        raise RuntimeError("pyarrow is required for block model output")
+    workers = workers or os.cpu_count() or 1
+    schema = pa.schema([(name, dtype) for name, dtype in BLOCK_SCHEMA_FIELDS])
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    tmp_path = out_path + ".partial"
+    processed = estimated = 0
+    total = 0.0
+
+    context = multiprocessing.get_context("spawn")
+    with pq.ParquetWriter(tmp_path, schema) as writer, ProcessPoolExecutor(
+        max_workers=workers, mp_context=context,
+        initializer=_init_block_worker, initargs=(coords, values)
+    ) as pool:
+        tiles = grid.tiles(tile_size)
+        pending = set()
+        while True:
+            for start, stop in tiles:
+                pending.add(pool.submit(_estimate_block_tile, grid, start, stop, params))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                n_tile, index, centres, estimates, counts = future.result()
+                if len(estimates):
+                    writer.write_table(_tile_table(index, centres, estimates, counts))
+                processed += n_tile
+                estimated += len(estimates)
+                total += float(estimates.sum())
+                if progress:
+                    progress(processed, grid.n_blocks)
+    os.replace(tmp_path, out_path)
+    return {
+        "blocks": grid.n_blocks,
+        "estimated": estimated,
+        "mean": total / estimated if estimated else float("nan"),
+        "path": out_path,
+    }
+
+
+# ========================================
+# Variogram and Ordinary Kriging
+# ========================================
+# Pairs are found with a KD-tree on at most this many (randomly chosen) samples
+VARIOGRAM_MAX_SAMPLES = 3000
+KRIGING_CHUNK_SIZE = 4096
+
+
+def _spherical(h, nugget, sill, rng):
+    r = np.minimum(h / rng, 1.0)
+    return nugget + sill * (1.5 * r - 0.5 * r ** 3)
+
+
+def _exponential(h, nugget, sill, rng):
+    return nugget + sill * (1.0 - np.exp(-3.0 * h / rng))
+
+
+def _gaussian(h, nugget, sill, rng):
+    return nugget + sill * (1.0 - np.exp(-3.0 * (h / rng) ** 2))
+
+
+VARIOGRAM_MODELS = {"spherical": _spherical, "exponential": _exponential, "gaussian": _gaussian}
+
+
+@dataclass
+class ExperimentalVariogram:
+    lags: np.ndarray     # mean pair distance per bin
+    gamma: np.ndarray    # semivariance per bin
+    counts: np.ndarray   # number of pairs per bin
+    lag_size: float
+
+
+@dataclass
+class Variogram:
+    model: str
+    nugget: float
+    sill: float          # partial sill (total sill = nugget + sill)
+    range: float
+
+    def __call__(self, h):
+        h = np.asarray(h, dtype=float)
+        return np.where(h > 0, VARIOGRAM_MODELS[self.model](h, self.nugget, self.sill, self.range), 0.0)
+
+
+def experimental_variogram(coords, values, lag_size=None, n_lags=15, max_samples=VARIOGRAM_MAX_SAMPLES, seed=0):
+    coords = np.asarray(coords, dtype=float)
+    values = np.asarray(values, dtype=float)
+    mask = np.isfinite(coords).all(axis=1) & np.isfinite(values)
+    coords, values = coords[mask], values[mask]
+    if len(values) > max_samples:
+        pick = np.random.default_rng(seed).choice(len(values), max_samples, replace=False)
+        coords, values = coords[pick], values[pick]
+    if lag_size is None:
+        # Half the extent diagonal spread over n_lags bins
+        lag_size = float(np.linalg.norm(coords.max(axis=0) - coords.min(axis=0))) / 2.0 / n_lags
+    pairs = cKDTree(coords).query_pairs(r=lag_size * n_lags, output_type='ndarray')
+    if len(pairs) == 0:
+        raise ValueError("No sample pairs within the variogram range")
+    dist = np.linalg.norm(coords[pairs[:, 0]] - coords[pairs[:, 1]], axis=1)
+    semivar = 0.5 * (values[pairs[:, 0]] - values[pairs[:, 1]]) ** 2
+    bins = np.minimum((dist / lag_size).astype(int), n_lags - 1)
+    counts = np.bincount(bins, minlength=n_lags)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lags = np.bincount(bins, weights=dist, minlength=n_lags) / counts
+        gamma = np.bincount(bins, weights=semivar, minlength=n_lags) / counts
+    keep = counts > 0
+    return ExperimentalVariogram(lags[keep], gamma[keep], counts[keep], lag_size)
+
+
+def fit_variogram(experimental, model="spherical"):
+    func = VARIOGRAM_MODELS[model]
+    lags, gamma = experimental.lags, experimental.gamma
+    max_lag = float(lags.max())
+    guess = [float(gamma.min()), float(max(gamma.max() - gamma.min(), 1e-12)), max_lag / 2.0]
+    bounds = ([0.0, 0.0, 1e-9], [np.inf, np.inf, max_lag * 10.0])
+    try:
+        # Bins with more pairs are weighted more heavily
+        params, _ = curve_fit(func, lags, gamma, p0=guess, bounds=bounds,
+                              sigma=1.0 / np.sqrt(experimental.counts), maxfev=10000)
+    except RuntimeError:
+        params = guess
+    return Variogram(model, float(params[0]), float(params[1]), float(params[2]))
+
+
+class OrdinaryKriging:
+    def __init__(self, coords, values, variogram):
+        coords = np.asarray(coords, dtype=float)
+        values = np.asarray(values, dtype=float)
+        mask = np.isfinite(coords).all(axis=1) & np.isfinite(values)
+        self.coords = coords[mask]
+        self.values = values[mask]
+        if len(self.values) == 0:
+            raise ValueError("No samples with finite coordinates and values")
+        self.tree = cKDTree(self.coords)
+        self.variogram = variogram
+
+    def __len__(self):
+        return len(self.values)
+
+    def estimate(self, targets, max_neighbors=16, radius=None, min_neighbors=3,
+                 chunk_size=KRIGING_CHUNK_SIZE, workers=-1):
+        # Returns (estimates, kriging variances); each target is solved from
+        # its own neighbourhood only, never from one global matrix
+        targets = np.atleast_2d(np.asarray(targets, dtype=float))
+        estimates = np.full(len(targets), np.nan)
+        variances = np.full(len(targets), np.nan)
+        for start in range(0, len(targets), chunk_size):
+            stop = start + chunk_size
+            estimates[start:stop], variances[start:stop] = self._estimate_chunk(
+                targets[start:stop], max_neighbors, radius, min_neighbors, workers
+            )
+        return estimates, variances
+
+    def _estimate_chunk(self, targets, max_neighbors, radius, min_neighbors, workers):
+        k = min(max_neighbors, len(self.values))
+        dist, idx = self.tree.query(
+            targets, k=k, distance_upper_bound=radius if radius else np.inf, workers=workers
+        )
+        if k == 1:
+            dist, idx = dist[:, None], idx[:, None]
+        valid = np.isfinite(dist)
+        idx = np.where(valid, idx, 0)
+        points = self.coords[idx]
+
+        # Batched ordinary kriging systems [[G, 1], [1', 0]] [w, mu] = [g0, 1].
+        # Missing neighbours get an identity row/column and zero right-hand
+        # side so their weight is exactly zero.
+        m = len(targets)
+        pair = valid[:, :, None] & valid[:, None, :]
+        gamma = self.variogram(np.linalg.norm(points[:, :, None, :] - points[:, None, :, :], axis=-1))
+        system = np.zeros((m, k + 1, k + 1))
+        system[:, :k, :k] = np.where(pair, gamma, 0.0)
+        diag = np.arange(k)
+        # Tiny diagonal offset keeps coincident samples from making G singular
+        system[:, diag, diag] = np.where(valid, -1e-10 * (self.variogram.sill + self.variogram.nugget + 1.0), 1.0)
+        system[:, :k, k] = valid
+        system[:, k, :k] = valid
+        rhs = np.zeros((m, k + 1))
+        rhs[:, :k] = np.where(valid, self.variogram(dist), 0.0)
+        rhs[:, k] = 1.0
+
+        counts = valid.sum(axis=1)
+        solvable = counts >= max(min_neighbors, 1)
+        estimates = np.full(m, np.nan)
+        variances = np.full(m, np.nan)
+        if solvable.any():
+            solution = np.linalg.solve(system[solvable], rhs[solvable][..., None])[..., 0]
+            weights = solution[:, :k]
+            estimates[solvable] = (weights * self.values[idx[solvable]]).sum(axis=1)
+            variances[solvable] = (solution * rhs[solvable]).sum(axis=1)
+        return estimates, variances
+
+    def estimate_grid(self, x_range, y_range, nx, ny, **kwargs):
+        xs = np.linspace(x_range[0], x_range[1], nx)
+        ys = np.linspace(y_range[0], y_range[1], ny)
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        estimates, variances = self.estimate(np.column_stack([grid_x.ravel(), grid_y.ravel()]), **kwargs)
+        return grid_x, grid_y, estimates.reshape(ny, nx), variances.reshape(ny, nx)
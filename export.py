@@ -0,0 +1,221 @@
+# ========================================
+# Streaming Data Export
+# ========================================
+# Writes CSV, Parquet or GeoJSON exports chunk by chunk from any frame source
+# (a DataFrame, loaded BLM result pages, a bulk harvest on disk), so a large
+# export never holds a second full copy of the data as strings in memory.
+# Downloads are built on click through deferred st.download_button callables;
+# exports of bulk harvests can be written straight to disk instead.
+import gzip
+import io
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is unavailable without pyarrow
+    pa = None
+
+EXPORT_CHUNK_ROWS = 50000
+# Exports larger than this spill from memory to a temporary file on disk
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+EXPORT_FORMATS = ["CSV", "Parquet", "GeoJSON"]
+COMPRESSIONS = {
+    "CSV": ["none", "gzip", "zip"],
+    "Parquet": ["zstd", "snappy", "gzip", "none"],
+    "GeoJSON": ["none", "gzip", "zip"],
+}
+EXTENSIONS = {"CSV": ".csv", "Parquet": ".parquet", "GeoJSON": ".geojson"}
+MIME_TYPES = {"CSV": "text/csv", "Parquet": "application/vnd.apache.parquet", "GeoJSON": "application/geo+json"}
+LATITUDE_NAMES = ["latitude", "lat", "y"]
+LONGITUDE_NAMES = ["longitude", "lon", "long", "lng", "x"]
+
+
+def find_coordinate_columns(columns):
+    lookup = {str(col).lower(): col for col in columns}
+    lat = next((lookup[name] for name in LATITUDE_NAMES if name in lookup), None)
+    lon = next((lookup[name] for name in LONGITUDE_NAMES if name in lookup), None)
+    return lat, lon
+
+
+def iter_frames(source, chunk_rows=EXPORT_CHUNK_ROWS):
+    # DataFrames are sliced into row chunks; anything with iter_chunks() or
+    # iter_frames() (ClaimPages, ClaimHarvester), or any iterable of frames,
+    # is passed through
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, max(len(source), 1), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+    elif hasattr(source, 'iter_chunks'):
+        yield from source.iter_chunks()
+    elif hasattr(source, 'iter_frames'):
+        yield from source.iter_frames()
+    else:
+        yield from source
+
+
+def file_name(base, fmt, compression="none"):
+    name = base + EXTENSIONS[fmt]
+    if compression == "gzip" and fmt != "Parquet":
+        return name + ".gz"
+    if compression == "zip":
+        return base + ".zip"
+    return name
+
+
+def mime_type(fmt, compression="none"):
+    if compression == "zip":
+        return "application/zip"
+    if compression == "gzip" and fmt != "Parquet":
+        return "application/gzip"
+    return MIME_TYPES[fmt]
+
+
+class _TextSink:
+    # Text handle over the output file, optionally through gzip or a single
+    # zip member; close() finishes the compression stream but keeps `out` open
+    def __init__(self, out, compression, member_name):
+        self._closers = []
+        raw = out
+        if compression == "gzip":
+            raw = gzip.GzipFile(fileobj=out, mode='wb')
+            self._closers.append(raw)
+        elif compression == "zip":
+            archive = zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED)
+            raw = archive.open(member_name, 'w', force_zip64=True)
+            self._closers += [archive, raw]
+        self.text = io.TextIOWrapper(raw, encoding='utf-8', newline='', write_through=True)
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+        for closer in reversed(self._closers):
+            closer.close()
+
+
+def _write_csv(chunks, sink, columns):
+    header = True
+    for chunk in chunks:
+        columns = list(chunk.columns) if columns is None else columns
+        chunk.reindex(columns=columns).to_csv(sink.text, index=False, header=header)
+        header = False
+    if header and columns is not None:
+        pd.DataFrame(columns=columns).to_csv(sink.text, index=False)
+
+
+def _write_geojson(chunks, sink, columns, lat_col, lon_col):
+    sink.text.write('{"type": "FeatureCollection", "features": [\n')
+    first = True
+    for chunk in chunks:
+        columns = list(chunk.columns) if columns is None else columns
+        if lat_col is None or lon_col is None:
+            lat_col, lon_col = find_coordinate_columns(columns)
+            if lat_col is None or lon_col is None:
+                raise ValueError("GeoJSON export needs latitude and longitude columns")
+        lat = pd.to_numeric(chunk[lat_col], errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(chunk[lon_col], errors='coerce').to_numpy(dtype=float)
+        mask = np.isfinite(lat) & np.isfinite(lon)
+        if not mask.any():
+            continue
+        props = chunk.reindex(columns=[col for col in columns if col not in (lat_col, lon_col)])[mask]
+        # One JSON object per line from pandas, wrapped into features
+        lines = props.to_json(orient='records', lines=True, date_format='iso').splitlines() if len(props.columns) else ["{}"] * int(mask.sum())
+        features = ",\n".join(
+            f'{{"type": "Feature", "geometry": {{"type": "Point", "coordinates": [{x!r}, {y!r}]}}, "properties": {p}}}'
+            for x, y, p in zip(lon[mask].tolist(), lat[mask].tolist(), lines)
+        )
+        sink.text.write(features if first else ",\n" + features)
+        first = False
+    sink.text.write("\n]}\n")
+
+
+def _arrow_type(values):
+    # Mixed-type object columns and columns that are entirely empty in the
+    # first chunk are written as text
+    if values.isna().all():
+        return pa.string()
+    try:
+        arrow_type = pa.array(values, from_pandas=True).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+    return arrow_type
+
+
+def _arrow_column(values, field):
+    try:
+        return pa.array(values, type=field.type, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Type drifted between chunks (e.g. a column that was all-null in
+        # the first page); fall back to text
+        text = values.astype(object).where(values.notna(), None).map(lambda v: v if v is None else str(v))
+        try:
+            return pa.array(text, type=pa.string()).cast(field.type, safe=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            raise ValueError(f"Column {field.name!r} changes type between chunks; export it as CSV instead")
+
+
+def _write_parquet(chunks, out, columns, compression):
+    if pa is None:
+        raise ImportError("Parquet export requires pyarrow")
+    writer = schema = None
+    try:
+        for chunk in chunks:
+            columns = list(chunk.columns) if columns is None else columns
+            chunk = chunk.reindex(columns=columns)
+            if schema is None:
+                schema = pa.schema([pa.field(str(col), _arrow_type(chunk[col])) for col in columns])
+                writer = pq.ParquetWriter(out, schema, compression=None if compression == "none" else compression)
+            table = pa.Table.from_arrays([_arrow_column(chunk[col], f) for col, f in zip(columns, schema)], schema=schema)
+            writer.write_table(table)
+        if writer is None and columns is not None:
+            schema = pa.schema([pa.field(str(col), pa.string()) for col in columns])
+            writer = pq.ParquetWriter(out, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_export(source, out, fmt="CSV", compression="none", columns=None, lat_col=None, lon_col=None,
+                 member_name="export", chunk_rows=EXPORT_CHUNK_ROWS):
+    # Streams `source` into the binary file object `out` in the given format.
+    # `columns` fixes the column order (and fills columns missing in a chunk).
+    if compression not in COMPRESSIONS[fmt]:
+        raise ValueError(f"{fmt} export does not support {compression} compression")
+    chunks = iter_frames(source, chunk_rows)
+    if fmt == "Parquet":
+        _write_parquet(chunks, out, columns, compression)
+        return out
+    sink = _TextSink(out, compression, member_name + EXTENSIONS[fmt])
+    try:
+        if fmt == "CSV":
+            _write_csv(chunks, sink, columns)
+        else:
+            _write_geojson(chunks, sink, columns, lat_col, lon_col)
+    finally:
+        sink.close()
+    return out
+
+
+def export_bytes(source, fmt="CSV", compression="none", base_name="export", **kw):
+    # Builds the export in a spooled temp file (spilling to disk past
+    # SPOOL_MAX_BYTES) and returns only the finished, compressed bytes
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as out:
+        write_export(source, out, fmt, compression, member_name=base_name, **kw)
+        out.seek(0)
+        return out.read()
+
+
+def export_to_path(source, path, fmt="CSV", compression="none", **kw):
+    # Writes the export straight to disk; nothing but the current chunk is
+    # held in memory. Written to a temp name and renamed when complete.
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    partial = path + ".partial"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(partial, 'wb') as out:
+        write_export(source, out, fmt, compression, member_name=base_name, **kw)
+    os.replace(partial, path)
+    return path
@@ -0,0 +1,153 @@
+# ========================================
+# Spatial Helpers
+# ========================================
+# Server-side aggregation of point data (claims, sites, samples) into square
+# grid or hexagonal bins so maps send hundreds of features instead of one
+# marker per record, plus great-circle search: SphereIndex keeps points as
+# unit-sphere vectors in a KD-tree, where a chord length maps exactly to a
+# surface distance, for nearest-neighbour and radius queries.
+import math
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+DEFAULT_MAX_FEATURES = 500
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _aggregate(keys, lat, lon, category=None):
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    bins = pd.DataFrame({
+        'latitude': np.bincount(inverse, weights=lat) / counts,
+        'longitude': np.bincount(inverse, weights=lon) / counts,
+        'count': counts,
+    })
+    if category is not None:
+        # Most common category per bin, via a bins x categories count table
+        codes, labels = pd.factorize(pd.Series(category).fillna("Unknown"))
+        table = np.bincount(inverse * len(labels) + codes, minlength=len(counts) * len(labels))
+        table = table.reshape(len(counts), len(labels))
+        bins['top_category'] = np.asarray(labels)[table.argmax(axis=1)]
+        bins['top_category_count'] = table.max(axis=1)
+    return bins.sort_values('count', ascending=False, ignore_index=True)
+
+
+def _clean(lat, lon, category):
+    lat = pd.to_numeric(pd.Series(lat), errors='coerce').to_numpy(dtype=float)
+    lon = pd.to_numeric(pd.Series(lon), errors='coerce').to_numpy(dtype=float)
+    mask = np.isfinite(lat) & np.isfinite(lon)
+    if category is not None:
+        category = np.asarray(category, dtype=object)[mask]
+    return lat[mask], lon[mask], category
+
+
+def grid_bins(lat, lon, cell_deg, category=None):
+    lat, lon, category = _clean(lat, lon, category)
+    keys = np.column_stack([np.floor(lon / cell_deg), np.floor(lat / cell_deg)]).astype(np.int64)
+    return _aggregate(keys, lat, lon, category)
+
+
+def hex_bins(lat, lon, size_deg, category=None):
+    # Pointy-top hexagons in axial coordinates with cube rounding
+    lat, lon, category = _clean(lat, lon, category)
+    q = (math.sqrt(3) / 3 * lon - lat / 3) / size_deg
+    r = (2.0 / 3 * lat) / size_deg
+    x, z = q, r
+    y = -x - z
+    rx, ry, rz = np.round(x), np.round(y), np.round(z)
+    dx, dy, dz = np.abs(rx - x), np.abs(ry - y), np.abs(rz - z)
+    fix_x = (dx > dy) & (dx > dz)
+    fix_z = ~fix_x & ~(dy > dz)
+    rx = np.where(fix_x, -ry - rz, rx)
+    rz = np.where(fix_z, -rx - ry, rz)
+    keys = np.column_stack([rx, rz]).astype(np.int64)
+    return _aggregate(keys, lat, lon, category)
+
+
+def auto_bin_size(lat, lon, max_features=DEFAULT_MAX_FEATURES, binner=grid_bins):
+    # Smallest power-of-two-scaled cell that keeps the bin count within budget
+    lat, lon, _ = _clean(lat, lon, None)
+    if len(lat) == 0:
+        return 1.0
+    extent = max(float(np.ptp(lat)), float(np.ptp(lon)), 1e-3)
+    size = extent / math.sqrt(max_features)
+    while len(binner(lat, lon, size)) > max_features:
+        size *= 2
+    return size
+
+
+def unit_vectors(lat, lon):
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def km_to_chord(km):
+    # Straight-line distance between unit vectors `km` apart on the surface
+    return 2.0 * np.sin(np.minimum(np.asarray(km, dtype=float) / EARTH_RADIUS_KM, np.pi) / 2.0)
+
+
+def chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2.0, 0.0, 1.0))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class SphereIndex:
+    # KD-tree over unit-sphere vectors of the points with valid coordinates.
+    # Built once per reference dataset; queries run in batches and return
+    # positions into the original arrays (-1 where nothing was found).
+    def __init__(self, lat, lon):
+        lat = pd.to_numeric(pd.Series(lat), errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(pd.Series(lon), errors='coerce').to_numpy(dtype=float)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        self.positions = np.flatnonzero(valid)
+        self.tree = cKDTree(unit_vectors(lat[valid], lon[valid])) if valid.any() else None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _batches(self, lat, lon, chunk_size):
+        lat = pd.to_numeric(pd.Series(lat), errors='coerce').to_numpy(dtype=float)
+        lon = pd.to_numeric(pd.Series(lon), errors='coerce').to_numpy(dtype=float)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        for start in range(0, len(lat), chunk_size):
+            stop = min(start + chunk_size, len(lat))
+            rows = start + np.flatnonzero(valid[start:stop])
+            yield rows, unit_vectors(lat[rows], lon[rows])
+
+    def nearest(self, lat, lon, max_km=None, chunk_size=65536):
+        # (distance_km, position) of the closest point to each query point
+        n = len(lat)
+        distance = np.full(n, np.nan)
+        position = np.full(n, -1, dtype=np.int64)
+        if self.tree is None:
+            return distance, position
+        bound = float(km_to_chord(max_km)) if max_km else np.inf
+        for rows, vectors in self._batches(lat, lon, chunk_size):
+            chord, found = self.tree.query(vectors, k=1, distance_upper_bound=bound, workers=-1)
+            hit = np.isfinite(chord)
+            distance[rows[hit]] = chord_to_km(chord[hit])
+            position[rows[hit]] = self.positions[found[hit]]
+        return distance, position
+
+    def within(self, lat, lon, radius_km):
+        # Positions of all points within `radius_km` of one location
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64)
+        hits = self.tree.query_ball_point(unit_vectors([lat], [lon])[0], float(km_to_chord(radius_km)))
+        return np.sort(self.positions[np.asarray(hits, dtype=np.int64)])
+
+    def count_within(self, lat, lon, radius_km, chunk_size=65536):
+        counts = np.zeros(len(lat), dtype=np.int64)
+        if self.tree is None:
+            return counts
+        for rows, vectors in self._batches(lat, lon, chunk_size):
+            counts[rows] = self.tree.query_ball_point(vectors, float(km_to_chord(radius_km)), return_length=True, workers=-1)
+        return counts
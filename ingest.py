@@ -0,0 +1,230 @@
+# ========================================
+# Workbook Ingestion
+# ========================================
+# Parses an uploaded Excel workbook once and hands typed DataFrames for every
+# sheet to the rest of the app. Results are keyed by a SHA-256 of the file
+# contents so Streamlit reruns never touch the raw .xlsx again, and parsed
+# sheets are persisted as Arrow/Feather files so re-uploads of the same
+# workbook (in any session) memory-map the cache instead of parsing Excel.
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # cache is optional; parsing still works without it
+    pa = None
+
+# Object columns are converted to float only when every non-empty cell parses
+# as a number, so detection limits ("<0.005") and text IDs are never lost;
+# identifier columns keep their text even when it looks numeric.
+ID_COLUMN = re.compile(r'(^|[_\s])(ID|NO|NR|NUM|NUMBER|CODE|NAME)$|^(HOLE|SAMPLE|BHID|DHID)', re.IGNORECASE)
+
+# Workbooks at or above this size are read with the streaming reader
+STREAMING_THRESHOLD_BYTES = 20 * 1024 * 1024
+CHUNK_ROWS = 50000
+
+# Shared on-disk cache root for parsed datasets and downloaded reference data
+CACHE_DIR = os.getenv("MINING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mining-analysis"))
+# Bump when parsing/typing rules change so stale caches are ignored
+WORKBOOK_CACHE_VERSION = 2
+
+
+def file_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class Workbook:
+    digest: str
+    name: str
+    sheets: dict = field(default_factory=dict)
+
+    @property
+    def sheet_names(self):
+        return list(self.sheets)
+
+    @property
+    def primary(self):
+        # First sheet, used by the map, 3D model, IDW and report sections
+        return next(iter(self.sheets.values()), pd.DataFrame())
+
+
+def coerce_types(df):
+    # Converts columns in place; callers pass frames they own
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            continue
+        non_null = series.dropna()
+        if non_null.empty:
+            continue
+        numeric = None if ID_COLUMN.search(str(col)) else pd.to_numeric(non_null, errors='coerce')
+        if numeric is not None and numeric.notna().all():
+            df[col] = pd.to_numeric(series, errors='coerce')
+        else:
+            # Mixed text/number columns become plain strings so every sheet has
+            # a single well-defined dtype per column
+            df[col] = series.where(series.isna(), series.astype(str))
+    return df
+
+
+def _header_names(row):
+    names, seen = [], {}
+    for i, value in enumerate(row):
+        name = str(value) if value is not None else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _column_chunk(values):
+    # Numeric cells go straight into a float64 array; anything else keeps the
+    # chunk as objects so the column can be typed once all rows are read
+    numeric = True
+    for value in values:
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            numeric = False
+            break
+    if numeric:
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return np.array(values, dtype=object)
+
+
+def _finish_column(chunks):
+    if all(chunk.dtype == np.float64 for chunk in chunks):
+        return pd.Series(np.concatenate(chunks) if chunks else np.empty(0))
+    parts = [chunk.astype(object) if chunk.dtype == np.float64 else chunk for chunk in chunks]
+    series = pd.Series(np.concatenate(parts), dtype=object)
+    non_null = series.dropna()
+    if not non_null.empty and non_null.map(lambda v: isinstance(v, (datetime.date, datetime.datetime))).all():
+        return pd.to_datetime(series, errors='coerce')
+    return series
+
+
+def stream_sheet(worksheet, chunk_rows=CHUNK_ROWS):
+    rows = worksheet.iter_rows(values_only=True)
+    header = None
+    for row in rows:
+        if any(value is not None for value in row):
+            header = _header_names(row)
+            break
+    if header is None:
+        return pd.DataFrame()
+
+    width = len(header)
+    columns = [[] for _ in range(width)]
+    pending_blank = 0
+    buffer = []
+
+    def flush():
+        for i, values in enumerate(zip(*buffer)):
+            columns[i].append(_column_chunk(values))
+        buffer.clear()
+
+    for row in rows:
+        if not any(value is not None for value in row):
+            # Only keep blank rows that sit between data rows, like pandas does
+            pending_blank += 1
+            continue
+        buffer.extend([(None,) * width] * pending_blank)
+        pending_blank = 0
+        row = tuple(row[:width]) + (None,) * (width - len(row))
+        buffer.append(row)
+        if len(buffer) >= chunk_rows:
+            flush()
+    if buffer:
+        flush()
+
+    return pd.DataFrame({name: _finish_column(chunks) for name, chunks in zip(header, columns)})
+
+
+def load_workbook_streaming(data, name="", chunk_rows=CHUNK_ROWS, digest=None):
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheets = {ws.title: coerce_types(stream_sheet(ws, chunk_rows)) for ws in wb.worksheets}
+    finally:
+        wb.close()
+    return Workbook(digest=digest or file_hash(data), name=name, sheets=sheets)
+
+
+def _workbook_cache_path(digest):
+    return os.path.join(CACHE_DIR, "workbooks", f"v{WORKBOOK_CACHE_VERSION}", digest)
+
+
+def read_cached_workbook(digest, name=""):
+    path = _workbook_cache_path(digest)
+    manifest_path = os.path.join(path, "manifest.json")
+    if pa is None or not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        sheets = {}
+        for i, sheet in enumerate(manifest["sheets"]):
+            # Uncompressed Arrow IPC maps straight from the page cache
+            table = feather.read_table(os.path.join(path, f"{i}.arrow"), memory_map=True)
+            sheets[sheet] = table.to_pandas(split_blocks=True)
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        return None
+    return Workbook(digest=digest, name=name or manifest.get("name", ""), sheets=sheets)
+
+
+def write_cached_workbook(workbook):
+    if pa is None:
+        return False
+    path = _workbook_cache_path(workbook.digest)
+    if os.path.exists(path):
+        return True
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        for i, frame in enumerate(workbook.sheets.values()):
+            feather.write_feather(frame.reset_index(drop=True), os.path.join(tmp, f"{i}.arrow"), compression="uncompressed")
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"name": workbook.name, "sheets": workbook.sheet_names}, f)
+        # Directory rename is atomic, so readers never see a half-written cache
+        os.replace(tmp, path)
+        return True
+    except (OSError, ValueError, TypeError, pa.ArrowException):
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+
+
+def load_workbook(data, name="", streaming=None, digest=None, use_cache=True):
+    digest = digest or file_hash(data)
+    if use_cache:
+        cached = read_cached_workbook(digest, name=name)
+        if cached is not None:
+            return cached
+    # Large files are read lazily in read-only mode so peak memory stays close
+    # to the size of the final columns rather than openpyxl's cell graph
+    if streaming is None:
+        streaming = len(data) >= STREAMING_THRESHOLD_BYTES
+    if streaming:
+        workbook = load_workbook_streaming(data, name=name, digest=digest)
+    else:
+        frames = pd.read_excel(io.BytesIO(data), sheet_name=None, engine='openpyxl')
+        sheets = {}
+        for sheet, frame in frames.items():
+            frame.columns = [str(col) for col in frame.columns]
+            sheets[str(sheet)] = coerce_types(frame)
+        workbook = Workbook(digest=digest, name=name, sheets=sheets)
+    if use_cache:
+        write_cached_workbook(workbook)
+    return workbook
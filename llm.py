@@ -0,0 +1,699 @@
+# ========================================
+# LLM Requests
+# ========================================
+# AI requests of the app go through a Router over pluggable providers
+# (OpenAI, Google Gemini, xAI Grok, or any OpenAI-compatible server via a
+# base URL), all driven by one background event loop thread so clients and
+# their connections are pooled across reruns and sessions. Every provider
+# has its own concurrency limit, request-rate limiter and retry/backoff; the
+# router falls back to the next provider of a route when one fails or times
+# out, and can fan a prompt out to several providers returning the first or
+# all answers. Finished responses are kept in ResponseCache, a size-bounded
+# disk cache keyed by the request and the dataset it was asked about. Long
+# outputs are streamed: stream_complete() yields text pieces for
+# st.write_stream while StreamStats records time to first token and
+# throughput; closing the generator early cancels the upstream request.
+# summarize_chunks() is the map step of map-reduce analysis over inputs too
+# large for one prompt.
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import as_completed
+
+from openai import APIConnectionError, AsyncOpenAI
+
+from ingest import CACHE_DIR
+from prompts import estimate_tokens
+
+try:
+    import google.generativeai as genai
+except ImportError:  # Gemini is optional
+    genai = None
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-pro-latest")
+XAI_MODEL = os.getenv("XAI_MODEL", "grok-4")
+XAI_BASE_URL = os.getenv("XAI_BASE_URL", "https://api.x.ai/v1")
+DEFAULT_PROVIDER = "openai"
+PROVIDER_LABELS = {'openai': "OpenAI", 'gemini': "Google Gemini", 'xai': "xAI Grok"}
+MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "4"))
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+REQUEST_TIMEOUT = 300
+MAX_RETRIES = 2
+RETRY_BACKOFF = 1.0
+RESPONSE_CACHE_DIR = os.path.join(CACHE_DIR, "llm_responses")
+RESPONSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+CHUNK_SUMMARY_TOKENS = 800
+
+_loop = None
+_loop_lock = threading.Lock()
+_router = None
+
+
+def event_loop():
+    # Loop shared by all sessions, started on first use
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+    return _loop
+
+
+def submit(coro):
+    # concurrent.futures.Future for a coroutine run on the shared loop
+    return asyncio.run_coroutine_threadsafe(coro, event_loop())
+
+
+class ProviderError(RuntimeError):
+    # Every provider of a route failed; `errors` maps provider -> exception
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors.items()) or "No AI provider available")
+
+
+class RateLimiter:
+    # Token bucket allowing `per_minute` requests per minute with bursts of
+    # up to `burst`; only used from the shared loop
+    def __init__(self, per_minute=REQUESTS_PER_MINUTE, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1, min(per_minute, MAX_CONCURRENT_REQUESTS))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Provider:
+    # Base class: subclasses implement _generate() and optionally _stream().
+    # run() adds the concurrency limit, rate limiting, a per-attempt timeout
+    # and retries with exponential backoff for transient errors (a stream
+    # that already produced text is not retried). The attempts of a stream
+    # share one timeout, so a stalled stream falls back to the next provider
+    # instead of being retried for several timeouts while the user waits.
+    def __init__(self, name, model, requests_per_minute=REQUESTS_PER_MINUTE, max_concurrency=MAX_CONCURRENT_REQUESTS,
+                 timeout=REQUEST_TIMEOUT, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+        self.name = name
+        self.model = model
+        self.limiter = RateLimiter(requests_per_minute)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = None
+        self.calls = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def available(self):
+        return True
+
+    def retryable(self, error):
+        # Timeouts, connection errors, rate limiting (429) and server errors
+        # (5xx) are worth another attempt; missing keys, auth and other 4xx
+        # errors are not
+        if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+            return True
+        status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+        return isinstance(status, int) and (status == 429 or status >= 500)
+
+    async def _generate(self, prompt, model, max_tokens, temperature):
+        raise NotImplementedError
+
+    async def _stream(self, prompt, model, max_tokens, temperature, emit):
+        emit(await self._generate(prompt, model, max_tokens, temperature))
+
+    async def run(self, prompt, model=None, max_tokens=None, temperature=None, emit=None):
+        # Returns the text, or streams it through emit(piece, tokens=None)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        model = model or self.model
+        deadline = time.monotonic() + self.timeout
+        for attempt in range(self.retries + 1):
+            emitted = False
+
+            def relay(piece, tokens=None):
+                nonlocal emitted
+                emitted = emitted or bool(piece)
+                emit(piece, tokens)
+
+            started = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    await self.limiter.acquire()
+                    self.calls += 1
+                    if emit is None:
+                        return await asyncio.wait_for(self._generate(prompt, model, max_tokens, temperature), self.timeout)
+                    return await asyncio.wait_for(self._stream(prompt, model, max_tokens, temperature, relay),
+                                                  deadline - time.monotonic())
+            except Exception as e:
+                self.failures += 1
+                delay = self.backoff * 2 ** attempt * (0.5 + random.random())
+                if (attempt == self.retries or emitted or not self.retryable(e)
+                        or (emit is not None and time.monotonic() + delay >= deadline)):
+                    raise
+            finally:
+                self.seconds += time.perf_counter() - started
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {'provider': self.name, 'model': self.model, 'available': self.available(), 'calls': self.calls,
+                'failures': self.failures, 'avg_s': self.seconds / self.calls if self.calls else None}
+
+
+class OpenAIProvider(Provider):
+    # OpenAI or any OpenAI-compatible API (xAI, local servers); one pooled
+    # client per provider, with retries left to Provider.run()
+    def __init__(self, name, model, api_key_env, base_url=None, **options):
+        super().__init__(name, model, **options)
+        self.api_key_env = api_key_env
+        self.base_url = base_url
+        self._client = None
+
+    def available(self):
+        return bool(os.getenv(self.api_key_env))
+
+    def retryable(self, error):
+        return isinstance(error, APIConnectionError) or super().retryable(error)
+
+    def client(self):
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=os.getenv(self.api_key_env), base_url=self.base_url,
+                                       timeout=self.timeout, max_retries=0)
+        return self._client
+
+    def _options(self, max_tokens, temperature):
+        options = {} if max_tokens is None else {'max_tokens': max_tokens}
+        if temperature is not None:
+            options['temperature'] = temperature
+        return options
+
+    async def _generate(self, prompt, model, max_tokens, temperature):
+        response = await self.client().chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}], **self._options(max_tokens, temperature))
+        return response.choices[0].message.content
+
+    async def _stream(self, prompt, model, max_tokens, temperature, emit):
+        stream = await self.client().chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}], stream=True,
+            stream_options={"include_usage": True}, **self._options(max_tokens, temperature))
+        async with stream:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    emit(chunk.choices[0].delta.content)
+                if getattr(chunk, 'usage', None) is not None:
+                    emit(None, chunk.usage.completion_tokens)
+
+
+class GeminiProvider(Provider):
+    def __init__(self, name, model, api_key_env="GOOGLE_GEMINI_API_KEY", **options):
+        super().__init__(name, model, **options)
+        self.api_key_env = api_key_env
+
+    def available(self):
+        return genai is not None and bool(os.getenv(self.api_key_env))
+
+    def _model(self, model, max_tokens, temperature):
+        genai.configure(api_key=os.getenv(self.api_key_env))
+        config = {} if max_tokens is None else {'max_output_tokens': max_tokens}
+        if temperature is not None:
+            config['temperature'] = temperature
+        return genai.GenerativeModel(model, generation_config=config or None)
+
+    async def _generate(self, prompt, model, max_tokens, temperature):
+        response = await self._model(model, max_tokens, temperature).generate_content_async(prompt)
+        return response.text
+
+    async def _stream(self, prompt, model, max_tokens, temperature, emit):
+        response = await self._model(model, max_tokens, temperature).generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                emit(chunk.text)
+
+
+class Router:
+    def __init__(self, providers):
+        self.providers = {provider.name: provider for provider in providers}
+
+    def available(self):
+        return [name for name, provider in self.providers.items() if provider.available()]
+
+    def route(self, provider=DEFAULT_PROVIDER, fallback=False, model=None):
+        # [(provider, model override)]: `provider` first, then (with fallback)
+        # every other available provider. With fallback a provider without an
+        # API key is skipped rather than tried first.
+        if not fallback:
+            return [(provider, model)]
+        available = self.available()
+        route = [(provider, model)] if provider in available else []
+        route += [(name, None) for name in available if name != provider]
+        return route or [(provider, model)]
+
+    def model(self, provider, model=None):
+        return model or self.providers[provider].model
+
+    async def ask(self, prompt, route, max_tokens=None, temperature=None, emit=None):
+        # Tries the providers of `route` in order; returns (provider, text).
+        # A stream that fails after producing text is not re-routed.
+        errors = {}
+        for name, model in route:
+            emitted = False
+
+            def relay(piece, tokens=None):
+                nonlocal emitted
+                emitted = emitted or bool(piece)
+                emit(piece, tokens)
+
+            try:
+                text = await self.providers[name].run(prompt, model, max_tokens, temperature, relay if emit else None)
+                return name, text
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors[name] = e
+                if emitted:
+                    raise
+        raise ProviderError(errors)
+
+    async def fan_out(self, prompt, names, max_tokens=None, temperature=None, first=False):
+        # The prompt to several providers at once: {provider: text or
+        # exception} for all of them, or only the first successful answer
+        tasks = {asyncio.ensure_future(self.providers[name].run(prompt, None, max_tokens, temperature)): name
+                 for name in names}
+        if not first:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            return dict(zip(tasks.values(), results))
+        errors, pending = {}, set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return {tasks[task]: task.result()}
+                    errors[tasks[task]] = task.exception()
+            raise ProviderError(errors)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return [provider.stats() for provider in self.providers.values()]
+
+
+def default_router():
+    # OpenAI, Gemini and xAI from the environment; OPENAI_BASE_URL and
+    # XAI_BASE_URL can point either at a local stand-in
+    global _router
+    with _loop_lock:
+        if _router is None:
+            _router = Router([
+                OpenAIProvider("openai", OPENAI_MODEL, "OPENAI_API_KEY", base_url=os.getenv("OPENAI_BASE_URL")),
+                GeminiProvider("gemini", GEMINI_MODEL),
+                OpenAIProvider("xai", XAI_MODEL, "XAI_API_KEY", base_url=XAI_BASE_URL),
+            ])
+    return _router
+
+
+class ResponseCache:
+    # Completed responses on disk, one JSON file per request key. Total size
+    # is bounded by max_bytes; hits refresh a file's mtime and the least
+    # recently used files are evicted first. Entry count and size are seeded
+    # from one directory scan and then kept as running counters, so stats()
+    # is cheap enough for every rerun.
+    def __init__(self, directory=RESPONSE_CACHE_DIR, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = 0
+        self._bytes = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(provider, model, prompt, max_tokens=None, temperature=None, dataset=""):
+        return hashlib.sha256(json.dumps([provider, model, prompt, max_tokens, temperature, dataset]).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _files(self):
+        # [(mtime, size, path)] of every cached response
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        info = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((info.st_mtime, info.st_size, path))
+        return files
+
+    def _seed(self):
+        # Called with the lock held
+        if self._bytes is None:
+            files = self._files()
+            self._entries, self._bytes = len(files), sum(size for _, size, _ in files)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                text = json.load(f)['text']
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key, text, **meta):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps({'text': text, **meta})
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(payload)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = None
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._bytes is None:
+                self._seed()
+            else:
+                self._entries += replaced is None
+                self._bytes += size - (replaced or 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Down to 90% of the limit, oldest first; called with the lock held
+        files = sorted(self._files())
+        self._entries, self._bytes = len(files), sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._entries -= 1
+            self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._entries, self._bytes = 0, 0
+
+    def stats(self):
+        with self._lock:
+            self._seed()
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self._entries, 'bytes': self._bytes}
+
+
+class StreamStats:
+    # Timing of one streamed completion
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.tokens = 0
+        self.cached = False
+        self.provider = None
+        self.model = None
+
+    def token(self, count=1):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += count
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    @property
+    def ttft(self):
+        return None if self.first_token is None else self.first_token - self.started
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return None
+        return self.tokens / (self.finished - self.first_token)
+
+    def record(self):
+        return {'provider': self.provider, 'model': self.model, 'cached': self.cached, 'ttft_s': self.ttft, 'tokens': self.tokens, 'tokens_per_s': self.tokens_per_second,
+                'total_s': None if self.finished is None else self.finished - self.started}
+
+    def summary(self):
+        source = f"{PROVIDER_LABELS.get(self.provider, self.provider)} ({self.model}): " if self.provider else ""
+        if self.cached:
+            return source + "Cached response"
+        if self.ttft is None:
+            return source + "No output"
+        rate = f", {self.tokens_per_second:.1f} tokens/s" if self.tokens_per_second else ""
+        return source + f"First token after {self.ttft:.2f} s, {self.tokens} tokens{rate}"
+
+
+_DONE = object()
+
+
+def _start_stream(router, prompt, route, max_tokens, temperature, events, name=None):
+    # Streams one routed request on the shared loop. `events` receives
+    # (name, piece, None) per text piece, (name, None, usage tokens) and
+    # finally (name, _DONE, future) where the future holds (provider, text).
+    def emit(piece, tokens=None):
+        events.put((name, piece, tokens))
+
+    future = submit(router.ask(prompt, route, max_tokens, temperature, emit))
+    future.add_done_callback(lambda done: events.put((name, _DONE, done)))
+    return future
+
+
+def _cache_answer(cache, router, prompt, provider, model, answered, text, max_tokens, temperature, dataset):
+    # Stored under the provider that actually answered, so a fallback answer
+    # is never served later as the requested provider's
+    if cache is None:
+        return
+    model_name = router.model(answered, model if answered == provider else None)
+    cache.put(ResponseCache.key(answered, model_name, prompt, max_tokens, temperature, dataset), text,
+              provider=answered, model=model_name)
+
+
+def complete(prompt, provider=DEFAULT_PROVIDER, fallback=False, model=None, max_tokens=2000, temperature=None,
+             cache=None, dataset="", refresh=False, router=None):
+    # Blocking single request from the script thread
+    router = router or default_router()
+    key = ResponseCache.key(provider, router.model(provider, model), prompt, max_tokens, temperature, dataset)
+    text = cache.get(key) if cache is not None and not refresh else None
+    if text is None:
+        answered, text = submit(router.ask(prompt, router.route(provider, fallback, model), max_tokens,
+                                           temperature)).result()
+        _cache_answer(cache, router, prompt, provider, model, answered, text, max_tokens, temperature, dataset)
+    return text
+
+
+def complete_all(prompts, provider=DEFAULT_PROVIDER, fallback=False, model=None, max_tokens=2000, temperature=None,
+                 cache=None, dataset="", refresh=False, router=None):
+    # prompts: {name: prompt}. Yields (name, text, error) in completion order;
+    # cached responses come first, the rest run concurrently
+    router = router or default_router()
+    route, model_name = router.route(provider, fallback, model), router.model(provider, model)
+    futures, hits = {}, []
+    for name, prompt in prompts.items():
+        key = ResponseCache.key(provider, model_name, prompt, max_tokens, temperature, dataset)
+        text = cache.get(key) if cache is not None and not refresh else None
+        if text is not None:
+            hits.append((name, text, None))
+        else:
+            futures[submit(router.ask(prompt, route, max_tokens, temperature))] = name, prompt
+    yield from hits
+    try:
+        for future in as_completed(futures):
+            name, prompt = futures[future]
+            error = future.exception()
+            if error is None:
+                answered, text = future.result()
+                _cache_answer(cache, router, prompt, provider, model, answered, text, max_tokens, temperature, dataset)
+            yield name, None if error else future.result()[1], error
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def stream_complete(prompt, provider=DEFAULT_PROVIDER, fallback=False, model=None, max_tokens=2000, temperature=None,
+                    cache=None, dataset="", refresh=False, stats=None, router=None):
+    # Generator of text pieces for st.write_stream. A cached response comes
+    # back as one piece; a finished stream is cached, an abandoned one is not.
+    router = router or default_router()
+    stats = stats if stats is not None else StreamStats()
+    stats.provider, stats.model = provider, router.model(provider, model)
+    key = ResponseCache.key(provider, stats.model, prompt, max_tokens, temperature, dataset)
+    text = cache.get(key) if cache is not None and not refresh else None
+    if text is not None:
+        stats.cached = True
+        stats.finish()
+        yield text
+        return
+    events, parts = queue.Queue(), []
+    future = _start_stream(router, prompt, router.route(provider, fallback, model), max_tokens, temperature, events)
+    try:
+        while True:
+            _, piece, info = events.get()
+            if piece is _DONE:
+                answered, _ = info.result()
+                if answered != provider:
+                    stats.provider, stats.model = answered, router.model(answered)
+                break
+            if piece is None:
+                stats.tokens = info
+                continue
+            stats.token()
+            parts.append(piece)
+            yield piece
+    finally:
+        # No-op once finished; otherwise the reader went away (stop/rerun)
+        future.cancel()
+        stats.finish()
+    _cache_answer(cache, router, prompt, provider, model, stats.provider, "".join(parts), max_tokens, temperature,
+                  dataset)
+
+
+def stream_all(prompts, provider=DEFAULT_PROVIDER, fallback=False, model=None, max_tokens=2000, temperature=None,
+               cache=None, dataset="", refresh=False, stats=None, router=None):
+    # prompts: {name: prompt}, streamed concurrently. Yields (name, piece,
+    # None) as text arrives and (name, None, error or None) when a request
+    # ends; `stats` (a dict) receives a StreamStats per name
+    router = router or default_router()
+    stats = stats if stats is not None else {}
+    route, model_name = router.route(provider, fallback, model), router.model(provider, model)
+    events, futures, parts = queue.Queue(), {}, {}
+    for name, prompt in prompts.items():
+        stats[name] = StreamStats()
+        stats[name].provider, stats[name].model = provider, model_name
+        key = ResponseCache.key(provider, model_name, prompt, max_tokens, temperature, dataset)
+        text = cache.get(key) if cache is not None and not refresh else None
+        if text is not None:
+            stats[name].cached = True
+            events.put((name, text, None))
+            events.put((name, _DONE, None))
+        else:
+            parts[name] = []
+            futures[name] = _start_stream(router, prompt, route, max_tokens, temperature, events, name), prompt
+    pending = len(prompts)
+    try:
+        while pending:
+            name, piece, info = events.get()
+            if piece is _DONE:
+                pending -= 1
+                stats[name].finish()
+                error = None if info is None or info.cancelled() else info.exception()
+                if info is not None and error is None:
+                    answered = info.result()[0]
+                    stats[name].provider = answered
+                    stats[name].model = router.model(answered, model if answered == provider else None)
+                    _cache_answer(cache, router, futures[name][1], provider, model, answered, "".join(parts[name]),
+                                  max_tokens, temperature, dataset)
+                yield name, None, error
+            elif piece is None:
+                stats[name].tokens = info
+            else:
+                if name in parts:
+                    stats[name].token()
+                    parts[name].append(piece)
+                yield name, piece, None
+    finally:
+        for future, _ in futures.values():
+            future.cancel()
+
+
+def fan_out(prompt, providers, first=False, max_tokens=2000, temperature=None, cache=None, dataset="", refresh=False,
+            router=None):
+    # One prompt to several providers concurrently. Returns {provider: text
+    # or exception} for all of them, or {provider: text} for the first
+    # successful (or cached) answer; raises ProviderError if none succeeds
+    router = router or default_router()
+    results, missing, keys = {}, [], {}
+    for name in providers:
+        keys[name] = ResponseCache.key(name, router.model(name), prompt, max_tokens, temperature, dataset)
+        text = cache.get(keys[name]) if cache is not None and not refresh else None
+        if text is not None:
+            results[name] = text
+            if first:
+                return results
+        else:
+            missing.append(name)
+    if missing:
+        fetched = submit(router.fan_out(prompt, missing, max_tokens, temperature, first)).result()
+        for name, result in fetched.items():
+            if cache is not None and not isinstance(result, BaseException):
+                cache.put(keys[name], result, provider=name, model=router.model(name))
+        results.update(fetched)
+    return results
+
+
+def summarize_chunks(chunks, map_prompt, combine_prompt, budget_tokens, provider=DEFAULT_PROVIDER, fallback=False,
+                     model=None, max_tokens=CHUNK_SUMMARY_TOKENS, temperature=None, cache=None, refresh=False,
+                     router=None, on_progress=None):
+    # chunks: {label: text}. Every chunk is summarized concurrently (within
+    # the provider limits) with map_prompt(text); consecutive summaries are
+    # then merged with combine_prompt([blocks]) until all of them fit in
+    # budget_tokens. Requests are cached on their own text with no dataset
+    # key, so after a small edit only the changed chunks are asked again.
+    # Returns ["[label]\nsummary"] in chunk order; on_progress(done, total)
+    # follows the map step.
+    options = {'provider': provider, 'fallback': fallback, 'model': model, 'max_tokens': max_tokens,
+               'temperature': temperature, 'cache': cache, 'refresh': refresh, 'router': router or default_router()}
+
+    def run(prompts, progress=None):
+        results = {}
+        for name, text, error in complete_all(prompts, **options):
+            if error is not None:
+                raise error
+            results[name] = text
+            if progress:
+                progress(len(results), len(prompts))
+        return results
+
+    summaries = run({label: map_prompt(text) for label, text in chunks.items()}, on_progress)
+    # (first label, last label, summary) of consecutive chunk ranges
+    blocks = [(label, label, summaries[label]) for label in chunks]
+    formatted = lambda group: [f"[{first}]\n{text}" if first == last else f"[{first} to {last}]\n{text}"
+                               for first, last, text in group]
+    while len(blocks) > 1 and estimate_tokens("\n\n".join(formatted(blocks))) > budget_tokens:
+        groups, group = [], []
+        for block in blocks:
+            if group and estimate_tokens(combine_prompt(formatted(group + [block]))) > budget_tokens:
+                groups.append(group)
+                group = []
+            group.append(block)
+        groups.append(group)
+        if len(groups) == len(blocks):
+            break  # every summary fills the budget on its own
+        merged = run({str(i): combine_prompt(formatted(group)) for i, group in enumerate(groups) if len(group) > 1})
+        blocks = [group[0] if len(group) == 1 else (group[0][0], group[-1][1], merged[str(i)])
+                  for i, group in enumerate(groups)]
+    return formatted(blocks)
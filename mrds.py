@@ -0,0 +1,243 @@
+# ========================================
+# Offline MRDS Engine
+# ========================================
+# The MRDS search API is gone, so the full USGS Mineral Resources Data System
+# CSV is ingested once (in chunks) into a typed Parquet store under the cache
+# directory. MRDSIndex loads the store with low-cardinality text columns as
+# categoricals and builds two indexes in memory: a KD-tree over unit-sphere
+# site vectors for radius searches, and an inverted index from normalized
+# commodity, deposit type, model and state terms to row positions. Queries
+# intersect the posting lists and run locally in milliseconds.
+import datetime
+import io
+import json
+import os
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+
+from geo import SphereIndex, haversine_km
+from ingest import CACHE_DIR
+
+MRDS_CSV_URL = os.getenv("MRDS_CSV_URL", "https://mrdata.usgs.gov/mrds/mrds.csv")
+MRDS_DIR = os.path.join(CACHE_DIR, "mrds")
+MRDS_STORE_VERSION = 1
+MRDS_CHUNK_ROWS = 50000
+DOWNLOAD_TIMEOUT = 120
+
+COMMODITY_COLUMNS = ['commod1', 'commod2', 'commod3']
+YEAR_COLUMNS = ['disc_yr', 'yr_fst_prd', 'yr_lst_prd', 'yrfst_prd', 'yrlst_prd']
+# Read back as pandas categoricals (dictionary-encoded in the store as well)
+CATEGORY_COLUMNS = ['region', 'country', 'state', 'county', 'com_type', 'oper_type', 'dep_type',
+                    'prod_size', 'dev_stat', 'work_type', 'model', 'score']
+# Field name -> source columns for the inverted index
+INDEX_FIELDS = {
+    'commodity': COMMODITY_COLUMNS,
+    'dep_type': ['dep_type'],
+    'model': ['model'],
+    'state': ['state'],
+}
+# Commodity columns hold lists such as "Gold, Silver; Copper"
+TERM_SEPARATOR = r'\s*[,;]\s*'
+
+
+def normalize_term(value):
+    return re.sub(r'\s+', ' ', str(value)).strip().lower()
+
+
+def store_path(directory=MRDS_DIR):
+    return os.path.join(directory, f"mrds_v{MRDS_STORE_VERSION}.parquet")
+
+
+def store_info(directory=MRDS_DIR):
+    manifest = os.path.join(directory, f"mrds_v{MRDS_STORE_VERSION}.json")
+    if not os.path.exists(store_path(directory)) or not os.path.exists(manifest):
+        return None
+    with open(manifest) as f:
+        return json.load(f)
+
+
+def download_csv(url=MRDS_CSV_URL, directory=MRDS_DIR, progress=None):
+    # Streams the download to disk; the file is several hundred MB
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, os.path.basename(url.split('?')[0]) or "mrds.csv")
+    with requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        total = int(response.headers.get('Content-Length') or 0)
+        done = 0
+        with open(path + ".partial", 'wb') as f:
+            for block in response.iter_content(chunk_size=1024 * 1024):
+                f.write(block)
+                done += len(block)
+                if progress:
+                    progress(done, total)
+    os.replace(path + ".partial", path)
+    return path
+
+
+def _open_csv(source):
+    # Path, file-like or bytes; zip archives are opened at their first .csv
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        member = next(name for name in archive.namelist() if name.lower().endswith('.csv'))
+        return archive.open(member)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def _typed_chunk(chunk):
+    chunk.columns = [normalize_term(col).replace(' ', '_') for col in chunk.columns]
+    for col in ['latitude', 'longitude']:
+        if col in chunk.columns:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+    for col in YEAR_COLUMNS:
+        if col in chunk.columns:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('Int32')
+    return chunk
+
+
+def _store_schema(columns):
+    # Declared rather than inferred from the first chunk, where a sparse column
+    # that is still all-empty would come out as Arrow type null
+    types = {**{col: pa.float64() for col in ['latitude', 'longitude']}, **{col: pa.int32() for col in YEAR_COLUMNS}}
+    return pa.schema([(col, types.get(col, pa.string())) for col in columns])
+
+
+def build_store(source, directory=MRDS_DIR, chunk_rows=MRDS_CHUNK_ROWS, progress=None):
+    # One pass over the CSV, one Parquet row group per chunk. Returns the manifest.
+    os.makedirs(directory, exist_ok=True)
+    path = store_path(directory)
+    partial = path + ".partial"
+    writer = schema = None
+    rows = 0
+    try:
+        reader = pd.read_csv(_open_csv(source), dtype=str, chunksize=chunk_rows,
+                             encoding='utf-8', encoding_errors='replace', on_bad_lines='skip')
+        for chunk in reader:
+            chunk = _typed_chunk(chunk)
+            if schema is None:
+                schema = _store_schema(chunk.columns)
+                writer = pq.ParquetWriter(partial, schema, compression='zstd')
+            writer.write_table(pa.Table.from_pandas(chunk.reindex(columns=schema.names), schema=schema, preserve_index=False))
+            rows += len(chunk)
+            if progress:
+                progress(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if schema is None:
+        raise ValueError("MRDS CSV contains no rows")
+    os.replace(partial, path)
+
+    manifest = {
+        'version': MRDS_STORE_VERSION,
+        'rows': rows,
+        'columns': schema.names,
+        'source': source if isinstance(source, str) else getattr(source, 'name', 'upload'),
+        'built_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(directory, f"mrds_v{MRDS_STORE_VERSION}.json"), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_store(directory=MRDS_DIR, columns=None):
+    path = store_path(directory)
+    available = pq.read_schema(path).names
+    table = pq.read_table(path, columns=columns,
+                          read_dictionary=[col for col in CATEGORY_COLUMNS if col in available])
+    return table.to_pandas()
+
+
+def _union(arrays):
+    if len(arrays) == 1:
+        return arrays[0]
+    merged = np.sort(np.concatenate(arrays))
+    return merged[np.r_[True, merged[1:] != merged[:-1]]] if len(merged) else merged
+
+
+def _postings(df, columns, split=False):
+    # term -> sorted row positions. Each column is factorized once and only
+    # its distinct values are split and normalized in Python.
+    rows_by_term = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[col].astype(object))
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        groups = np.split(order[np.count_nonzero(codes < 0):], np.cumsum(counts)[:-1])
+        for value, rows in zip(uniques, groups):
+            terms = re.split(TERM_SEPARATOR, str(value)) if split else [value]
+            for term in {normalize_term(t) for t in terms} - {""}:
+                rows_by_term.setdefault(term, []).append(rows)
+    return {term: _union(groups) for term, groups in rows_by_term.items()}
+
+
+class MRDSIndex:
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.postings = {
+            field: _postings(self.df, columns, split=(field == 'commodity'))
+            for field, columns in INDEX_FIELDS.items()
+        }
+        self.sites = SphereIndex(self.df.get('latitude', pd.Series(dtype=float)),
+                                 self.df.get('longitude', pd.Series(dtype=float)))
+
+    @classmethod
+    def load(cls, directory=MRDS_DIR):
+        return cls(load_store(directory))
+
+    def __len__(self):
+        return len(self.df)
+
+    def terms(self, field):
+        # Terms of an indexed field, most frequent first
+        postings = self.postings[field]
+        return sorted(postings, key=lambda term: -len(postings[term]))
+
+    def lookup(self, field, values):
+        # Row positions matching any of `values` (case-insensitive exact terms)
+        if isinstance(values, str):
+            values = re.split(TERM_SEPARATOR, values)
+        postings = self.postings[field]
+        hits = [postings[term] for term in map(normalize_term, values) if term in postings]
+        return _union(hits) if hits else np.empty(0, dtype=np.int64)
+
+    def within(self, lat, lon, radius_km):
+        return self.sites.within(lat, lon, radius_km)
+
+    def query(self, commodity=None, state=None, dep_type=None, model=None, near=None, radius_km=None, limit=None):
+        # Filters are ANDed; each filter accepts one term or a list (ORed).
+        # With `near` (lat, lon) results gain a distance_km column and are
+        # ordered nearest first.
+        candidates = [self.lookup(field, values)
+                      for field, values in (('commodity', commodity), ('state', state), ('dep_type', dep_type), ('model', model))
+                      if values]
+        if near is not None and radius_km:
+            candidates.append(self.within(near[0], near[1], radius_km))
+        if candidates:
+            # Start from the smallest set and filter it through membership masks
+            candidates.sort(key=len)
+            selected = candidates[0]
+            for rows in candidates[1:]:
+                member = np.zeros(len(self.df), dtype=bool)
+                member[rows] = True
+                selected = selected[member[selected]]
+        else:
+            selected = np.arange(len(self.df))
+
+        result = self.df.iloc[selected]
+        if near is not None:
+            distance = haversine_km(near[0], near[1], result['latitude'].to_numpy(dtype=float),
+                                    result['longitude'].to_numpy(dtype=float))
+            result = result.assign(distance_km=distance).sort_values('distance_km', na_position='last')
+        return result.head(limit) if limit else result
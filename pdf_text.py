@@ -0,0 +1,160 @@
+# ========================================
+# PDF Text and Table Extraction
+# ========================================
+# Extracts the text and tables of PDF documents (NI 43-101 / JORC technical
+# reports, USGS bulletins) page by page. Large documents are split into page
+# batches across a process pool; every worker opens the PDF once and results
+# are handed to an on_page callback as batches finish, so the UI can stream
+# progress. Finished extractions are cached by file hash, and extracted
+# tables come back as typed DataFrames (or a Workbook) for the assay stages.
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+import pdfplumber
+
+from ingest import CACHE_DIR, Workbook, coerce_types, file_hash
+
+PDF_CACHE_DIR = os.path.join(CACHE_DIR, "pdf_text")
+PDF_CACHE_VERSION = 1
+BATCH_PAGES = 8
+# Below this page count the process pool costs more than it saves
+PARALLEL_MIN_PAGES = 24
+
+
+def _extract_page(page, tables):
+    result = {'page': page.page_number - 1, 'text': page.extract_text() or "", 'tables': []}
+    if tables:
+        result['tables'] = [table for table in page.extract_tables() if table and len(table) > 1]
+    page.close()  # drop pdfplumber's per-page object cache
+    return result
+
+
+_worker_pdf = None
+
+
+def _init_pdf_worker(path):
+    # Each worker parses the PDF structure once and reuses it for every batch
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(path)
+
+
+def _extract_batch(start, stop, tables):
+    return [_extract_page(_worker_pdf.pages[i], tables) for i in range(start, stop)]
+
+
+def table_frame(rows):
+    # First row becomes the header when it is fully populated; repeated or
+    # blank header cells are made unique
+    header = rows[0]
+    if all(cell not in (None, "") for cell in header):
+        names, seen = [], {}
+        for cell in header:
+            name = " ".join(str(cell).split())
+            seen[name] = seen.get(name, 0) + 1
+            names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+        df = pd.DataFrame(rows[1:], columns=names)
+    else:
+        df = pd.DataFrame(rows, columns=[f"col_{i}" for i in range(len(header))])
+    df = df.replace({"": None})
+    return coerce_types(df)
+
+
+class PdfDocument:
+    def __init__(self, digest, name, pages):
+        self.digest = digest
+        self.name = name
+        self.pages = sorted(pages, key=lambda page: page['page'])
+
+    def __len__(self):
+        return len(self.pages)
+
+    @property
+    def page_texts(self):
+        return [page['text'] for page in self.pages]
+
+    @property
+    def text(self):
+        return "\n\n".join(self.page_texts)
+
+    def tables(self):
+        # [(page index, DataFrame)] in page order
+        return [(page['page'], table_frame(rows)) for page in self.pages for rows in page['tables']]
+
+    def table_workbook(self):
+        # Tables as a Workbook ("p12_t1", ...) so workbook-based stages
+        # (assay statistics, prompts, export) accept them unchanged
+        sheets, counts = {}, {}
+        for page_no, frame in self.tables():
+            counts[page_no] = counts.get(page_no, 0) + 1
+            sheets[f"p{page_no + 1}_t{counts[page_no]}"] = frame
+        return Workbook(self.digest, self.name, sheets)
+
+
+def _cache_path(digest):
+    return os.path.join(PDF_CACHE_DIR, f"v{PDF_CACHE_VERSION}", f"{digest}.json")
+
+
+def read_cached_pdf(digest):
+    path = _cache_path(digest)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        cached = json.load(f)
+    return PdfDocument(digest, cached['name'], cached['pages'])
+
+
+def _write_cached_pdf(document):
+    path = _cache_path(document.digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", 'w') as f:
+        json.dump({'name': document.name, 'pages': document.pages}, f)
+    os.replace(path + ".tmp", path)
+
+
+def extract_pdf(data, name="", digest=None, tables=True, workers=None, batch_pages=BATCH_PAGES,
+                on_page=None, use_cache=True):
+    # Returns a PdfDocument. on_page(page, done, total) is called in the
+    # calling thread for every page as its batch completes (in completion
+    # order, not page order).
+    digest = digest or file_hash(data)
+    if use_cache:
+        cached = read_cached_pdf(digest)
+        if cached is not None:
+            return cached
+
+    workers = workers or os.cpu_count() or 1
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+    pages = []
+    try:
+        with pdfplumber.open(tmp.name) as pdf:
+            total = len(pdf.pages)
+            parallel = workers > 1 and total >= PARALLEL_MIN_PAGES
+            for page in ([] if parallel else pdf.pages):
+                pages.append(_extract_page(page, tables))
+                if on_page:
+                    on_page(pages[-1], len(pages), total)
+        if parallel:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_pdf_worker, initargs=(tmp.name,)) as pool:
+                pending = {pool.submit(_extract_batch, start, min(start + batch_pages, total), tables)
+                           for start in range(0, total, batch_pages)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for page in future.result():
+                            pages.append(page)
+                            if on_page:
+                                on_page(page, len(pages), total)
+    finally:
+        os.remove(tmp.name)
+
+    document = PdfDocument(digest, name, pages)
+    if use_cache:
+        _write_cached_pdf(document)
+    return document
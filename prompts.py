@@ -0,0 +1,171 @@
+# ========================================
+# AI Prompt Builder
+# ========================================
+# Builds the data section of AI prompts from parsed workbook frames. A compact
+# summary (schema, per-column statistics, top values and a few sample rows)
+# comes first; raw rows are then streamed in blocks into a bounded buffer that
+# stops at the token budget, so prompt size never depends on workbook size.
+# Workbooks too large for one prompt can instead be split into sheet / row
+# block chunks for map-reduce analysis: every chunk is summarized on its own
+# and the summaries are combined into the final analysis prompt.
+import pandas as pd
+
+# Rough chars-per-token ratio for English/CSV text with GPT-style tokenizers
+CHARS_PER_TOKEN = 4
+# ~100,000 characters, the old hard truncation limit
+DEFAULT_TOKEN_BUDGET = 25000
+SAMPLE_ROWS = 5
+TOP_VALUES = 5
+ROW_BLOCK = 500
+# Map-reduce chunks: fixed row blocks so a cell edit only changes its own
+# chunk; a block above the chunk budget is halved until it fits
+CHUNK_ROWS = 2000
+DEFAULT_CHUNK_TOKENS = 8000
+
+CHUNK_SUMMARY_PROMPT = """Summarize this block of mining data for a later combined analysis. Report the metals and ores
+present, locations and coordinates, sample and hole identifiers, grade ranges and notable high values, geological
+characteristics and any anomalies or data quality issues. Be factual and concise; keep key numbers.
+
+{chunk}"""
+
+COMBINE_SUMMARIES_PROMPT = """Combine these partial summaries of consecutive blocks of one mining dataset into a single
+summary. Keep every distinct metal, location, grade range and anomaly, and the key numbers.
+
+{summaries}"""
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class PromptBuffer:
+    def __init__(self, max_tokens=DEFAULT_TOKEN_BUDGET):
+        self.max_chars = max_tokens * CHARS_PER_TOKEN
+        self.parts = []
+        self.size = 0
+        self.truncated = False
+
+    @property
+    def remaining(self):
+        return self.max_chars - self.size
+
+    def write(self, text):
+        # Returns False once the budget is exhausted; partial writes are cut
+        # at the last complete line so rows are never split
+        if self.truncated:
+            return False
+        if len(text) > self.remaining:
+            cut = text[:self.remaining]
+            cut = cut[:cut.rfind("\n") + 1]
+            self.parts.append(cut)
+            self.size += len(cut)
+            self.truncated = True
+            return False
+        self.parts.append(text)
+        self.size += len(text)
+        return True
+
+    def getvalue(self):
+        text = "".join(self.parts)
+        if self.truncated:
+            text += "... (truncated at token budget)\n"
+        return text
+
+
+def _fmt(value):
+    if pd.isna(value):
+        return "NA"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def summarize_sheet(name, df, sample_rows=SAMPLE_ROWS, top_values=TOP_VALUES):
+    lines = [f"Sheet: {name} ({len(df):,} rows x {len(df.columns)} columns)", "Schema:"]
+    non_null = df.notna().sum()
+    for col in df.columns:
+        lines.append(f"- {col}: {df[col].dtype} ({non_null[col]:,} non-null)")
+
+    numeric = df.select_dtypes(include='number')
+    if not numeric.empty:
+        # One describe() pass covers every numeric column
+        described = numeric.describe(percentiles=[0.1, 0.5, 0.9]).T
+        lines.append("Numeric column statistics (count, mean, min, p10, p50, p90, max):")
+        for col, row in described.iterrows():
+            lines.append(
+                f"- {col}: n={int(row['count'])}, mean={_fmt(row['mean'])}, min={_fmt(row['min'])}, "
+                f"p10={_fmt(row['10%'])}, p50={_fmt(row['50%'])}, p90={_fmt(row['90%'])}, max={_fmt(row['max'])}"
+            )
+
+    text_cols = [col for col in df.columns if col not in numeric.columns]
+    if text_cols:
+        lines.append(f"Top values per text column (up to {top_values}):")
+        for col in text_cols:
+            counts = df[col].value_counts().head(top_values)
+            if not counts.empty:
+                lines.append(f"- {col}: " + ", ".join(f"{_fmt(v)} ({c})" for v, c in counts.items()))
+
+    if sample_rows and len(df):
+        lines.append(f"Sample rows (first {min(sample_rows, len(df))}):")
+        lines.append(df.head(sample_rows).to_csv(index=False).rstrip("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def build_data_prompt(workbook, budget_tokens=DEFAULT_TOKEN_BUDGET, include_rows=True, sample_rows=SAMPLE_ROWS):
+    buf = PromptBuffer(budget_tokens)
+    for name, df in workbook.sheets.items():
+        if not buf.write(summarize_sheet(name, df, sample_rows=sample_rows)):
+            return buf.getvalue()
+    if include_rows:
+        # Whatever budget is left goes to raw rows, streamed a block at a time
+        for name, df in workbook.sheets.items():
+            if len(df) <= sample_rows:
+                continue
+            if not buf.write(f"Rows from sheet {name}:\n" + ",".join(str(c) for c in df.columns) + "\n"):
+                break
+            for start in range(sample_rows, len(df), ROW_BLOCK):
+                block = df.iloc[start:start + ROW_BLOCK].to_csv(index=False, header=False)
+                if not buf.write(block):
+                    return buf.getvalue()
+            buf.write("\n")
+    return buf.getvalue()
+
+
+def _row_blocks(label, header, render, start, stop, max_chars):
+    # [(label, text)] for rows start:stop, halving blocks that are too large
+    text = render(start, stop)
+    if len(text) + len(header) > max_chars and stop - start > 1:
+        middle = (start + stop) // 2
+        return (_row_blocks(label, header, render, start, middle, max_chars)
+                + _row_blocks(label, header, render, middle, stop, max_chars))
+    return [(f"{label}, rows {start + 1:,}-{stop:,}", header + text)]
+
+
+def sheet_chunks(name, total_rows, render, header="", chunk_tokens=DEFAULT_CHUNK_TOKENS, chunk_rows=CHUNK_ROWS):
+    # render(start, stop) -> text of rows start:stop
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks = []
+    for start in range(0, total_rows, chunk_rows):
+        for label, text in _row_blocks(f"Sheet {name}", header, render, start, min(start + chunk_rows, total_rows),
+                                       max_chars):
+            # No sheet-wide totals in the text, so other rows never change a block
+            chunks.append((label, f"{label}:\n{text}"))
+    return chunks
+
+
+def workbook_chunks(workbook, chunk_tokens=DEFAULT_CHUNK_TOKENS, chunk_rows=CHUNK_ROWS):
+    # {label: chunk text} over every row of every sheet, in sheet order
+    chunks = {}
+    for name, df in workbook.sheets.items():
+        header = ",".join(str(c) for c in df.columns) + "\n"
+        render = lambda start, stop, df=df: df.iloc[start:stop].to_csv(index=False, header=False)
+        chunks.update(sheet_chunks(name, len(df), render, header, chunk_tokens, chunk_rows))
+    return chunks
+
+
+def chunk_summary_prompt(chunk):
+    return CHUNK_SUMMARY_PROMPT.format(chunk=chunk)
+
+
+def combine_summaries_prompt(summaries):
+    return COMBINE_SUMMARIES_PROMPT.format(summaries="\n\n".join(summaries))
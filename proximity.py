@@ -0,0 +1,64 @@
+# ========================================
+# Sample Proximity (Spatial Join)
+# ========================================
+# Attaches to every located sample of an uploaded workbook the nearest known
+# MRDS deposit, the great-circle distance to it and the number of BLM claims
+# within a radius. Reference datasets are indexed once (SphereIndex) and the
+# samples are queried in batches; summarize_proximity() condenses the result
+# for the analyst report prompt.
+import numpy as np
+import pandas as pd
+
+from geo import SphereIndex
+
+DEFAULT_CLAIM_RADIUS_KM = 5.0
+SITE_COLUMNS = {'site_name': 'nearest_site', 'mrds_id': 'nearest_mrds_id', 'commod1': 'nearest_site_commodities',
+                'dev_stat': 'nearest_site_status'}
+
+
+def join_samples(df, lat_col='LATITUDE', lon_col='LONGITUDE', mrds_index=None, claim_index=None,
+                 claim_radius_km=DEFAULT_CLAIM_RADIUS_KM, max_site_km=None):
+    # Returns a frame aligned with `df` holding only the joined columns;
+    # samples without coordinates (or beyond max_site_km) get NaN
+    lat, lon = df[lat_col], df[lon_col]
+    joined = pd.DataFrame(index=df.index)
+    if mrds_index is not None:
+        distance, position = mrds_index.sites.nearest(lat, lon, max_km=max_site_km)
+        found = position >= 0
+        sites = mrds_index.df
+        for source, target in SITE_COLUMNS.items():
+            if source in sites.columns:
+                values = pd.Series(np.nan, index=df.index, dtype=object)
+                values[found] = sites[source].astype(object).to_numpy()[position[found]]
+                joined[target] = values
+        joined['nearest_site_km'] = distance
+    if claim_index is not None:
+        joined[f'claims_within_{claim_radius_km:g}km'] = claim_index.count_within(lat, lon, claim_radius_km)
+    return joined
+
+
+def build_claim_index(claims):
+    # SphereIndex over a frame of claims with latitude/longitude columns
+    return SphereIndex(claims['latitude'], claims['longitude'])
+
+
+def summarize_proximity(joined, top=5):
+    # Short plain-text summary of a join_samples() result for AI prompts
+    lines = []
+    if 'nearest_site_km' in joined.columns and joined['nearest_site_km'].notna().any():
+        distance = joined['nearest_site_km']
+        lines.append(f"{int(distance.notna().sum())} located samples; distance to nearest MRDS site: "
+                     f"min {distance.min():.2f} km, median {distance.median():.2f} km, max {distance.max():.2f} km.")
+        sites = joined.dropna(subset=['nearest_site_km']).groupby('nearest_site', sort=False).agg(
+            samples=('nearest_site_km', 'size'), closest_km=('nearest_site_km', 'min'))
+        if 'nearest_site_commodities' in joined.columns:
+            sites = sites.join(joined.groupby('nearest_site')['nearest_site_commodities'].first())
+        for name, row in sites.sort_values('samples', ascending=False).head(top).iterrows():
+            commodities = f" ({row['nearest_site_commodities']})" if pd.notna(row.get('nearest_site_commodities')) else ""
+            lines.append(f"- {name}{commodities}: nearest site for {row['samples']} samples, closest {row['closest_km']:.2f} km")
+    for col in [c for c in joined.columns if c.startswith('claims_within_')]:
+        radius = col[len('claims_within_'):]
+        counts = joined[col]
+        lines.append(f"Claims within {radius} of samples: {int((counts > 0).sum())} of {len(counts)} samples overlap claims "
+                     f"(max {int(counts.max()) if len(counts) else 0} claims around a single sample).")
+    return "\n".join(lines)
@@ -0,0 +1,248 @@
+# ========================================
+# Local Retrieval Index
+# ========================================
+# BM25 full-text index over chunks of the Bulletin 1693 text, uploaded PDF
+# reports and MRDS site descriptions, so AI prompts carry the top-k relevant
+# passages instead of the first few thousand characters of a document. The
+# inverted index is stored CSR-style (term offsets into doc-id / term-freq
+# arrays) and persisted under the cache directory, keyed by a fingerprint of
+# its sources. When sentence-transformers is installed, chunks can also be
+# embedded locally and results are fused with BM25 by reciprocal rank.
+import hashlib
+import json
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+
+from ingest import CACHE_DIR
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Embeddings are optional; BM25 works on its own
+    SentenceTransformer = None
+
+RETRIEVAL_DIR = os.path.join(CACHE_DIR, "retrieval")
+RETRIEVAL_VERSION = 1
+# Older index directories beyond this many are removed when a new one is saved
+MAX_SAVED_INDEXES = 4
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 30
+DEFAULT_TOP_K = 6
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+# Largest MRDS query result indexed site by site
+MAX_INDEXED_SITES = 20000
+EMBEDDING_MODEL = os.getenv("RETRIEVAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# MRDS fields composed into one searchable description per site
+MRDS_TEXT_COLUMNS = ['site_name', 'state', 'county', 'commod1', 'commod2', 'commod3', 'dep_type', 'model', 'ore',
+                     'gangue', 'orebody_fm', 'alteration', 'ore_ctrl', 'dev_stat']
+
+STOPWORDS = set("""a an and are as at be by for from has have in is it its of on or that the this to was were which
+with within without into than then there these those such not no can may also other""".split())
+TOKEN = re.compile(r'[a-z0-9]+(?:[-.][a-z0-9]+)*')
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(str(text).lower()) if token not in STOPWORDS]
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    words = str(text).split()
+    step = max(chunk_words - overlap, 1)
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, max(len(words) - overlap, 1), step)
+            if words[start:start + chunk_words]]
+
+
+_embedder = None
+
+
+def embeddings_available():
+    return SentenceTransformer is not None
+
+
+def embed_texts(texts):
+    # Normalized float32 embeddings; the model is loaded once per process
+    global _embedder
+    if _embedder is None:
+        _embedder = SentenceTransformer(EMBEDDING_MODEL)
+    return _embedder.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def fingerprint(*parts):
+    return hashlib.sha256("|".join(map(str, parts)).encode()).hexdigest()[:16]
+
+
+def bulletin_chunks(bulletin):
+    # Page chunks labelled with the deposit model(s) whose section covers the page
+    models_by_page = {}
+    for model, entries in bulletin.sections.items():
+        for entry in entries:
+            for page_no in range(entry['start'][0], min(entry['end'][0], len(bulletin.pages) - 1) + 1):
+                models_by_page.setdefault(page_no, []).append(model)
+    chunks = []
+    for page_no, text in enumerate(bulletin.pages):
+        models = models_by_page.get(page_no)
+        ref = f"p. {page_no + 1}" + (f" (Model {', '.join(models)})" if models else "")
+        chunks += [{'source': "USGS Bulletin 1693", 'ref': ref, 'text': chunk} for chunk in chunk_text(text)]
+    return chunks
+
+
+def pdf_chunks(document):
+    return [{'source': document.name or "Uploaded report", 'ref': f"p. {page['page'] + 1}", 'text': chunk}
+            for page in document.pages for chunk in chunk_text(page['text'])]
+
+
+def mrds_chunks(df, max_sites=MAX_INDEXED_SITES):
+    # One chunk per site: "site_name: X | state: Nevada | commod1: Gold | ..."
+    df = df.head(max_sites)
+    columns = [col for col in MRDS_TEXT_COLUMNS if col in df.columns]
+    if not columns:
+        return []
+    parts = [(col + ": " + df[col].astype(object).astype(str)).where(df[col].notna(), "") for col in columns]
+    text = parts[0].str.cat(parts[1:], sep=" | ").str.replace(r'(\s\|\s)+', ' | ', regex=True).str.strip(' |')
+    refs = df['mrds_id'].astype(str) if 'mrds_id' in df.columns else df.index.astype(str)
+    return [{'source': "USGS MRDS", 'ref': ref, 'text': body} for ref, body in zip(refs, text) if body]
+
+
+class RetrievalIndex:
+    def __init__(self, chunks, vocabulary, offsets, doc_ids, term_freqs, doc_lengths, embeddings=None):
+        self.chunks = chunks
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.doc_lengths = doc_lengths
+        self.embeddings = embeddings
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        document_freq = np.diff(offsets)
+        self.idf = np.log1p((len(chunks) - document_freq + 0.5) / (document_freq + 0.5))
+
+    @classmethod
+    def build(cls, chunks, embed=False):
+        vocabulary, term_ids, docs, freqs = {}, [], [], []
+        doc_lengths = np.zeros(len(chunks), dtype=np.int32)
+        for doc, chunk in enumerate(chunks):
+            tokens = tokenize(chunk['text'])
+            doc_lengths[doc] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                docs.append(doc)
+                freqs.append(count)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))])
+        embeddings = None
+        if embed and SentenceTransformer is not None and chunks:
+            embeddings = embed_texts(chunk['text'] for chunk in chunks)
+        return cls(chunks, vocabulary, offsets.astype(np.int64), np.asarray(docs, dtype=np.int32)[order],
+                   np.asarray(freqs, dtype=np.int32)[order], doc_lengths, embeddings)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def bm25(self, query):
+        scores = np.zeros(len(self.chunks))
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            docs, tf = self.doc_ids[start:stop], self.term_freqs[start:stop]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[docs] / max(self.avg_length, 1e-9))
+            scores[docs] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, k=DEFAULT_TOP_K, sources=None, per_source=None):
+        # Top-k chunks (with 'score') for the query, optionally limited to
+        # sources and to at most per_source chunks from any one source
+        if not self.chunks or k <= 0:
+            return []
+        scores = self.bm25(query)
+        if sources is not None:
+            allowed = np.array([chunk['source'] in sources for chunk in self.chunks])
+            scores = np.where(allowed, scores, 0.0)
+        if self.embeddings is not None and SentenceTransformer is not None:
+            # Reciprocal rank fusion of the BM25 and embedding rankings
+            similarity = self.embeddings @ embed_texts([query])[0]
+            if sources is not None:
+                similarity = np.where(allowed, similarity, -np.inf)
+            fused = np.zeros(len(self.chunks))
+            for ranking in (scores, similarity):
+                ranks = np.empty(len(ranking), dtype=np.int64)
+                ranks[np.argsort(-ranking, kind='stable')] = np.arange(len(ranking))
+                fused += 1.0 / (RRF_K + ranks + 1)
+            fused[(scores <= 0) & ~np.isfinite(similarity)] = 0.0
+            scores = fused
+        if per_source:
+            matched = np.flatnonzero(scores > 0)
+            top, taken = [], Counter()
+            for i in matched[np.argsort(-scores[matched], kind='stable')]:
+                source = self.chunks[i]['source']
+                if taken[source] < per_source:
+                    taken[source] += 1
+                    top.append(i)
+                    if len(top) == k:
+                        break
+        else:
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+        return [{**self.chunks[i], 'score': float(scores[i])} for i in top if scores[i] > 0]
+
+    def context(self, query, k=DEFAULT_TOP_K, max_chars=6000, sources=None, per_source=None):
+        # Top-k chunks formatted for a prompt, within a character budget
+        parts, used = [], 0
+        for hit in self.search(query, k, sources, per_source):
+            block = f"[{hit['source']}, {hit['ref']}]\n{hit['text']}"
+            if used + len(block) > max_chars:
+                break
+            parts.append(block)
+            used += len(block)
+        return "\n\n".join(parts)
+
+    def save(self, directory):
+        tmp = directory + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        with open(os.path.join(tmp, "chunks.json"), 'w') as f:
+            json.dump(self.chunks, f)
+        with open(os.path.join(tmp, "vocabulary.json"), 'w') as f:
+            json.dump(self.vocabulary, f)
+        np.savez(os.path.join(tmp, "postings.npz"), offsets=self.offsets, doc_ids=self.doc_ids,
+                 term_freqs=self.term_freqs, doc_lengths=self.doc_lengths)
+        if self.embeddings is not None:
+            np.save(os.path.join(tmp, "embeddings.npy"), self.embeddings)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp, directory)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "chunks.json")) as f:
+            chunks = json.load(f)
+        with open(os.path.join(directory, "vocabulary.json")) as f:
+            vocabulary = json.load(f)
+        postings = np.load(os.path.join(directory, "postings.npz"))
+        embeddings_path = os.path.join(directory, "embeddings.npy")
+        embeddings = np.load(embeddings_path) if os.path.exists(embeddings_path) else None
+        return cls(chunks, vocabulary, postings['offsets'], postings['doc_ids'], postings['term_freqs'],
+                   postings['doc_lengths'], embeddings)
+
+
+def load_or_build(key, make_chunks, embed=False, root=RETRIEVAL_DIR):
+    # Index for `key` (a fingerprint of its sources) from disk, or built from
+    # make_chunks() and saved; only the most recent indexes are kept
+    directory = os.path.join(root, f"v{RETRIEVAL_VERSION}", f"{key}{'-emb' if embed else ''}")
+    if os.path.exists(os.path.join(directory, "postings.npz")):
+        return RetrievalIndex.load(directory)
+    index = RetrievalIndex.build(make_chunks(), embed=embed)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    index.save(directory)
+    saved = sorted((os.path.join(os.path.dirname(directory), name) for name in os.listdir(os.path.dirname(directory))),
+                   key=os.path.getmtime, reverse=True)
+    for old in saved[MAX_SAVED_INDEXES:]:
+        shutil.rmtree(old, ignore_errors=True)
+    return index
@@ -0,0 +1,106 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from blm import ClaimHarvester
+
+
+class StandIn:
+    # Minimal ArcGIS query endpoint: object IDs 1..records, pages by objectIds
+    # or resultOffset, and an ArcGIS error for pages listed in `fail_once`
+    def __init__(self, records=25, ids=True):
+        self.records = records
+        self.ids = ids
+        self.fail_once = set()
+        self.pages = []
+        self.lock = threading.Lock()
+
+    def answer(self, params):
+        if params.get("returnIdsOnly") == "true":
+            if not self.ids:
+                return {"error": {"message": "ids not supported"}}
+            return {"objectIdFieldName": "OBJECTID", "objectIds": list(range(self.records, 0, -1))}
+        if params.get("returnCountOnly") == "true":
+            return {"count": self.records}
+        if "objectIds" in params:
+            ids = [int(i) for i in params["objectIds"].split(",")]
+        else:
+            start = int(params["resultOffset"])
+            ids = list(range(start + 1, min(start + int(params["resultRecordCount"]), self.records) + 1))
+        with self.lock:
+            self.pages.append(ids[0])
+            if ids[0] in self.fail_once:
+                self.fail_once.discard(ids[0])
+                return {"error": {"message": "injected failure"}}
+        return {"features": [{"attributes": {"OBJECTID": i, "CSE_NR": f"NMC{i}"}} for i in ids]}
+
+
+@pytest.fixture
+def layer():
+    stand_in = StandIn()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+            payload = json.dumps(stand_in.answer({k: v[0] for k, v in parse_qs(body).items()})).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stand_in.url = f"http://127.0.0.1:{server.server_address[1]}/query"
+    yield stand_in
+    server.shutdown()
+    server.server_close()
+
+
+def harvester(layer, tmp_path, **options):
+    return ClaimHarvester("1=1", url=layer.url, out_dir=str(tmp_path / "harvest"), page_size=5, **options)
+
+
+def test_harvest_pages_by_object_id(layer, tmp_path):
+    claims = harvester(layer, tmp_path, workers=3)
+    assert claims.run() == 25
+    assert claims.complete
+    assert len(claims.part_files()) == 5
+    assert sorted(claims.read()['objectid']) == list(range(1, 26))
+
+
+def test_harvest_falls_back_to_offset_paging(layer, tmp_path):
+    layer.ids = False
+    claims = harvester(layer, tmp_path, workers=2)
+    assert claims.run() == 25
+    assert sorted(claims.read()['objectid']) == list(range(1, 26))
+
+
+def test_resume_after_failure_fetches_only_missing_pages(layer, tmp_path):
+    layer.fail_once = {11}
+    with pytest.raises(RuntimeError, match="injected failure"):
+        harvester(layer, tmp_path, workers=2).run()
+    done = harvester(layer, tmp_path).load_checkpoint()[1]
+    assert "2" not in done  # the page of IDs 11-15
+    fetched_before = len(layer.pages)
+
+    claims = harvester(layer, tmp_path, workers=2)
+    assert claims.run() == 25
+    assert len(layer.pages) - fetched_before == 5 - len(done)
+    assert sorted(claims.read()['objectid']) == list(range(1, 26))
+
+
+def test_failure_cancels_queued_pages(layer, tmp_path):
+    layer.fail_once = {1}
+    with pytest.raises(RuntimeError):
+        harvester(layer, tmp_path, workers=1).run()
+    # The failed page and at most the one page already picked up by the worker
+    assert len(layer.pages) <= 2
+    claims = harvester(layer, tmp_path)
+    assert all(claims._part_path(int(page)) in claims.part_files() for page in claims.load_checkpoint()[1])
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+import claims_store
+from claims_store import ClaimStore
+
+
+class StubHarvester:
+    # Stands in for ClaimHarvester: serves the current `layer` rows, filtered
+    # to rows edited after the timestamp when the where clause is a delta
+    layer = []
+    wheres = []
+
+    def __init__(self, where, url=None, out_dir=None, page_size=None, workers=None):
+        self.where = where
+        self.out_dir = out_dir or "/nonexistent"
+        StubHarvester.wheres.append(where)
+
+    def run(self, progress=None):
+        return len(self.layer)
+
+    def iter_frames(self):
+        rows = self.layer
+        if "TIMESTAMP" in self.where:
+            rows = [row for row in rows if row.get('last_edited_date', 0) > 1_000]
+        yield pd.DataFrame(rows)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(claims_store, "ClaimHarvester", StubHarvester)
+    monkeypatch.setattr(claims_store, "HARVEST_DIR", str(tmp_path / "harvest"))
+    StubHarvester.wheres = []
+    return ClaimStore(str(tmp_path / "claims.sqlite"))
+
+
+def claim(nr, **extra):
+    return {'cse_nr': nr, 'admin_state': "NM", 'claimant_name': f"Owner {nr}", **extra}
+
+
+def test_delta_sync_fetches_only_edited_claims(store):
+    StubHarvester.layer = [claim("NMC1", last_edited_date=1_000), claim("NMC2", last_edited_date=1_000)]
+    assert store.sync("nm") == 2
+    StubHarvester.layer = [claim("NMC1", last_edited_date=1_000), claim("NMC2", last_edited_date=2_000),
+                           claim("NMC3", last_edited_date=3_000)]
+    assert store.sync("nm") == 2
+    assert "LAST_EDITED_DATE > TIMESTAMP" in StubHarvester.wheres[-1]
+    assert store.count("NM") == 3
+    assert store.sync_state("NM")['last_edited'] == 3_000
+
+
+def test_full_resync_without_edit_field_drops_removed_claims(store):
+    StubHarvester.layer = [claim("NMC1"), claim("NMC2"), claim("NMC10")]
+    assert store.sync("nm") == 3
+    StubHarvester.layer = [claim("NMC2"), claim("NMC10"), claim("NMC9")]
+    assert store.sync("nm") == 3
+    assert StubHarvester.wheres[-1] == StubHarvester.wheres[0]
+    assert sorted(store.query("NM")['cse_nr']) == ["NMC10", "NMC2", "NMC9"]
+    assert store.sync_state("NM")['records'] == 3
@@ -0,0 +1,20 @@
+import pandas as pd
+
+from ingest import coerce_types
+
+
+def test_fully_numeric_text_column_becomes_float():
+    df = coerce_types(pd.DataFrame({'CU': ['1', '2.5', None]}, dtype=object))
+    assert df['CU'].dtype == float
+    assert df['CU'].iloc[1] == 2.5
+
+
+def test_detection_limits_are_kept():
+    df = coerce_types(pd.DataFrame({'AU': [0.5, '<0.005', 1.2]}, dtype=object))
+    assert df['AU'].tolist() == ['0.5', '<0.005', '1.2']
+
+
+def test_id_columns_are_never_coerced():
+    df = coerce_types(pd.DataFrame({'HOLE_ID': [101, 102, 'DDH-5'], 'SAMPLE_NO': ['7', '8', '9']}, dtype=object))
+    assert df['HOLE_ID'].tolist() == ['101', '102', 'DDH-5']
+    assert df['SAMPLE_NO'].tolist() == ['7', '8', '9']
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from llm import Provider, ProviderError, ResponseCache, Router, StreamStats, complete, stream_complete
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        super().__init__(f"HTTP {status_code}")
+
+
+class FakeProvider(Provider):
+    # Plays back `outcomes` (exceptions to raise or texts to return), one per
+    # attempt; `stall` makes every attempt hang instead
+    def __init__(self, name, *outcomes, key=True, stall=False, **options):
+        super().__init__(name, f"{name}-model", backoff=0, **options)
+        self.outcomes = list(outcomes)
+        self.key = key
+        self.stall = stall
+
+    def available(self):
+        return self.key
+
+    async def _generate(self, prompt, model, max_tokens, temperature):
+        if self.stall:
+            await asyncio.sleep(3600)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def test_route_skips_providers_without_a_key_only_with_fallback():
+    router = Router([FakeProvider("a", key=False), FakeProvider("b"), FakeProvider("c")])
+    assert router.route("a") == [("a", None)]
+    assert router.route("a", fallback=True, model="m") == [("b", None), ("c", None)]
+    assert router.route("c", fallback=True, model="m") == [("c", "m"), ("b", None)]
+
+
+def test_fallback_order_and_cache_key_of_answering_provider(tmp_path):
+    a, b, c = FakeProvider("a", StatusError(503), StatusError(503), retries=1), FakeProvider("b", StatusError(401)), \
+        FakeProvider("c", "from c")
+    router, cache = Router([a, b, c]), ResponseCache(str(tmp_path))
+    assert complete("q", provider="a", fallback=True, cache=cache, router=router) == "from c"
+    assert (a.calls, b.calls, c.calls) == (2, 1, 1)
+    assert cache.get(ResponseCache.key("c", "c-model", "q", 2000, None, "")) == "from c"
+    assert cache.get(ResponseCache.key("a", "a-model", "q", 2000, None, "")) is None
+
+
+def test_stream_records_and_caches_the_answering_provider(tmp_path):
+    router, cache = Router([FakeProvider("a", ValueError("bad request")), FakeProvider("b", "from b")]), \
+        ResponseCache(str(tmp_path))
+    stats = StreamStats()
+    assert "".join(stream_complete("q", provider="a", fallback=True, cache=cache, stats=stats, router=router)) == "from b"
+    assert (stats.provider, stats.model) == ("b", "b-model")
+    assert cache.get(ResponseCache.key("b", "b-model", "q", 2000, None, "")) == "from b"
+    assert cache.get(ResponseCache.key("a", "a-model", "q", 2000, None, "")) is None
+
+
+@pytest.mark.parametrize("error, calls", [
+    (StatusError(429), 3), (StatusError(502), 3), (asyncio.TimeoutError(), 3), (ConnectionError(), 3),
+    (StatusError(401), 1), (StatusError(400), 1), (ValueError("bad"), 1),
+])
+def test_only_transient_errors_are_retried(error, calls):
+    provider = FakeProvider("a", error, error, error, retries=2)
+    with pytest.raises(ProviderError):
+        complete("q", provider="a", router=Router([provider]))
+    assert provider.calls == calls
+
+
+def test_stalled_stream_falls_back_within_one_timeout():
+    stalled = FakeProvider("a", stall=True, timeout=0.5, retries=2)
+    router = Router([stalled, FakeProvider("b", "from b")])
+    started = time.monotonic()
+    assert "".join(stream_complete("q", provider="a", fallback=True, router=router)) == "from b"
+    assert stalled.calls == 1
+    assert time.monotonic() - started < 1.5
@@ -0,0 +1,18 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mrds import build_store, load_store, store_path
+
+
+def test_sparse_column_empty_in_first_chunk(tmp_path):
+    rows = ["dep_id,site_name,latitude,longitude,disc_yr,ore"]
+    rows += [f"{i},Site {i},35.{i},-106.{i},," for i in range(10)]
+    rows += ["10,Site 10,36.0,-107.0,1901,Chalcopyrite"]
+    manifest = build_store(("\n".join(rows) + "\n").encode(), directory=str(tmp_path), chunk_rows=4)
+    assert manifest['rows'] == 11
+    schema = pq.read_schema(store_path(str(tmp_path)))
+    assert schema.field('ore').type == pa.string()
+    assert schema.field('latitude').type == pa.float64()
+    df = load_store(str(tmp_path))
+    assert df['ore'].iloc[-1] == "Chalcopyrite"
+    assert df['disc_yr'].iloc[-1] == 1901
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from ingest import Workbook
+from prompts import workbook_chunks
+
+
+def assay_frame(rows):
+    return pd.DataFrame({'HOLE_ID': [f"H{i // 50}" for i in range(rows)], 'AU_PPM': np.arange(rows) * 0.01})
+
+
+def changed_blocks(before, after):
+    return sorted(label for label in set(before) | set(after) if before.get(label) != after.get(label))
+
+
+def test_edited_row_changes_only_its_block():
+    df = assay_frame(5000)
+    before = workbook_chunks(Workbook("a", "x", {'Assays': df}), chunk_rows=2000)
+    edited = df.copy()
+    edited.loc[2500, 'AU_PPM'] = 99.0
+    after = workbook_chunks(Workbook("b", "x", {'Assays': edited}), chunk_rows=2000)
+    assert len(before) == 3
+    assert changed_blocks(before, after) == ["Sheet Assays, rows 2,001-4,000"]
+
+
+def test_appended_row_changes_only_last_block():
+    df = assay_frame(5000)
+    before = workbook_chunks(Workbook("a", "x", {'Assays': df}), chunk_rows=2000)
+    after = workbook_chunks(Workbook("b", "x", {'Assays': assay_frame(5001)}), chunk_rows=2000)
+    assert changed_blocks(before, after) == ["Sheet Assays, rows 4,001-5,000", "Sheet Assays, rows 4,001-5,001"]